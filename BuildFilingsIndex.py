@@ -0,0 +1,17 @@
+# Builds (or brings up to date) the filings index used by joroxbrl.secFiles.Filing.queryFilings, 
+#  from submissions.zip or the folder where it was extracted. Only new or changed submission files 
+#  are loaded, so it can be run again after every download of submissions.zip.
+# Usage: python BuildFilingsIndex.py [source] [database]
+import sys
+import logging
+import joroxbrl.filingsIndex
+
+source = sys.argv[1] if len(sys.argv) > 1 else 'secInfo/submissions.zip'
+dbFile = sys.argv[2] if len(sys.argv) > 2 else 'secInfo/filings.db'
+
+logging.basicConfig(filename='BuildFilingsIndex.log', encoding='utf-8', level=logging.INFO)
+
+index = joroxbrl.filingsIndex.FilingsIndex(dbFile)
+loaded = index.refresh(source)
+print(str(loaded)+' submission files loaded into '+dbFile)
+index.close()
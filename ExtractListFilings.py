@@ -16,15 +16,28 @@ with open(ctickers) as jFile:
 
 conn = sqlite3.connect(_db_file)
 c = conn.cursor()
-i=0
-for k in list(jSubms.values()):
-    lis = joroxbrl.secFiles.Filing.getListFilings(str(k['cik_str']), ['10-K'], isXBRL=True)
-    for j in lis:
-        try:
-            c.execute(insertQuery, (j.cik, k['ticker'], j.accessionNumber, j.filingDate, j.reportDate, j.getFilingUrl()))
-        except sqlite3.IntegrityError:
-            logging.warning('Integrity error: '+'{0} - {1} - {2} - {3} - {4} - {5}'.format(j.cik, k['ticker'], j.accessionNumber, j.filingDate, j.reportDate, j.getFilingUrl()))
+
+def insertFiling(j, ticker):
+    try:
+        c.execute(insertQuery, (j.cik, ticker, j.accessionNumber, j.filingDate, j.reportDate, j.getFilingUrl()))
+    except sqlite3.IntegrityError:
+        logging.warning('Integrity error: '+'{0} - {1} - {2} - {3} - {4} - {5}'.format(j.cik, ticker, j.accessionNumber, j.filingDate, j.reportDate, j.getFilingUrl()))
+
+if joroxbrl.secFiles.getFilingsIndex() is not None:
+    # A single query to the filings index (see BuildFilingsIndex.py) instead of reading every company's submissions
+    tickers = {}
+    for k in jSubms.values():
+        tickers.setdefault(joroxbrl.secFiles.Filing.correctCIK(str(k['cik_str'])), k['ticker'])
+    for j in joroxbrl.secFiles.Filing.queryFilings(forms=['10-K'], isXBRL=True):
+        if j.cik in tickers:
+            insertFiling(j, tickers[j.cik])
     conn.commit()
+else:
+    for k in list(jSubms.values()):
+        lis = joroxbrl.secFiles.Filing.getListFilings(str(k['cik_str']), ['10-K'], isXBRL=True)
+        for j in lis:
+            insertFiling(j, k['ticker'])
+        conn.commit()
     
 c.close()
 conn.close()
\ No newline at end of file
@@ -1,7 +1,17 @@
-from bs4 import BeautifulSoup
 import re
 import logging
+import array
+import math
+import functools
+import sys
+import numpy as np
+import datetime
+import io
+import codecs
+import os
+import concurrent.futures
 import xml.etree.ElementTree as ET
+from html.parser import HTMLParser
 from urllib3.util.retry import Retry
 from requests.adapters import HTTPAdapter
 import joroxbrl.secGov
@@ -9,8 +19,50 @@ import joroxbrl.secGov
 
 reNumber = re.compile(r'^(\+|-)?\d\d?\d?(\d*|(,\d{3})*)(\.\d+)?$')
 reFactName = re.compile(r'^\{(.*)\}(.*)')
+reTextBlock = re.compile('.*TextBlock')
+reUrl = re.compile('^https?://')
 log = logging.getLogger('joroxbrl.core')
 
+class _NotNumeric:
+    __slots__ = ()
+
+    def __repr__(self):
+        return 'notNumeric'
+
+# Marker for the numericValue of facts whose value can't be read as a number
+notNumeric = _NotNumeric()
+
+
+# Splits '{namespace}name' into (namespace, name). The same few thousand names are repeated 
+#  in every filing, so the result is cached instead of running the regex for each fact
+@functools.lru_cache(maxsize=65536)
+def _splitFactName(fullName):
+    m = reFactName.match(fullName)
+    if m is None:
+        return None, fullName
+    return sys.intern(m.group(1)), sys.intern(m.group(2))
+
+# Value of a fact as a number, without the scale, or notNumeric. Facts without a value count as 0.
+# The only place where values are read as numbers, so that Fact and FactTable always agree
+def _parseNumber(value):
+    if isinstance(value, int) or isinstance(value, float):
+        return value
+    elif value is None:
+        return 0
+    elif isinstance(value, str) and reNumber.match(value):
+        return float(value.replace(',', ''))
+    return notNumeric
+
+# Value of a fact as a number, with the scale already applied, or notNumeric
+def _numericValue(value, scale):
+    num = _parseNumber(value)
+    if num is notNumeric:
+        return notNumeric
+    try:
+        return num*10**int(scale) if scale else num
+    except ValueError:
+        return notNumeric
+
 
 class Fact:
     
@@ -22,38 +74,38 @@ class Fact:
         self.format = format
         self.unit = unit
         self.scale = scale
-        m = reFactName.match(fullName)
-        if m is None:
-            self.namespace = None
-            self.unqualifiedName = fullName
-        else:
-            self.namespace = m.group(1)
-            self.unqualifiedName = m.group(2)
+        self.namespace, self.unqualifiedName = _splitFactName(fullName)
+        # Worked out once here, instead of every time getValueAsNumber is called.
+        # If value or scale are changed, this has to be updated too
+        self.numericValue = _numericValue(value, scale)
         
     def getDescription(self):
         return 'Fact: '+self.fullName+','+str(self.context)+','+str(self.format)+','+str(self.unit)+','+str(self.scale)+','+str(self.value)
 
+    def isNumeric(self):
+        return self.numericValue is not notNumeric
+
     def getValueAsNumber(self):
-        if isinstance(self.value, int) or isinstance(self.value, float):
-            num = self.value
-        elif self.value is None:
-            num = 0
-        elif reNumber.match(self.value):
-            num = float(self.value.replace(',', ''))
-        else:
-            raise Exception('In Fact.getValueAsNumber: "' + self.value + 
+        if self.numericValue is notNumeric:
+            raise Exception('In Fact.getValueAsNumber: "' + str(self.value) + 
                             '" can\'t be returned as a number. '+self.fullName)
-        return num*10**int(self.scale) if self.scale else num
+        return self.numericValue
     
 class Context:
     
-    __slots__ = ('id', 'start', 'end', 'dimensions', 'period_db_id')
+    __slots__ = ('id', 'start', 'end', 'dimensions', 'period_db_id', 
+                 'startOrdinal', 'endOrdinal', 'periodClass', 'dimensionClass')
     
     # Lo inicializamos solo con esta lista, pero luego le metemos tambien el objeto period (Period)
     # Podemos meter tambien aqui start y end del periodo, no necesitamos un objeto aparte
+    # periodClass, dimensionClass and the ordinals are filled in by classifyContexts once the document is read
     def __init__(self, id):
         self.dimensions = []
         self.id = id
+        self.startOrdinal = None
+        self.endOrdinal = None
+        self.periodClass = None
+        self.dimensionClass = None
         
 class Dimension:
     __slots__ = ('namespace', 'dimension', 'value')
@@ -63,6 +115,381 @@ class Dimension:
         self.dimension = dimension
         self.value = value
 
+# Classification of contexts with respect to the main period of the document, see classifyContexts
+periodCurrentDuration = 'current-duration'
+periodCurrentInstant = 'current-instant'
+periodPriorDuration = 'prior-duration'
+periodPriorInstant = 'prior-instant'
+periodOther = 'other'
+dimensionGlobal = 'global' # No dimensions, applies to the whole company
+dimensionLegalEntityTotal = 'legal-entity-total' # Only dimension is LegalEntityAxis=TotalCompanyDomain
+dimensionDimensional = 'dimensional'
+
+def _dateOrdinal(date):
+    try:
+        return datetime.date.fromisoformat(date.strip()[:10]).toordinal()
+    except (AttributeError, ValueError):
+        return None
+
+# Fills periodClass, dimensionClass, startOrdinal and endOrdinal in all the contexts.
+# docContext is the context of dei:DocumentPeriodEndDate, which marks the current period
+def classifyContexts(contexts, docContext):
+    cs = getattr(docContext, 'start', None)
+    ce = getattr(docContext, 'end', None)
+    docEndOrdinal = _dateOrdinal(ce if ce is not None else cs)
+    for p in contexts.values():
+        ps = getattr(p, 'start', None)
+        pe = getattr(p, 'end', None)
+        p.startOrdinal = _dateOrdinal(ps)
+        p.endOrdinal = _dateOrdinal(pe)
+        # Same conditions we've always used to identify the current period
+        # The last one added to fix https://www.sec.gov/Archives/edgar/data/885275/000143774922006238/wbhc20211231e_10k_htm.xml
+        if (pe is None and ps==ce) or (pe==ce and ps==cs) or (pe==ce and ce==cs):
+            p.periodClass = periodCurrentInstant if pe is None else periodCurrentDuration
+        elif pe is None and p.startOrdinal is not None and docEndOrdinal is not None and p.startOrdinal < docEndOrdinal:
+            p.periodClass = periodPriorInstant
+        elif pe is not None and p.endOrdinal is not None and docEndOrdinal is not None and p.endOrdinal < docEndOrdinal:
+            p.periodClass = periodPriorDuration
+        else:
+            p.periodClass = periodOther
+
+        if len(p.dimensions)==0:
+            p.dimensionClass = dimensionGlobal
+        # Weird cases in which the main context also has a dimension
+        elif (len(p.dimensions)==1 
+              and 'LegalEntityAxis' in (p.dimensions[0].dimension or '')
+              and 'TotalCompanyDomain' in (p.dimensions[0].value or '')):
+            p.dimensionClass = dimensionLegalEntityTotal
+        else:
+            p.dimensionClass = dimensionDimensional
+
+# Builds the dict used by getActualGlobalFacts: fact name -> first fact of the current period without
+#  dimensions. If allowLegalEntityTotal, the facts of the LegalEntityAxis=TotalCompanyDomain context 
+#  are used when there is no fact without dimensions. Names are both full and unqualified.
+def _buildActualGlobalFacts(facts, contexts, allowLegalEntityTotal):
+    res = {}
+    res2 = {} # The ones with dimensions, because I'm not 100% sure we want them
+    for f in facts:
+        p = contexts.get(f.context)
+        if p is None or (p.periodClass != periodCurrentDuration and p.periodClass != periodCurrentInstant):
+            continue
+        names = (f.fullName,) if f.fullName == f.unqualifiedName else (f.fullName, f.unqualifiedName)
+        if p.dimensionClass == dimensionGlobal: # This is the perfect scenario, with 100% certainty
+            for n in names:
+                if n not in res:
+                    res[n] = f
+        elif allowLegalEntityTotal and p.dimensionClass == dimensionLegalEntityTotal:
+            for n in names:
+                res2[n] = f
+
+    # Now we consolidate what's in res2 into res
+    for r in res2.keys():
+        if r not in res:
+            res[r] = res2[r]
+    return res
+
+class FactIndex:
+    """
+    Lookup tables over the facts of a document, filled in as each fact is parsed,
+    so that queries don't need to scan the whole facts list.
+
+    Attributes:
+        byName: fullName and unqualifiedName -> list of facts, in document order
+        byContext: context id -> list of facts, in document order
+    """
+    __slots__ = ('byName', 'byContext')
+
+    def __init__(self):
+        self.byName = {}
+        self.byContext = {}
+
+    def add(self, fact):
+        self.byName.setdefault(fact.fullName, []).append(fact)
+        if fact.unqualifiedName != fact.fullName:
+            self.byName.setdefault(fact.unqualifiedName, []).append(fact)
+        self.byContext.setdefault(fact.context, []).append(fact)
+
+    # Both full and unqualified names are accepted
+    def getFacts(self, factName):
+        return self.byName.get(factName, [])
+
+    # Returns first occurrence found, or None
+    def getFact(self, factName):
+        facts = self.byName.get(factName)
+        return facts[0] if facts else None
+
+    def getFactsByContext(self, contextId):
+        return self.byContext.get(contextId, [])
+
+def _numericValuesArray(facts):
+    return np.fromiter((np.nan if f.numericValue is notNumeric else f.numericValue for f in facts), 
+                       dtype=np.float64, count=len(facts))
+
+class _SymbolTable:
+    # Keeps each distinct value (namespace, name, context id...) only once. Columns store positions in values
+    __slots__ = ('values', 'positions')
+
+    def __init__(self):
+        self.values = []
+        self.positions = {}
+
+    def add(self, value):
+        pos = self.positions.get(value)
+        if pos is None:
+            pos = len(self.values)
+            self.values.append(value)
+            self.positions[value] = pos
+        return pos
+
+class FactView:
+    """
+    Read-only view over one row of a FactTable. Offers the same attributes and methods as Fact,
+    but doesn't hold any data itself.
+    """
+    __slots__ = ('_table', '_row')
+
+    def __init__(self, table, row):
+        self._table = table
+        self._row = row
+
+    @property
+    def id(self):
+        return self._table._ids.get(self._row, self._row)
+
+    @property
+    def namespace(self):
+        return self._table._symbols.values[self._table._namespaces[self._row]]
+
+    @property
+    def unqualifiedName(self):
+        return self._table._symbols.values[self._table._names[self._row]]
+
+    @property
+    def fullName(self):
+        namespace = self.namespace
+        return self.unqualifiedName if namespace is None else '{'+namespace+'}'+self.unqualifiedName
+
+    # For numeric facts the original text is not kept, so the number is returned as a string
+    @property
+    def value(self):
+        if self._row in self._table._texts:
+            return self._table._texts[self._row]
+        num = self._table._values[self._row]
+        return str(int(num)) if num.is_integer() else repr(num)
+
+    @property
+    def context(self):
+        return self._table._symbols.values[self._table._contexts[self._row]]
+
+    @property
+    def format(self):
+        return self._table._symbols.values[self._table._formats[self._row]]
+
+    @property
+    def unit(self):
+        return self._table._symbols.values[self._table._units[self._row]]
+
+    @property
+    def scale(self):
+        return self._table._symbols.values[self._table._scales[self._row]]
+
+    def getDescription(self):
+        return 'Fact: '+self.fullName+','+str(self.context)+','+str(self.format)+','+str(self.unit)+','+str(self.scale)+','+str(self.value)
+
+    def getValueAsNumber(self):
+        if self._row in self._table._texts:
+            value = self._table._texts[self._row]
+            if value is not None:
+                raise Exception('In Fact.getValueAsNumber: "' + value + 
+                                '" can\'t be returned as a number. '+self.fullName)
+            num = 0
+        else:
+            num = self._table._values[self._row]
+        scale = self.scale
+        return num*10**int(scale) if scale else num
+
+class FactTable:
+    """
+    Compact, column oriented copy of the facts of a parsed document, meant for jobs that need to
+    keep many parsed filings in memory at the same time.
+    Every string (namespace, name, context, unit...) is stored only once, and the columns are
+    arrays with the position of the string of each row. Values that can be read as numbers are 
+    kept, already parsed, in a float column; the rest are kept as text.
+    Rows are returned as FactView objects, which are only created when accessed.
+
+    Attributes:
+        contexts: dict of Context, same as in XBRL/IXBRL
+        namespaces: same as XBRL.namespaces
+    """
+
+    def __init__(self, facts=(), contexts=None, namespaces=None, allowLegalEntityTotal=True):
+        self.contexts = contexts if contexts is not None else {}
+        self.namespaces = namespaces if namespaces is not None else {}
+        self.allowLegalEntityTotal = allowLegalEntityTotal # As in the document it comes from, see _buildActualGlobalFacts
+        self._symbols = _SymbolTable()
+        self._namespaces = array.array('i')
+        self._names = array.array('i')
+        self._contexts = array.array('i')
+        self._units = array.array('i')
+        self._formats = array.array('i')
+        self._scales = array.array('i')
+        self._values = array.array('d')
+        self._texts = {} # row -> value, only for the rows whose value is not a number
+        self._ids = {} # row -> id, only for the rows whose id is not the row number
+        self._rowsByName = None
+        self._actualGlobalFacts = None
+        for f in facts:
+            self.append(f)
+
+    def append(self, fact):
+        row = len(self._values)
+        symbols = self._symbols
+        self._namespaces.append(symbols.add(fact.namespace))
+        self._names.append(symbols.add(fact.unqualifiedName))
+        self._contexts.append(symbols.add(fact.context))
+        self._units.append(symbols.add(fact.unit))
+        self._formats.append(symbols.add(fact.format))
+        self._scales.append(symbols.add(fact.scale))
+        num = _parseNumber(fact.value)
+        if num is notNumeric:
+            self._values.append(math.nan)
+            self._texts[row] = fact.value
+        else:
+            self._values.append(num)
+            if fact.value is None: # Counts as 0, but value is still None
+                self._texts[row] = None
+        if fact.id != row:
+            self._ids[row] = fact.id
+        self._rowsByName = None
+        self._actualGlobalFacts = None
+
+    def __len__(self):
+        return len(self._values)
+
+    # numpy array with the numeric value of every row, scale applied, and NaN for the rows 
+    #  that are not numbers
+    def getValuesAsArray(self):
+        exponents = np.zeros(len(self._symbols.values))
+        for pos, scale in enumerate(self._symbols.values):
+            try:
+                exponents[pos] = int(scale) if scale else 0
+            except (ValueError, TypeError):
+                exponents[pos] = np.nan
+        scales = np.frombuffer(self._scales, dtype=np.int32) if len(self) else np.zeros(0, dtype=np.int32)
+        return np.frombuffer(self._values, dtype=np.float64) * 10.0**exponents[scales]
+
+    def __getitem__(self, row):
+        if row < 0:
+            row = row + len(self)
+        if row < 0 or row >= len(self):
+            raise IndexError('FactTable row out of range: '+str(row))
+        return FactView(self, row)
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield FactView(self, row)
+
+    # Built on the first lookup: fullName and unqualifiedName -> array of rows
+    def _getRowsByName(self):
+        if self._rowsByName is None:
+            rowsByName = {}
+            values = self._symbols.values
+            for row, (ns, name) in enumerate(zip(self._namespaces, self._names)):
+                unqualifiedName = values[name]
+                rowsByName.setdefault(unqualifiedName, array.array('i')).append(row)
+                if values[ns] is not None:
+                    rowsByName.setdefault('{'+values[ns]+'}'+unqualifiedName, array.array('i')).append(row)
+            self._rowsByName = rowsByName
+        return self._rowsByName
+
+    # Both full and unqualified names are accepted
+    def getFacts(self, factName):
+        return [FactView(self, row) for row in self._getRowsByName().get(factName, ())]
+
+    # Returns first occurrence found, or None
+    def getFact(self, factName):
+        rows = self._getRowsByName().get(factName)
+        return FactView(self, rows[0]) if rows else None
+
+    # Same as XBRL.getActualGlobalFacts. Relies on the contexts having been classified by the document
+    def getActualGlobalFacts(self, factNameList):
+        if self._actualGlobalFacts is None:
+            self._actualGlobalFacts = _buildActualGlobalFacts(self, self.contexts, self.allowLegalEntityTotal)
+        actual = self._actualGlobalFacts
+        return { factName: actual[factName] for factName in factNameList if factName in actual }
+
+    def getActualGlobalFact(self, factName):
+        d = self.getActualGlobalFacts([factName])
+        return d[factName] if factName in d else None
+
+class _InlineXbrlParser(HTMLParser):
+    """
+    Event driven parser for inline XBRL documents. It goes through the html in a single
+    pass, only keeping track of the context and ix elements that are open at each moment,
+    and hands every context and fact to the IXBRL object as soon as its end tag is found.
+
+    The text of an ix element is collected in a list of parts, which is joined only once
+    when the element ends. TextBlocks are discarded, so their text is not collected at all,
+    but the facts nested inside them are still handled.
+    """
+
+    # Elements inside a context whose text we need
+    _contextTextTags = ('explicitmember', 'instant', 'startdate', 'enddate')
+
+    def __init__(self, ixbrl):
+        super().__init__(convert_charrefs=True)
+        self.ixbrl = ixbrl
+        self.stack = [] # Open ix elements: [localName, attrs, parts]. parts is None if text is not needed
+        self.context = None # Context element being read: [attrs, dimensions, period]
+        self.contextText = None # [localName, attrs, parts] of the context child being read
+        
+    def handle_starttag(self, tag, attrs):
+        # Remove prefix
+        s = tag.split(':')
+        name = s[1] if len(s)==2 else tag
+        if name == 'nonfraction' or name == 'nonnumeric':
+            attrs = dict(attrs)
+            # Todos los que sean TextBlock los ignoramos, asi que no guardamos su contenido
+            parts = None if name == 'nonnumeric' and reTextBlock.match(attrs.get('name', '')) else []
+            self.stack.append([name, attrs, parts])
+        elif name == 'context':
+            self.context = [dict(attrs), [], None]
+        elif self.context is not None:
+            if name == 'period':
+                self.context[2] = {}
+            elif name in self._contextTextTags:
+                self.contextText = [name, dict(attrs), []]
+            
+    def handle_endtag(self, tag):
+        s = tag.split(':')
+        name = s[1] if len(s)==2 else tag
+        if self.stack and self.stack[-1][0] == name:
+            element = self.stack.pop()
+            text = ''.join(element[2]) if element[2] is not None else None
+            if name == 'nonfraction':
+                content = self.ixbrl._nonFractionHandler(element[1], text)
+            else:
+                content = self.ixbrl._nonNumericHandler(element[1], text)
+            if self.stack and self.stack[-1][2] is not None:
+                self.stack[-1][2].append(content)
+        elif self.context is not None:
+            if name == 'context':
+                self.ixbrl._contextHandler(*self.context)
+                self.context = None
+            elif self.contextText is not None and self.contextText[0] == name:
+                text = ''.join(self.contextText[2]).strip()
+                if name == 'explicitmember':
+                    self.context[1].append((self.contextText[1].get('dimension'), text))
+                elif self.context[2] is not None:
+                    self.context[2][name] = text
+                self.contextText = None
+
+    def handle_data(self, data):
+        if self.contextText is not None:
+            self.contextText[2].append(data)
+        elif self.stack and self.stack[-1][2] is not None:
+            self.stack[-1][2].append(data)
+
 # Contains:
 #        facts = []
 #        contexts = {} -> key is context id
@@ -72,48 +499,49 @@ class IXBRL:
 
     _numerator = 0
 
-    def _contextHandler(self, element):
-        context = Context(element['id'])
+    # attrs: attributes of the xbrli:context element
+    # dimensions: list of (dimension, value) from its xbrldi:explicitMember elements
+    # period: dict with the text of the instant, startdate and enddate elements found, or None if there was no period
+    def _contextHandler(self, attrs, dimensions, period):
+        context = Context(attrs['id'])
         
-        for i in element.find_all('xbrldi:explicitmember'):
-            spl = i.attrs['dimension'].split(':')
+        for dimension, value in dimensions:
+            spl = dimension.split(':')
             if len(spl) == 2:
-                context.dimensions.append(Dimension(spl[0], spl[1], i.string))
+                context.dimensions.append(Dimension(spl[0], spl[1], value))
             else:
-                context.dimensions.append(Dimension(None, spl[0], i.string))
+                context.dimensions.append(Dimension(None, spl[0], value))
                 
-        
-        period = element.find('xbrli:period')
-        if not period: 
-            log.debug('Nos salimos de _contextHandler sin hacer nada para id='+element['id'])
+        if period is None: 
+            log.debug('Nos salimos de _contextHandler sin hacer nada para id='+attrs['id'])
             return
-        instant = period.find('xbrli:instant')
-        if instant:
-            context.start = instant.string
+        if 'instant' in period:
+            context.start = period['instant']
             context.end = None
         else:
-            start = period.find('xbrli:startdate')
-            end = period.find('xbrli:enddate')
-            if not start or not end:
-                log.debug('Nos salimos de _contextHandler porque no hemos encontrado ni period ni startdate+enddate para id='+element['id'])
+            if 'startdate' not in period or 'enddate' not in period:
+                log.debug('Nos salimos de _contextHandler porque no hemos encontrado ni period ni startdate+enddate para id='+attrs['id'])
             else:
-                context.start = start.string
-                context.end = end.string
+                context.start = period['startdate']
+                context.end = period['enddate']
 
         self.contexts[context.id] = context
 
-    def _nonFractionHandler(self, element):
-        format = element['format'] if 'format' in element.attrs else None
-        unit = element['unitref'] if 'unitref' in element.attrs else None
-        sign = element['sign'] if 'sign' in element.attrs else ''
-        scale = int(element['scale'].strip()) if 'scale' in element.attrs else None
+    # text: text found inside the element, including that of any nested elements
+    def _nonFractionHandler(self, attrs, text):
+        format = attrs.get('format')
+        unit = attrs.get('unitref')
+        sign = attrs.get('sign') or ''
         try:
+            scale = int(attrs['scale'].strip()) if 'scale' in attrs else None
             # This is not very good. Some documents use other prefixes, not 'xsi'.
-            content = '0' if ('xsi:nil' in element.attrs and element['xsi:nil']=='true') or ('format' in element.attrs and element['format']=='ixt:fixed-zero') or element.string is None else element.string.strip()
-            s_id = element['id'] if 'id' in element else 'joronid'+str(self._getNextNumerator())
-            self.addFact(s_id, element['name'], sign+content, element['contextref'], format, unit, scale)
+            content = text.strip()
+            if attrs.get('xsi:nil')=='true' or format=='ixt:fixed-zero' or content=='':
+                content = '0'
+            s_id = attrs['id'] if 'id' in attrs else 'joronid'+str(self._getNextNumerator())
+            self.addFact(s_id, attrs['name'], sign+content, attrs['contextref'], format, unit, scale)
         except Exception as ex:
-            log.exception(str(type(ex))+' en _nonFractionHandler con name='+element['name']+' - '+str(ex))
+            log.exception(str(type(ex))+' en _nonFractionHandler con name='+str(attrs.get('name'))+' - '+str(ex))
             raise ex
         return content
 
@@ -126,101 +554,123 @@ class IXBRL:
     # - HTML
     # - Otro nonnumeric
     # - Otro nunnumeric y texto adicional   
-    def _nonNumericHandler(self, element):
-        format = element['format'] if 'format' in element.attrs else None
-        unit = element['unitref'] if 'unitref' in element.attrs else None
+    # text: text found inside the element, including that of any nested elements. None for TextBlocks
+    def _nonNumericHandler(self, attrs, text):
+        format = attrs.get('format')
+        unit = attrs.get('unitref')
         
         try:
             # This is not very good. Some documents use other prefixes, not 'xsi'. I've seen include both xs: and xsi: for the same namespace
             # Let's see if this is enough. If not, it will get more complicated
-            content = '' if (('xsi:nil' in element.attrs and element['xsi:nil']=='true') or 
-                             ('xs:nil' in element.attrs and element['xs:nil']=='true')) else self._iterateElement(element)
+            content = '' if (attrs.get('xsi:nil')=='true' or attrs.get('xs:nil')=='true' or text is None) else text
             
-            if not re.match('.*TextBlock', element['name']): # Todos los que sean TextBlock los ignoramos
-                s_id = element['id'] if 'id' in element else 'joronid'+str(self._getNextNumerator())
-                self.addFact(s_id, element['name'], content, element['contextref'], format, unit, None)
+            if text is not None: # Todos los que sean TextBlock los ignoramos
+                s_id = attrs['id'] if 'id' in attrs else 'joronid'+str(self._getNextNumerator())
+                self.addFact(s_id, attrs['name'], content, attrs['contextref'], format, unit, None)
         except Exception as ex:
-            log.exception(str(type(ex))+' en _nonNumericHandler con name='+element['name']+' - '+str(ex))
+            log.exception(str(type(ex))+' en _nonNumericHandler con name='+str(attrs.get('name'))+' - '+str(ex))
             raise ex
 
         return content
-    
-    # Will remove the prefix, as it gives many problems
-    _handlers = { 'context': _contextHandler,
-                  'nonfraction': _nonFractionHandler, 
-                  'nonnumeric': _nonNumericHandler }
-
-
-    def _iterateElement(self, element):
-        content = ''
-        for item in element:
-            if str(type(item))=="<class 'bs4.element.Tag'>":
-                self.tags[item.name] = True # Solo para testing
-                # Remove prefix
-                s = item.name.split(':')
-                itemNameWoPrefix = s[1] if len(s)==2 else item.name 
-                if itemNameWoPrefix in IXBRL._handlers:  
-                    content = content + str(IXBRL._handlers[itemNameWoPrefix](self, item))
-                else:
-                    content = content + self._iterateElement(item)
-            else:
-                content = content+str(item)
-                
-        return content
         
-    def __init__(self, ixbrlStr):
-        self.tags = {}  # Solo para testing
+    # ixbrlStr: whole html document as a string. If None, the document can be passed in chunks 
+    #  through feed(), and then close()
+    def __init__(self, ixbrlStr=None):
         self.facts = []
+        self.factIndex = FactIndex()
+        self._factsByContextAndName = {} # (context, name) -> fact, to find repeated facts
+        self._actualGlobalFacts = None # See _classifyContexts
         self.contexts = {}
 
-        soup = BeautifulSoup(ixbrlStr,'html.parser')
-        self._iterateElement(soup)
+        self._parser = _InlineXbrlParser(self)
+        if ixbrlStr is not None:
+            self.feed(ixbrlStr)
+            self.close()
+
+    def feed(self, data):
+        self._parser.feed(data)
+
+    def close(self):
+        self._parser.close()
+        self._parser = None
+        self._classifyContexts()
+
+    # Feeds the whole document from an iterable of bytes chunks, and closes
+    def feedChunks(self, chunks, encoding='utf-8'):
+        decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+        for chunk in chunks:
+            self.feed(decoder.decode(chunk))
+        self.feed(decoder.decode(b'', final=True))
+        self.close()
+
+    # Downloads and parses the document as it arrives, without keeping it whole in memory
+    def readUrl(self, url, encoding='utf-8'):
+        self.feedChunks(joroxbrl.secGov.SecGovCaller.iterSecGovUrl(url), encoding)
+
+    # Compact copy of the facts, see FactTable
+    def toFactTable(self):
+        return FactTable(self.facts, self.contexts, allowLegalEntityTotal=False)
+
+    # numpy array with the numeric value of each fact in self.facts, NaN for those that are not numbers
+    def getNumericValues(self):
+        return _numericValuesArray(self.facts)
 
     # Devuelve la primera ocurrencia que encuentre, o None
     def getFact(self, factName):
-        for i in self.facts:
-            if i.name==factName: 
-                return i
-        return None
+        return self.factIndex.getFact(factName)
+
+    def getFacts(self, factName):
+        return self.factIndex.getFacts(factName)
+
+    def getFactsByContext(self, contextId):
+        return self.factIndex.getFactsByContext(contextId)
     
     # Lo importante de este metodo es que controla que no se repita un fact que ya tenemos
     def addFact(self, id, name, value, context, format, unit, scale):
-        guardamos = True
-        for f in self.facts:
-            if f.context == context and f.fullName == name:
-                if f.value==value and f.format==format and f.unit==unit and f.scale==scale:
-                    log.info('No vamos a guardar el fact '+id+' porque es identico a '+f.id)
-                else: 
-                    # Podemos aprovechar esto para mejorar la calidad de los datos y tomar la mejor copia
-                    # - Coger la version que no tenga Nones
-                    # - He visto un caso en que el contenido estaba escrito en un caso como 50, y en otro como Fifty. Si alguno es parseable como número, entonces es preferible.
-                    newIsNum = True if reNumber.match(value) else False
-                    oldIsNum = True if reNumber.match(f.value) else False
-                    if (newIsNum and not oldIsNum) or (newIsNum==oldIsNum and ((format is not None and f.format is None) or (unit is not None and f.unit is None) or (scale is not None and f.scale is None))):
-                        log.warning('Sustituimos el fact '+f.id+' por  '+id+' porque es mejor: '+str(f.value)+'->'+str(value)+' | '+str(f.format)+'->'+str(format) +' | '+ str(f.unit)+'->'+str(unit)+' | '+str(f.scale)+'->'+str(scale) +' : '+str(f.value==value)+' | '+str(f.format==format)+' | '+str(f.unit==unit)+' | '+str(f.scale==scale))
-                        f.id = id
-                        f.value = value
-                        f.format = format
-                        f.unit = unit
-                        f.scale = scale
-                    else:
-                        log.warning('Will not save fact '+id+', it\'s an imperfect copy of '+f.id+'. '+str(f.value)+'=?'+str(value)+' | '+str(f.format)+'=?'+str(format) +' | '+ str(f.unit)+'=?'+str(unit)+' | '+str(f.scale)+'=?'+str(scale) +' : '+str(f.value==value)+' | '+str(f.format==format)+' | '+str(f.unit==unit)+' | '+str(f.scale==scale))
-                guardamos = False
-                break
-        if guardamos: 
-            self.facts.append(Fact(id, name, value, context, format, unit, scale))
+        f = self._factsByContextAndName.get((context, name))
+        if f is not None:
+            if f.value==value and f.format==format and f.unit==unit and f.scale==scale:
+                log.info('No vamos a guardar el fact '+id+' porque es identico a '+f.id)
+            else: 
+                # Podemos aprovechar esto para mejorar la calidad de los datos y tomar la mejor copia
+                # - Coger la version que no tenga Nones
+                # - He visto un caso en que el contenido estaba escrito en un caso como 50, y en otro como Fifty. Si alguno es parseable como número, entonces es preferible.
+                newIsNum = True if reNumber.match(value) else False
+                oldIsNum = True if reNumber.match(f.value) else False
+                if (newIsNum and not oldIsNum) or (newIsNum==oldIsNum and ((format is not None and f.format is None) or (unit is not None and f.unit is None) or (scale is not None and f.scale is None))):
+                    log.warning('Sustituimos el fact '+f.id+' por  '+id+' porque es mejor: '+str(f.value)+'->'+str(value)+' | '+str(f.format)+'->'+str(format) +' | '+ str(f.unit)+'->'+str(unit)+' | '+str(f.scale)+'->'+str(scale) +' : '+str(f.value==value)+' | '+str(f.format==format)+' | '+str(f.unit==unit)+' | '+str(f.scale==scale))
+                    f.id = id
+                    f.value = value
+                    f.format = format
+                    f.unit = unit
+                    f.scale = scale
+                    f.numericValue = _numericValue(value, scale)
+                else:
+                    log.warning('Will not save fact '+id+', it\'s an imperfect copy of '+f.id+'. '+str(f.value)+'=?'+str(value)+' | '+str(f.format)+'=?'+str(format) +' | '+ str(f.unit)+'=?'+str(unit)+' | '+str(f.scale)+'=?'+str(scale) +' : '+str(f.value==value)+' | '+str(f.format==format)+' | '+str(f.unit==unit)+' | '+str(f.scale==scale))
+        else: 
+            f = Fact(id, name, value, context, format, unit, scale)
+            self.facts.append(f)
+            self.factIndex.add(f)
+            self._factsByContextAndName[(context, name)] = f
+            self._actualGlobalFacts = None
+
+    # Classifies the contexts with respect to the document period, and prepares the facts for 
+    #  getActualGlobalFacts. Done when the whole document has been read
+    def _classifyContexts(self):
+        docPeriodEndDate = self.getFact('dei:DocumentPeriodEndDate')
+        if docPeriodEndDate is None or docPeriodEndDate.context not in self.contexts:
+            log.warning('No dei:DocumentPeriodEndDate found, contexts will not be classified')
+            return
+        classifyContexts(self.contexts, self.contexts[docPeriodEndDate.context])
+        self._actualGlobalFacts = _buildActualGlobalFacts(self.facts, self.contexts, False)
 
     def getActualGlobalFacts(self, factNameList):
-        c = self.contexts[self.getFact('dei:DocumentPeriodEndDate').context]
-            
-        res = {}
-        for factName in factNameList:
-            for f in self.facts:
-                p = self.contexts[f.context]
-                if f.fullName==factName and len(p.dimensions)==0 and ((p.end is None and p.start==c.end) or (p.end==c.end and p.start==c.start) or (p.end==c.end and c.end==c.start)): # This last condition added to fix https://www.sec.gov/Archives/edgar/data/885275/000143774922006238/wbhc20211231e_10k_htm.xml
-                    res[factName] = f
-                    break
-        return res
+        if self._actualGlobalFacts is None:
+            self._classifyContexts()
+            if self._actualGlobalFacts is None:
+                raise Exception('IXBRL.getActualGlobalFacts: No dei:DocumentPeriodEndDate found in the document')
+        actual = self._actualGlobalFacts
+        return { factName: actual[factName] for factName in factNameList if factName in actual }
             
     def getActualGlobalFact(self, factName):
         d = self.getActualGlobalFacts([factName])
@@ -229,10 +679,21 @@ class IXBRL:
 
 class XBRL:
     
-    def __init__(self):
+    # concepts: if given, only the facts with these names (full or unqualified, e.g. 'Revenues' or 
+    #  '{http://fasb.org/us-gaap/2022}Revenues') are kept, plus all the dei ones. The rest of the elements
+    #  are skipped without creating any Fact, and only the contexts used by the facts kept are built.
+    # currentPeriodOnly: only keep the facts of the current period of the document (and the dei ones), 
+    #  as classified by classifyContexts. The contexts not used by them are dropped too.
+    def __init__(self, concepts=None, currentPeriodOnly=False):
         self.facts = []
+        self.factIndex = FactIndex()
+        self._actualGlobalFacts = None # See _classifyContexts
         self.contexts = {}
         self.factCounter = 0 # Unlike iXBRL, facts don't have ids, so we'll just add a counter
+        self.concepts = frozenset(concepts) if concepts is not None else None
+        self.currentPeriodOnly = currentPeriodOnly
+        # When filtering, context elements are kept here by id until we know which ones are needed
+        self._contextElements = {} if concepts is not None or currentPeriodOnly else None
         
         # In the namespaces dict we will expect to create up to 6 entries when 
         #  reading and xml: 'us-gaap', 'us-gaap-sup', 'dei', 'srt', 'invest', 'ecd', 'cyd' and 'local'
@@ -248,29 +709,99 @@ class XBRL:
         self.root = ET.parse(xmlFile).getroot()
         self._parseXml()
         
-    def readXmlUrl(self, xmlUrl):
-        xml = joroxbrl.secGov.SecGovCaller.callSecGovUrl(xmlUrl).text
-        self.readXml(xml)
+    # stream: if True, the response body is parsed as it arrives with readXmlChunks,
+    #  instead of downloading it whole into a string (see SecGovCaller.iterSecGovUrl for the size limit)
+    def readXmlUrl(self, xmlUrl, stream=False):
+        if stream:
+            self.readXmlChunks(joroxbrl.secGov.SecGovCaller.iterSecGovUrl(xmlUrl))
+        else:
+            xml = joroxbrl.secGov.SecGovCaller.callSecGovUrl(xmlUrl).text
+            self.readXml(xml)
+
+    # Streaming alternative to readXmlFile, meant for big instance documents.
+    # source: file name or binary file-like object (e.g. the raw body of a streamed response)
+    # Contexts and facts are handled as soon as their element is complete, and then cleared from 
+    #  the tree, so the elements are never all in memory at the same time. self.root is not kept.
+    def readXmlStream(self, source):
+        self._parseEvents(ET.iterparse(source, events=('start', 'end')))
+
+    # Same as readXmlStream, but for an iterable of chunks (bytes or str), such as 
+    #  requests.Response.iter_content()
+    def readXmlChunks(self, chunks):
+        def _events():
+            parser = ET.XMLPullParser(events=('start', 'end'))
+            for chunk in chunks:
+                parser.feed(chunk)
+                yield from parser.read_events()
+            parser.close()
+            yield from parser.read_events()
+        self._parseEvents(_events())
+
+    def _parseEvents(self, events):
+        namespaces = set()
+        root = None
+        depth = 0
+        for event, element in events:
+            if event == 'start':
+                if root is None:
+                    root = element
+                depth = depth + 1
+            else:
+                depth = depth - 1
+                if depth == 1: # A direct child of the root is complete
+                    self._elementHandler(element, namespaces)
+                    root.clear() # Drop it, and anything before it, from the tree
+        self._finishParse(namespaces)
     
     # Will parse the xml in self.root
     def _parseXml(self):
         namespaces = set()
         # Start with the contexts
         for element in self.root:
-            m = reFactName.match(element.tag)
-            unqualifiedTag = None
-            if m is None or len(m.groups())!=2: 
-                print('Groups es '+m.groups)
-                unqualifiedTag = element.tag
-            else: unqualifiedTag = m.group(2)
-            if unqualifiedTag == 'context':
+            self._elementHandler(element, namespaces)
+        self._finishParse(namespaces)
+
+    # Done when all the elements have been handled
+    def _finishParse(self, namespaces):
+        self._identifyNamespaces(namespaces)
+        if self._contextElements is not None:
+            # Build only the contexts that the facts we've kept refer to
+            for id in self.factIndex.byContext:
+                cont = self._contextElements.get(id)
+                if cont is not None:
+                    self._contextHandler(cont)
+            self._contextElements = {}
+        self._classifyContexts()
+        if self.currentPeriodOnly:
+            self._dropNonCurrentFacts()
+
+    # Handles each of the elements directly under the root. namespaces is updated with the 
+    #  namespaces of the facts found
+    def _elementHandler(self, element, namespaces):
+        m = reFactName.match(element.tag)
+        unqualifiedTag = None
+        if m is None or len(m.groups())!=2: 
+            print('Groups es '+m.groups)
+            unqualifiedTag = element.tag
+        else: unqualifiedTag = m.group(2)
+        if unqualifiedTag == 'context':
+            if self._contextElements is None:
                 self._contextHandler(element)
-            elif unqualifiedTag in ['schemaRef', 'unit', 'footnoteLink']:
-                continue
             else:
-                # All the rest should be facts
-                f = self._factHandler(element)
-                namespaces.add(f.namespace)
+                self._contextElements[self._contextId(element)] = element
+        elif unqualifiedTag in ['schemaRef', 'unit', 'footnoteLink']:
+            return
+        else:
+            # All the rest should be facts
+            namespace = m.group(1) if m is not None else None
+            namespaces.add(namespace)
+            if (self.concepts is not None and element.tag not in self.concepts and unqualifiedTag not in self.concepts
+                    and (namespace is None or '/dei/' not in namespace)):
+                self.factCounter = self.factCounter + 1 # So that ids are the same as in a full parse
+                return
+            self._factHandler(element)
+
+    def _identifyNamespaces(self, namespaces):
         log.debug("These are the namespaces we've found: "+str(namespaces))
         
         # Now we try to identify the namespaces
@@ -325,11 +856,14 @@ class XBRL:
                     self.namespaces['local'] = n
             
         
-    def _contextHandler(self, cont):
+    @staticmethod
+    def _contextId(cont):
         if '{http://www.xbrl.org/2003/instance}id' in cont.attrib:
-            id = cont.attrib['{http://www.xbrl.org/2003/instance}id']
-        else:
-            id = cont.attrib['id']
+            return cont.attrib['{http://www.xbrl.org/2003/instance}id']
+        return cont.attrib['id']
+
+    def _contextHandler(self, cont):
+        id = self._contextId(cont)
         context = Context(id)
 
         for explicitMember in cont.iter('{http://xbrl.org/2006/xbrldi}explicitMember'):
@@ -373,43 +907,149 @@ class XBRL:
                  fact.get('scale', '0'))
      
         self.facts.append(f)
+        self.factIndex.add(f)
+        self._actualGlobalFacts = None
         self.factCounter = self.factCounter + 1
         return f
     
+    # Classifies the contexts with respect to the document period, and prepares the facts for 
+    #  getActualGlobalFacts. Done when the whole document has been read
+    def _classifyContexts(self):
+        docPeriodEndDate = self.getFact('{'+self.namespaces['dei']+'}DocumentPeriodEndDate') if 'dei' in self.namespaces else None
+        if docPeriodEndDate is None or docPeriodEndDate.context not in self.contexts:
+            log.warning('No dei:DocumentPeriodEndDate found, contexts will not be classified')
+            return
+        classifyContexts(self.contexts, self.contexts[docPeriodEndDate.context])
+        self._actualGlobalFacts = _buildActualGlobalFacts(self.facts, self.contexts, True)
+
+    # For currentPeriodOnly. If the contexts could not be classified, nothing is dropped
+    def _dropNonCurrentFacts(self):
+        if self._actualGlobalFacts is None:
+            return
+        deiNamespace = self.namespaces.get('dei')
+        facts = []
+        for f in self.facts:
+            c = self.contexts.get(f.context)
+            if ((c is not None and (c.periodClass == periodCurrentDuration or c.periodClass == periodCurrentInstant))
+                    or (deiNamespace is not None and f.namespace == deiNamespace)):
+                facts.append(f)
+        self.facts = facts
+        self.factIndex = FactIndex()
+        for f in facts:
+            self.factIndex.add(f)
+        self.contexts = { id: c for id, c in self.contexts.items() if id in self.factIndex.byContext }
+
     def getActualGlobalFacts(self, factNameList):
     # We accept fact name as both full and unquialified names
-        c = self.contexts[self.getFact('{'+self.namespaces['dei']+'}DocumentPeriodEndDate').context]
-            
-        res = {}
-        res2 = {} # The ones with dimensions, because I'm not 100% sure we want them
-        for factName in factNameList:
-            for f in self.facts:
-                p = self.contexts[f.context]
-                if (f.fullName==factName or f.unqualifiedName==factName) and ((p.end is None and p.start==c.end) or (p.end==c.end and p.start==c.start) or (p.end==c.end and c.end==c.start) or (p.end is None and p.start==c.end and c.end==c.start)):  # Last 2 conditions added to fix https://www.sec.gov/Archives/edgar/data/885275/000143774922006238/wbhc20211231e_10k_htm.xml
-                    if (len(p.dimensions)==0): # This is the perfect scenario, with 100% certainty
-                        res[factName] = f
-                        break
-                    # Weird cases in which the main context also has a dimension
-                    elif (len(p.dimensions)==1 
-                          and 'LegalEntityAxis' in p.dimensions[0].dimension
-                          and 'TotalCompanyDomain' in p.dimensions[0].value):
-                        res2[factName] = f
-
-        # Now we consolidate what's in res2 into res
-        for r in res2.keys():
-            if r not in res:
-                res[r] = res2[r]
-
-        return res
+        if self._actualGlobalFacts is None:
+            self._classifyContexts()
+            if self._actualGlobalFacts is None:
+                raise Exception('XBRL.getActualGlobalFacts: No dei:DocumentPeriodEndDate found in the document')
+        actual = self._actualGlobalFacts
+        return { factName: actual[factName] for factName in factNameList if factName in actual }
             
     def getActualGlobalFact(self, factName):
         d = self.getActualGlobalFacts([factName])
         return d[factName] if factName in d else None
 
+    # Compact copy of the facts, see FactTable
+    def toFactTable(self):
+        return FactTable(self.facts, self.contexts, self.namespaces)
+
+    # Everything read from the document as plain data (dicts, lists, tuples and strings), so it 
+    #  can be stored and turned back into an XBRL object with fromSnapshot
+    def toSnapshot(self):
+        return {
+            'facts': [(f.id, f.fullName, f.value, f.context, f.format, f.unit, f.scale) for f in self.facts],
+            'contexts': [(c.id, getattr(c, 'start', None), getattr(c, 'end', None), 
+                          [(d.namespace, d.dimension, d.value) for d in c.dimensions]) 
+                         for c in self.contexts.values()],
+            'namespaces': dict(self.namespaces)
+        }
+
+    @classmethod
+    def fromSnapshot(cls, snapshot):
+        xbrl = cls()
+        for id, start, end, dimensions in snapshot['contexts']:
+            context = Context(id)
+            context.dimensions = [Dimension(*d) for d in dimensions]
+            if start is not None or end is not None:
+                context.start = start
+                context.end = end
+            xbrl.contexts[id] = context
+        for f in snapshot['facts']:
+            fact = Fact(*f)
+            xbrl.facts.append(fact)
+            xbrl.factIndex.add(fact)
+        xbrl.factCounter = len(xbrl.facts)
+        xbrl.namespaces = dict(snapshot['namespaces'])
+        xbrl._classifyContexts()
+        return xbrl
+
+    # numpy array with the numeric value of each fact in self.facts, NaN for those that are not numbers
+    def getNumericValues(self):
+        return _numericValuesArray(self.facts)
+
     # Returns first occurrence found, or None
     def getFact(self, factName):
-        for i in self.facts:
-            if i.fullName==factName or i.unqualifiedName==factName: 
-                return i
-        return None
+        return self.factIndex.getFact(factName)
+
+    def getFacts(self, factName):
+        return self.factIndex.getFacts(factName)
+
+    def getFactsByContext(self, contextId):
+        return self.factIndex.getFactsByContext(contextId)
 
+
+# Runs in the worker processes of parseXbrlMany
+def _parseXbrlSource(source, concepts=None, currentPeriodOnly=False):
+    xbrl = XBRL(concepts, currentPeriodOnly)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        xbrl.readXmlStream(io.BytesIO(source))
+    elif isinstance(source, str) and reUrl.match(source):
+        xbrl.readXmlUrl(source, stream=True)
+    else: # File name
+        xbrl.readXmlStream(source)
+    return xbrl.toFactTable()
+
+def parseXbrlMany(sources, maxWorkers: int=None, maxPending: int=None, concepts=None, currentPeriodOnly: bool=False):
+    """
+    Parses many XBRL instance documents using a pool of processes.
+
+    sources: iterable of file names, URLs or bytes with the whole document. It is consumed 
+        gradually: there are never more than maxPending documents submitted and not yet returned 
+        (by default, twice the number of workers), so it can be a generator over a huge list.
+    maxWorkers: number of processes. By default, the number of CPUs.
+    concepts, currentPeriodOnly: passed to XBRL, to parse only the facts that are needed.
+
+    Yields (source, FactTable, None) for each document as soon as it's parsed, so not necessarily
+    in the order given, or (source, None, exception) if it could not be parsed.
+
+    As with any process pool, scripts using this need the if __name__=='__main__' guard on Windows.
+    """
+    maxWorkers = maxWorkers or os.cpu_count() or 1
+    maxPending = maxPending or 2*maxWorkers
+    sources = iter(sources)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=maxWorkers) as executor:
+        pending = {}
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < maxPending:
+                try:
+                    source = next(sources)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending[executor.submit(_parseXbrlSource, source, concepts, currentPeriodOnly)] = source
+            if not pending:
+                break
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                source = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as ex:
+                    log.warning('parseXbrlMany: could not parse '+(source if isinstance(source, str) else 'bytes source')+': '+str(ex))
+                    yield source, None, ex
+                else:
+                    yield source, result, None
@@ -0,0 +1,162 @@
+# Local copies of the EDGAR archives (/Archives/edgar/data/<cik>/<accession>/...), used by
+#  joroxbrl.secGov.SecGovCaller before going to sec.gov. With the filings synced in advance, a
+#  whole run can be done from disk, without waiting for the rate limit.
+# Two kinds of mirror:
+#  - DirectoryMirror: a folder with the same layout as Archives/edgar/data (<root>/<cik>/<accession>/<file>)
+#  - TarMirror: a tarball with that same layout inside (any prefix before <cik>/<accession> is ignored).
+#    Better uncompressed, since members of a compressed tarball can't be read without decompressing
+#    everything before them.
+# If a filing folder has no index.json, one is built from the list of files, so that FilingUrls
+#  can be used as with sec.gov.
+import os
+import re
+import json
+import io
+import tarfile
+import mimetypes
+import threading
+import logging
+import joroxbrl.httpCache
+
+log = logging.getLogger('joroxbrl.edgarMirror')
+
+reArchivePath = re.compile(r'^(https?://(www\.)?sec\.gov)?/Archives/edgar/data/(\d+)/(\d{18})/([^?#]+)$')
+reMemberPath = re.compile(r'(^|/)(\d+)/(\d{18})/([^/]+)$')
+
+_textTypes = ('.xml', '.xsd', '.json') # Always utf-8 in EDGAR, so there's no need to guess the encoding
+
+class EdgarMirror:
+    """
+    Base class of the mirrors. Subclasses implement readFile and listFiles.
+    """
+
+    def readFile(self, cik: str, accession: str, name: str) -> bytes:
+        raise NotImplementedError
+
+    # Binary file object with the contents, or None. By default from readFile
+    def openFile(self, cik: str, accession: str, name: str):
+        body = self.readFile(cik, accession, name)
+        return io.BytesIO(body) if body is not None else None
+
+    # Names of the files of the filing folder, or None if the filing is not in the mirror
+    def listFiles(self, cik: str, accession: str) -> list:
+        raise NotImplementedError
+
+    # requests.Response for url, if it's a file of the archives that is in the mirror. None otherwise
+    # stream: the file is read as the response is consumed
+    def get(self, url: str, stream: bool=False):
+        m = reArchivePath.match(url)
+        if m is None:
+            return None
+        cik, accession, name = str(int(m.group(3))), m.group(4), m.group(5)
+        contentType = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        encoding = 'utf-8' if name.lower().endswith(_textTypes) else None
+        if stream:
+            raw = self.openFile(cik, accession, name)
+            if raw is not None:
+                return joroxbrl.httpCache.makeResponse(url, None, {'Content-Type': contentType}, encoding=encoding, raw=raw)
+        body = self.readFile(cik, accession, name)
+        if body is None and name == 'index.json':
+            body = self._directoryIndex(cik, accession)
+        if body is None:
+            return None
+        return joroxbrl.httpCache.makeResponse(url, body, {'Content-Type': contentType}, encoding=encoding)
+
+    # Same format as the index.json of sec.gov, only with the fields we use
+    def _directoryIndex(self, cik, accession):
+        names = self.listFiles(cik, accession)
+        if names is None:
+            return None
+        return json.dumps({'directory': {'name': '/Archives/edgar/data/'+cik+'/'+accession,
+                                         'item': [{'name': n, 'type': 'text.gif'} for n in sorted(names)]}}).encode('utf-8')
+
+
+class DirectoryMirror(EdgarMirror):
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _folder(self, cik, accession):
+        folder = os.path.join(self.root, cik, accession)
+        if not os.path.isdir(folder): # Also accept CIK folders with leading zeros
+            folder = os.path.join(self.root, cik.zfill(10), accession)
+        return folder
+
+    def readFile(self, cik, accession, name):
+        f = self.openFile(cik, accession, name)
+        if f is None:
+            return None
+        with f:
+            return f.read()
+
+    # name comes from the URL: '..', empty segments or separators of the OS could take it out of 
+    #  the filing folder, so those are not in the mirror.
+    # Any error opening the file (missing, a folder, no permission...) sends the request to sec.gov
+    def openFile(self, cik, accession, name):
+        parts = name.split('/')
+        if any(p in ('', '.', '..') or os.sep in p or (os.altsep and os.altsep in p) for p in parts):
+            return None
+        try:
+            return open(os.path.join(self._folder(cik, accession), *parts), 'rb')
+        except OSError:
+            return None
+
+    def listFiles(self, cik, accession):
+        try:
+            return [e.name for e in os.scandir(self._folder(cik, accession)) if e.is_file()]
+        except OSError:
+            return None
+
+
+class TarMirror(EdgarMirror):
+    """
+    The tarball is indexed (the headers of all its members are read) the first time it's used.
+    """
+
+    def __init__(self, tarPath: str):
+        self.tarPath = tarPath
+        self._lock = threading.Lock()
+        self._tar = None
+        self._members = None # (cik, accession) -> { name: TarInfo }
+
+    def _index(self):
+        if self._members is None:
+            self._tar = tarfile.open(self.tarPath, 'r:*')
+            members = {}
+            for info in self._tar:
+                if not info.isfile():
+                    continue
+                m = reMemberPath.search(info.name)
+                if m is not None:
+                    members.setdefault((str(int(m.group(2))), m.group(3)), {})[m.group(4)] = info
+            self._tar.members = [] # We keep our own index, no need for tarfile to keep them all too
+            self._members = members
+            log.info('Indexed '+str(len(members))+' filings in '+self.tarPath)
+        return self._members
+
+    def readFile(self, cik, accession, name):
+        with self._lock:
+            info = self._index().get((cik, accession), {}).get(name)
+            if info is None:
+                return None
+            f = self._tar.extractfile(info)
+            return f.read()
+
+    def listFiles(self, cik, accession):
+        with self._lock:
+            files = self._index().get((cik, accession))
+            return list(files) if files is not None else None
+
+    def close(self):
+        with self._lock:
+            if self._tar is not None:
+                self._tar.close()
+                self._tar = None
+                self._members = None
+
+
+# DirectoryMirror or TarMirror, depending on what path is
+def openMirror(path: str) -> EdgarMirror:
+    if os.path.isdir(path):
+        return DirectoryMirror(path)
+    return TarMirror(path)
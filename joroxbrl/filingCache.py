@@ -0,0 +1,130 @@
+# On-disk cache of parsed filings, keyed by accession number.
+# Filed documents never change, so once a filing has been downloaded and parsed we keep
+#  everything we got from it (index data, XBRL facts and contexts, linkbases...) in a single
+#  compressed binary file, and the next run can rebuild it without going to sec.gov.
+import marshal
+import zlib
+import os
+import re
+import tempfile
+import threading
+import logging
+
+log = logging.getLogger('joroxbrl.filingCache')
+
+reAccession = re.compile(r'(\d{10})-?(\d{2})-?(\d{6})')
+
+_magic = b'JXS1'
+
+def accessionKey(accessionOrUrl: str) -> str:
+    """
+    Returns the accession number without dashes (e.g. 000110465922102374), taken from an
+    accession number or from any sec.gov URL of the filing. None if it can't be found.
+    """
+    m = None
+    for m in reAccession.finditer(accessionOrUrl):
+        pass # We want the last one, in case the CIK also looks like an accession
+    return m.group(1)+m.group(2)+m.group(3) if m else None
+
+
+class FilingSnapshotCache:
+    """
+    Snapshots are dicts of plain data (dict, list, tuple, str, int, float, None), stored with
+    marshal and zlib. Each file starts with a magic string and the marshal version, so snapshots
+    written by a different python version are simply ignored.
+
+    When the total size of the cache goes over maxBytes, the snapshots that were used the
+    longest time ago are removed (file modification time is updated every time one is read),
+    down to evictTarget of maxBytes, so that the next puts don't have to evict again.
+    The total size is counted once, on the first put, and then kept up to date by put. Since
+    other processes can be using the same directory, it's counted again every time we evict.
+    """
+    evictTarget = 0.9
+
+    def __init__(self, directory: str, maxBytes: int=2*1024**3):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self._lock = threading.Lock()
+        self._totalBytes = None # See put
+        os.makedirs(directory, exist_ok=True)
+
+    # Each accession can have several independent sections (e.g. 'filing' and 'xbrl'), in different 
+    #  files, so that big ones don't have to be rewritten when a small one changes
+    def _path(self, accessionNumber, section):
+        key = accessionKey(accessionNumber)
+        if key is None:
+            raise Exception('FilingSnapshotCache: invalid accession number '+accessionNumber)
+        return os.path.join(self.directory, key+'.'+section+'.snap')
+
+    def get(self, accessionNumber: str, section: str='filing') -> dict:
+        path = self._path(accessionNumber, section)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        if data[:4]!=_magic or data[4:5]!=bytes([marshal.version]):
+            log.info('Ignoring snapshot with a different format: '+path)
+            return None
+        try:
+            snapshot = marshal.loads(zlib.decompress(data[5:]))
+        except (ValueError, EOFError, TypeError, zlib.error) as ex:
+            log.warning('Could not read snapshot '+path+': '+str(ex))
+            return None
+        try:
+            os.utime(path) # Recently used
+        except OSError:
+            pass
+        return snapshot
+
+    def put(self, accessionNumber: str, snapshot: dict, section: str='filing'):
+        path = self._path(accessionNumber, section)
+        data = _magic + bytes([marshal.version]) + zlib.compress(marshal.dumps(snapshot), 6)
+        fd, tmpPath = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            with self._lock:
+                try:
+                    oldSize = os.stat(path).st_size
+                except FileNotFoundError:
+                    oldSize = 0
+                os.replace(tmpPath, path)
+                if self._totalBytes is None:
+                    self._totalBytes = self._scan()[1]
+                else:
+                    self._totalBytes = self._totalBytes + len(data) - oldSize
+                if self._totalBytes > self.maxBytes:
+                    self._evict()
+        except BaseException:
+            if os.path.exists(tmpPath):
+                os.remove(tmpPath)
+            raise
+
+    # ([(mtime, size, path) of each snapshot], total size)
+    def _scan(self):
+        entries = []
+        total = 0
+        for e in os.scandir(self.directory):
+            if e.name.endswith('.snap'):
+                st = e.stat()
+                entries.append((st.st_mtime, st.st_size, e.path))
+                total = total + st.st_size
+        return entries, total
+
+    # Called with the lock held
+    def _evict(self):
+        entries, total = self._scan()
+        target = self.maxBytes*self.evictTarget
+        if total > self.maxBytes:
+            entries.sort()
+            for mtime, size, path in entries:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                    total = total - size
+                    log.debug('Evicted snapshot '+path)
+                except OSError:
+                    pass
+        self._totalBytes = total
@@ -0,0 +1,156 @@
+# Catalogue of the filings of all the companies, in a sqlite database built from the bulk
+#  submissions (submissions.zip, or the folder where it was extracted), so that questions like
+#  "all the XBRL 10-K filed in 2023" don't need to go through the submissions of every company.
+# Used by joroxbrl.secFiles.Filing.queryFilings (and the lookups of Filing, when it's available).
+import sqlite3
+import zipfile
+import json
+import os
+import re
+import threading
+import logging
+
+log = logging.getLogger('joroxbrl.filingsIndex')
+
+reSubmissionFile = re.compile(r'^CIK(\d{10})(-submissions-\d+)?\.json$')
+
+# Same order as the parameters of joroxbrl.secFiles.Filing
+columns = ('cik', 'accessionNumber', 'filingDate', 'reportDate', 'acceptanceDateTime', 'act', 'form',
+           'fileNumber', 'filmNumber', 'items', 'size', 'isXBRL', 'isInlineXBRL', 'primaryDocument',
+           'primaryDocDescription')
+
+def _readFile(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+_schemaVersion = 2 # 2: filings keyed by (cik, accessionNumber)
+
+class FilingsIndex:
+    """
+    dbPath: sqlite database, created if it doesn't exist.
+
+    refresh(source) adds the submission files of source (a zip file or a folder) that are new or
+    have changed since the last time, so it can be called every time a new submissions.zip is
+    downloaded.
+
+    Filings with several registrants (co-registrants) are listed under each of their CIKs, so 
+    there is a row for each CIK.
+    """
+
+    def __init__(self, dbPath: str):
+        self.dbPath = dbPath
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(dbPath, timeout=60, check_same_thread=False, isolation_level=None) # Transactions are explicit
+        with self._lock, self._db:
+            self._db.execute('pragma journal_mode=wal')
+            if self._db.execute('pragma user_version').fetchone()[0] < _schemaVersion:
+                if self._db.execute("select 1 from sqlite_master where name='filings'").fetchone() is not None:
+                    log.warning('Filings index '+dbPath+' has an old format, it will be loaded again')
+                self._db.execute('drop table if exists filings')
+                self._db.execute('drop table if exists sources')
+                self._db.execute('pragma user_version='+str(_schemaVersion))
+            self._db.execute('create table if not exists filings ('+
+                             'cik text not null, accessionNumber text not null, filingDate text, reportDate text, '
+                             'acceptanceDateTime text, act text, form text, fileNumber text, filmNumber text, items text, '
+                             'size integer, isXBRL integer, isInlineXBRL integer, primaryDocument text, primaryDocDescription text, '
+                             'primary key (cik, accessionNumber))')
+            self._db.execute('create index if not exists filings_accession on filings (accessionNumber)')
+            self._db.execute('create index if not exists filings_cik_form_report on filings (cik, form, reportDate)')
+            self._db.execute('create index if not exists filings_filing_date on filings (filingDate)')
+            self._db.execute('create index if not exists filings_form_filing_date on filings (form, filingDate)')
+            # Files already loaded, and a signature (crc, or size and mtime) to know if they've changed
+            self._db.execute('create table if not exists sources (name text primary key, signature text)')
+
+    # Rows of one submissions file. The main one has them in filings.recent, and the older pages
+    #  (CIK##########-submissions-###.json) at the top level
+    @staticmethod
+    def _rows(cik, jSubm):
+        recent = jSubm['filings']['recent'] if 'filings' in jSubm else jSubm
+        n = len(recent.get('accessionNumber', []))
+        values = [recent.get(c, [None]*n) for c in columns[1:]]
+        for i in range(n):
+            yield (cik,)+tuple(v[i] if i < len(v) else None for v in values)
+
+    def _sourceFiles(self, source):
+        # (name, signature, read()) of each submissions file in source
+        if os.path.isdir(source):
+            for e in os.scandir(source):
+                if reSubmissionFile.match(e.name):
+                    st = e.stat()
+                    yield e.name, str(st.st_size)+'-'+str(st.st_mtime_ns), (lambda path=e.path: _readFile(path))
+        else:
+            with zipfile.ZipFile(source) as z:
+                for info in z.infolist():
+                    name = info.filename.rsplit('/', 1)[-1]
+                    if reSubmissionFile.match(name):
+                        yield name, str(info.file_size)+'-'+str(info.CRC), (lambda info=info: z.read(info))
+
+    # Loads the new or changed files of source. Returns the number of files loaded
+    def refresh(self, source: str, batchSize: int=1000) -> int:
+        with self._lock:
+            known = dict(self._db.execute('select name, signature from sources'))
+            loaded = 0
+            self._db.execute('begin')
+            try:
+                for name, signature, read in self._sourceFiles(source):
+                    if known.get(name) == signature:
+                        continue
+                    cik = reSubmissionFile.match(name).group(1)
+                    try:
+                        jSubm = json.loads(read())
+                    except ValueError as ex:
+                        log.warning('Skipping invalid submissions file '+name+': '+str(ex))
+                        continue
+                    self._db.executemany('insert or replace into filings values ('+','.join('?'*len(columns))+')',
+                                         self._rows(cik, jSubm))
+                    self._db.execute('insert or replace into sources values (?, ?)', (name, signature))
+                    loaded = loaded + 1
+                    if loaded % batchSize == 0:
+                        self._db.execute('commit')
+                        log.info(str(loaded)+' submission files loaded')
+                        self._db.execute('begin')
+                self._db.execute('commit')
+            except BaseException:
+                self._db.execute('rollback')
+                raise
+            return loaded
+
+    # Rows (in the order of columns) of the filings that meet all the conditions given, the most
+    #  recent first. forms: list of form types. Dates as 'YYYY-MM-DD', both ends included
+    def query(self, cik: str=None, forms: list=None, isXBRL: bool=None, accessionNumber: str=None,
+              reportDate: str=None, filingDateFrom: str=None, filingDateTo: str=None, limit: int=None) -> list:
+        conditions = []
+        params = []
+        if cik is not None:
+            conditions.append('cik=?')
+            params.append(cik)
+        if forms:
+            conditions.append('form in ('+','.join('?'*len(forms))+')')
+            params.extend(forms)
+        if isXBRL is not None:
+            conditions.append('isXBRL=?')
+            params.append(1 if isXBRL else 0)
+        if accessionNumber is not None:
+            conditions.append('accessionNumber=?')
+            params.append(accessionNumber)
+        if reportDate is not None:
+            conditions.append('reportDate=?')
+            params.append(reportDate)
+        if filingDateFrom is not None:
+            conditions.append('filingDate>=?')
+            params.append(filingDateFrom)
+        if filingDateTo is not None:
+            conditions.append('filingDate<=?')
+            params.append(filingDateTo)
+        sql = 'select '+','.join(columns)+' from filings'
+        if conditions:
+            sql = sql+' where '+' and '.join(conditions)
+        sql = sql+' order by filingDate desc, acceptanceDateTime desc, cik'
+        if limit is not None:
+            sql = sql+' limit '+str(int(limit))
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
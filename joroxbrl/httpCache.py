@@ -0,0 +1,266 @@
+# Persistent cache of HTTP responses from sec.gov, used by joroxbrl.secGov.SecGovCaller.
+# Bodies are stored compressed, named after the sha256 of their content (so the same document
+#  reached through two URLs is only stored once), and a small sqlite database maps each URL to
+#  its body, status, headers and validators (ETag, Last-Modified).
+# Documents inside a filing folder (/Archives/edgar/data/<cik>/<accession>/...) never change once
+#  filed, so they are served from the cache without asking sec.gov. Everything else (submissions,
+#  cgi-bin/current, company folders...) is revalidated with If-None-Match / If-Modified-Since.
+import sqlite3
+import hashlib
+import json
+import zlib
+import os
+import re
+import io
+import time
+import tempfile
+import threading
+import logging
+import requests
+from requests.structures import CaseInsensitiveDict
+
+log = logging.getLogger('joroxbrl.httpCache')
+
+reImmutableUrl = re.compile(r'^https?://(www\.)?sec\.gov/Archives/edgar/data/\d+/\d{18}/[^?#]+$')
+
+# Headers that don't describe the body we store, which is already decoded
+_droppedHeaders = ('content-encoding', 'content-length', 'transfer-encoding', 'connection')
+
+def isImmutableUrl(url: str) -> bool:
+    return reImmutableUrl.match(url) is not None
+
+
+# A requests.Response for a body we already have, which can be used like the real one (text,
+#  content, json(), iter_content(), raw...)
+# raw: instead of body, a file-like object from which the body will be read as it's used, as
+#  with a streamed response
+def makeResponse(url: str, body: bytes, headers: dict, status: int=200, encoding: str=None, raw=None) -> requests.Response:
+    resp = requests.Response()
+    resp.status_code = status
+    resp.url = url
+    resp.headers = CaseInsensitiveDict(headers)
+    resp.encoding = encoding or requests.utils.get_encoding_from_headers(resp.headers)
+    if raw is None:
+        resp._content = body
+        resp.raw = io.BytesIO(body)
+    else:
+        resp.raw = raw
+    resp.fromCache = True
+    return resp
+
+# Decompresses a stored body as it is read, so that it never has to be whole in memory
+class _BodyReader(io.RawIOBase):
+
+    def __init__(self, path):
+        self._f = open(path, 'rb')
+        self._decompressor = zlib.decompressobj()
+        self._buffer = b''
+        self._eof = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buffer and not self._eof:
+            data = self._decompressor.unconsumed_tail or self._f.read(65536)
+            if data:
+                self._buffer = self._decompressor.decompress(data, 65536)
+            else:
+                self._buffer = self._decompressor.flush()
+                self._eof = True
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+    def close(self):
+        self._f.close()
+        super().close()
+
+
+class CachedResponse:
+    __slots__ = ('url', 'digest', 'status', 'headers', 'etag', 'lastModified', 'storedAt', 'size')
+
+    def __init__(self, url, digest, status, headers, etag, lastModified, storedAt, size):
+        self.url = url
+        self.digest = digest
+        self.status = status
+        self.headers = headers
+        self.etag = etag
+        self.lastModified = lastModified
+        self.storedAt = storedAt
+        self.size = size
+
+    def isImmutable(self):
+        return isImmutableUrl(self.url)
+
+
+class ResponseCache:
+    """
+    directory: where the index (index.sqlite) and the bodies are kept
+    maxBytes: budget for the compressed bodies. When it's exceeded, the URLs used the longest time
+        ago are removed (and their bodies, if no other URL shares them)
+
+    Only 200 responses are stored. Several processes can share the same directory.
+
+    The total size of the bodies is kept in the meta table, updated by put and _evict, so that
+    checking the budget doesn't need to go through the whole index.
+    """
+    evictBatchSize = 100 # URLs removed in each transaction of _evict
+    evictTarget = 0.9 # _evict goes down to this fraction of maxBytes, so the next puts don't have to evict again
+
+    def __init__(self, directory: str, maxBytes: int=4*1024**3):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(directory, 'index.sqlite'), timeout=60, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute('''create table if not exists responses (
+                                    url text primary key, digest text not null, status integer not null,
+                                    headers text not null, etag text, last_modified text,
+                                    stored_at real not null, last_used real not null, size integer not null)''')
+            self._db.execute('create index if not exists responses_last_used on responses (last_used)')
+            self._db.execute('create index if not exists responses_digest on responses (digest)')
+            self._db.execute('create table if not exists meta (name text primary key, value integer not null)')
+            # Bodies shared by several URLs count only once
+            self._db.execute('''insert or ignore into meta select 'total_bytes', coalesce(sum(size), 0) 
+                                from (select max(size) size from responses group by digest)''')
+
+    def _bodyPath(self, digest):
+        return os.path.join(self.directory, digest[:2], digest+'.z')
+
+    def get(self, url: str) -> CachedResponse:
+        with self._lock:
+            row = self._db.execute('''select url, digest, status, headers, etag, last_modified, stored_at, size
+                                      from responses where url=?''', (url,)).fetchone()
+        if row is None or not os.path.exists(self._bodyPath(row[1])):
+            return None
+        return CachedResponse(row[0], row[1], row[2], json.loads(row[3]), row[4], row[5], row[6], row[7])
+
+    # Headers to add to the request to revalidate entry (None means nothing cached)
+    @staticmethod
+    def validationHeaders(entry: CachedResponse) -> dict:
+        headers = {}
+        if entry is not None:
+            if entry.etag: headers['If-None-Match'] = entry.etag
+            if entry.lastModified: headers['If-Modified-Since'] = entry.lastModified
+        return headers
+
+    def readBody(self, entry: CachedResponse) -> bytes:
+        with open(self._bodyPath(entry.digest), 'rb') as f:
+            return zlib.decompress(f.read())
+
+    # Binary file object with the body, decompressed as it's read
+    def openBody(self, entry: CachedResponse):
+        return io.BufferedReader(_BodyReader(self._bodyPath(entry.digest)))
+
+    # Builds a requests.Response from the cache (see makeResponse). Also marks it as recently used.
+    # stream: the body is not read until it's used, and can be consumed in chunks (iter_content, raw)
+    def toResponse(self, entry: CachedResponse, stream: bool=False) -> requests.Response:
+        self.touch(entry.url)
+        if stream:
+            return makeResponse(entry.url, None, entry.headers, entry.status, raw=self.openBody(entry))
+        return makeResponse(entry.url, self.readBody(entry), entry.headers, entry.status)
+
+    def touch(self, url: str):
+        with self._lock, self._db:
+            self._db.execute('update responses set last_used=? where url=?', (time.time(), url))
+
+    # Stores the body of resp and returns the entry. If resp was requested with stream=True, the
+    #  body goes to disk as it arrives, without being whole in memory.
+    # maxBytes: if the body is bigger than this, nothing is stored and an exception is raised
+    def put(self, url: str, resp: requests.Response, maxBytes: int=None) -> CachedResponse:
+        sha = hashlib.sha256()
+        compressor = zlib.compressobj(6)
+        total = 0
+        fd, tmpPath = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in resp.iter_content(65536):
+                    total = total + len(chunk)
+                    if maxBytes is not None and total > maxBytes:
+                        raise Exception('Response from '+url+' is bigger than '+str(maxBytes)+' bytes')
+                    sha.update(chunk)
+                    f.write(compressor.compress(chunk))
+                f.write(compressor.flush())
+            digest = sha.hexdigest()
+            path = self._bodyPath(digest)
+            if os.path.exists(path): # Same body as another URL
+                os.remove(tmpPath)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmpPath, path)
+        except BaseException:
+            if os.path.exists(tmpPath):
+                os.remove(tmpPath)
+            raise
+        size = os.path.getsize(path)
+        headers = { k: v for k, v in resp.headers.items() if k.lower() not in _droppedHeaders }
+        now = time.time()
+        entry = CachedResponse(url, digest, resp.status_code, headers,
+                               resp.headers.get('ETag'), resp.headers.get('Last-Modified'), now, size)
+        unusedDigests = []
+        with self._lock, self._db:
+            self._db.execute('begin immediate')
+            old = self._db.execute('select digest, size from responses where url=?', (url,)).fetchone()
+            delta = size if not self._isReferenced(digest) else 0
+            self._db.execute('insert or replace into responses values (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                             (url, digest, entry.status, json.dumps(headers), entry.etag, entry.lastModified, now, now, size))
+            if old is not None and old[0] != digest and not self._isReferenced(old[0]):
+                delta = delta - old[1]
+                unusedDigests.append(old[0])
+            total = self._addTotal(delta)
+        self._removeBodies(unusedDigests)
+        if total > self.maxBytes:
+            self._evict()
+        return entry
+
+    def _isReferenced(self, digest):
+        return self._db.execute('select 1 from responses where digest=? limit 1', (digest,)).fetchone() is not None
+
+    # Adds delta to the total size of the bodies, and returns the new total
+    def _addTotal(self, delta):
+        if delta:
+            self._db.execute("update meta set value=value+? where name='total_bytes'", (delta,))
+        return self._db.execute("select value from meta where name='total_bytes'").fetchone()[0]
+
+    def _removeBodies(self, digests):
+        for digest in digests:
+            try:
+                os.remove(self._bodyPath(digest))
+            except OSError:
+                pass
+
+    # Removes the URLs used the longest time ago, evictBatchSize at a time, until the total is down to
+    #  evictTarget of the budget
+    def _evict(self):
+        limit = self.maxBytes # Once we've started, we go down to the target
+        target = self.maxBytes*self.evictTarget
+        while True:
+            unusedDigests = []
+            with self._lock, self._db:
+                self._db.execute('begin immediate')
+                total = self._addTotal(0)
+                if total <= limit:
+                    return
+                limit = target
+                rows = self._db.execute('select url, digest, size from responses order by last_used limit ?', 
+                                        (self.evictBatchSize,)).fetchall()
+                if not rows:
+                    return
+                delta = 0
+                for url, digest, size in rows:
+                    if total + delta <= target:
+                        break
+                    self._db.execute('delete from responses where url=?', (url,))
+                    if not self._isReferenced(digest):
+                        unusedDigests.append(digest)
+                        delta = delta - size
+                    log.debug('Evicted '+url)
+                self._addTotal(delta)
+            self._removeBodies(unusedDigests)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -4,6 +4,8 @@ import polygon
 import time
 import datetime
 import joroxbrl.secGov
+import joroxbrl.telemetry
+import joroxbrl.replay
 import os
 
 class MetricCalculator:
@@ -97,6 +99,7 @@ class MetricCalculator:
         self.filing = filing
         if self.company is None: self.company = filing.cik
         
+        filing.getFilingUrls().prefetch() # All the data files we'll need, in one go
         self.facts = filing.getFilingUrls().getXbrl().getActualGlobalFacts(self._factList)
         logging.debug(self.facts.keys())
     
@@ -406,14 +409,14 @@ class MetricCalculator:
         try:
             plb = self.filing.getFilingUrls().getPresentationLinkbase()
             cwc = plb.getChangesInOperatingCapitalFromStrings(
-                joroxbrl.secGov.SecGovCaller.callSecGovUrl(self.filing.getFilingUrls().getCalculationLinkbaseUrl()).text, 
+                self.filing.getFilingUrls().getDocumentText(self.filing.getFilingUrls().getCalculationLinkbaseUrl()), 
                 xbrl = self.filing.getFilingUrls().getXbrl() )
         except Exception as ex:
             # I've seen this happen in cases where the calculation linkbase doesn't include this
             # If the presentation linkbase doesn't exist as a standalone file, try to get the info from the xsd file
             urls = self.filing.getFilingUrls()
             presentationLinkbaseXsd = joroxbrl.presentationLinkbase.PresentationLinkbase(urls)
-            presentationLinkbaseXsd.readXml(joroxbrl.secGov.SecGovCaller.callSecGovUrl(  urls.getXsdUrl()).text)
+            presentationLinkbaseXsd.readXml(urls.getDocumentText(urls.getXsdUrl()))
             cwc = presentationLinkbaseXsd.getChangesInOperatingCapital(None, urls.getXbrl())
 
             # A possible workaround could be to control that specific error, and then try
@@ -447,12 +450,17 @@ class MetricCalculator:
         
     @classmethod
     def calculateTTMMetrics(cls, cik: str): #-> MetricCalculator: # returns concepts and metrics
-        lis = joroxbrl.secFiles.Filing.getListFilings(cik, ['10-Q', '10-K'], isXBRL=True)
-        # They come in reverse chronological order (newer first)
+        # They come in reverse chronological order (newer first), and the older pages of the 
+        #  submissions are only read if we need to go that far back
+        filings = joroxbrl.secFiles.Filing.iterFilings(cik, ['10-Q', '10-K'], isXBRL=True)
+        recent = next(filings, None)
+        if recent is None:
+            logging.error('No filings found in calculateTTMMetrics for '+cik)
+            return None
         
         recentMetric = MetricCalculator()
-        recentMetric.genMetrics(lis[0])
-        if lis.pop(0).form=='10-K':
+        recentMetric.genMetrics(recent)
+        if recent.form=='10-K':
             # This will be easy, we just have to return the metrics of the 10-K, and we're done
             return recentMetric
 
@@ -463,7 +471,7 @@ class MetricCalculator:
         recentDocumentPeriodEndDate = recentXbrl.getFact('DocumentPeriodEndDate').value
         annualMetric = None # this will contain the MetricsCalculator corresponding to the 10-K
         olderMetric = None # this will contain the MetricsCalculator corresponding to the previous year's 10-Q
-        for fil in lis:
+        for fil in filings:
             if fil.form=='10-K':
                 if annualMetric is not None: 
                     logging.error('Error finding corresponding filings in calculateTTMMetrics for '+cik)
@@ -524,14 +532,32 @@ class PolygonCaller:
     _lastCall = datetime.datetime.today() - datetime.timedelta(minutes=1)
     _polyDelta = datetime.timedelta(seconds=13) # Our Polygon license allows us to do 5 calls per minute
     
+    _host = 'api.polygon.io' # For the telemetry
+
     @classmethod
     def get_ticker_details(cls, ticker:str, date:str=None):
         logging.debug('PolygonCaller.get_ticker_details('+ticker+','+str(date)+')')
-        cls._callLimit()
+        telemetry = joroxbrl.telemetry.telemetry
+        transport = joroxbrl.replay.getTransport()
+        if transport is None or transport.applyRateLimits():
+            start = time.perf_counter()
+            cls._callLimit()
+            telemetry.recordWait(cls._host, time.perf_counter()-start)
         # In some cases, when SEC includes a - in the ticker, Polygon prefers a .
         ticker = ticker.replace('-', '.')
         params = {'date': date} if date is not None else {}
-        return polygon.RESTClient(os.getenv('POLYGON_KEY')).get_ticker_details(ticker, date=date) #, params=params)
+        call = lambda: polygon.RESTClient(os.getenv('POLYGON_KEY')).get_ticker_details(ticker, date=date) #, params=params)
+        start = time.perf_counter()
+        try:
+            if transport is not None:
+                details = transport.call('polygon', 'get_ticker_details '+ticker+' '+str(date), call)
+            else:
+                details = call()
+        except Exception as ex:
+            telemetry.recordRequest(cls._host, 'ticker-details', time.perf_counter()-start, getattr(ex, 'status', 'error'))
+            raise
+        telemetry.recordRequest(cls._host, 'ticker-details', time.perf_counter()-start, 200)
+        return details
     
     @classmethod
     def _callLimit(cls):
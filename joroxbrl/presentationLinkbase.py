@@ -116,9 +116,9 @@ class PresentationLinkbase:
                         subHref = href.split('#')
                         if href[0:4] != 'http': # In this case xsd has to be taken from filingUrls
                             logging.debug('we will retrieve the xsd from filingUrls for '+href)
-                            ns = getNamespaceFromXsd(self.filingUrls.getXsdUrl())
+                            ns = self.filingUrls.getNamespaceFromXsd(self.filingUrls.getXsdUrl())
                         else:
-                            ns = getNamespaceFromXsd(subHref[0])
+                            ns = self.filingUrls.getNamespaceFromXsd(subHref[0])
                             
                         newNode.data['xbrlFact'] = '{'+ns+'}'+subHref[-1].split('_', 1)[-1]
                         logging.debug('Adding node: '+str(newNode.tag))
@@ -0,0 +1,215 @@
+# Token bucket rate limiter, shared by all the threads of a process and, through a lock file, by
+#  all the processes of the same host that use the same bucket name (so several scripts running
+#  at the same time don't go over sec.gov's 10 requests per second between them).
+import time
+import os
+import re
+import struct
+import tempfile
+import threading
+import logging
+try:
+    import fcntl
+except ImportError: # Windows: the limit is only shared by the threads of each process
+    fcntl = None
+
+log = logging.getLogger('joroxbrl.rateLimit')
+
+_stateFormat = struct.Struct('<dd') # tokens, time of the last update
+
+class TokenBucket:
+    """
+    rate: tokens added per second (sustained requests per second)
+    burst: maximum number of tokens that can be accumulated (requests that can be made at once)
+    stateFile: if given, the state of the bucket is kept in this file, locked with flock while
+        it's updated, so that all the processes using it share the same limit. It's only readable
+        and writable by its owner, and if it belongs to somebody else (or it can't be opened) the 
+        limit is kept in the process only
+
+    Requests take tokens with reserve, which never blocks: the tokens can go negative, and the
+    caller is told how long it has to wait for its turn. This way the waiting is done without
+    holding any lock.
+    """
+
+    def __init__(self, rate: float, burst: float=1, stateFile: str=None):
+        self.rate = rate
+        self.burst = burst
+        self.stateFile = stateFile if fcntl is not None else None
+        self._lock = threading.Lock()
+        self._tokens = burst
+        self._updated = time.time()
+
+    # Takes tokens from the bucket, and returns the number of seconds to wait before using them
+    def reserve(self, tokens: float=1) -> float:
+        return self._update(lambda current, updated: self._take(current, updated, tokens))
+
+    def _take(self, current, updated, tokens):
+        now = time.time()
+        if now > updated:
+            current = min(self.burst, current + (now-updated)*self.rate)
+            updated = now
+        current = current - tokens
+        return current, updated, (-current/self.rate if current < 0 else 0)
+
+    # Applies f(tokens, updated) -> (tokens, updated, result) to the state of the bucket, wherever 
+    #  it is, and returns result
+    def _update(self, f):
+        with self._lock:
+            if self.stateFile is None:
+                self._tokens, self._updated, result = f(self._tokens, self._updated)
+                return result
+            # The file is opened every time, because a flock on a descriptor inherited through fork
+            #  would not keep out the other process
+            try:
+                fd = self._openStateFile()
+            except OSError as ex:
+                log.warning('Rate limit state file '+self.stateFile+' can\'t be used, the limit will only apply to this process: '+str(ex))
+                self.stateFile = None
+                self._tokens, self._updated, result = f(self._tokens, self._updated)
+                return result
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                data = os.pread(fd, _stateFormat.size, 0)
+                if len(data) == _stateFormat.size:
+                    current, updated = _stateFormat.unpack(data)
+                else: # New file
+                    current, updated = self.burst, time.time()
+                current, updated, result = f(current, updated)
+                os.pwrite(fd, _stateFormat.pack(current, updated), 0)
+                return result
+            finally:
+                os.close(fd) # Also releases the lock
+
+    def _openStateFile(self):
+        fd = os.open(self.stateFile, os.O_RDWR | os.O_CREAT | getattr(os, 'O_NOFOLLOW', 0), 0o600)
+        st = os.fstat(fd)
+        if st.st_uid != os.getuid() or st.st_mode & 0o077: # Somebody else could change our limit
+            os.close(fd)
+            raise PermissionError('it belongs to another user or others can access it')
+        return fd
+
+    # Blocking version of reserve
+    def acquire(self, tokens: float=1):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    # Nobody gets any token for the next seconds (e.g. when the server sends a Retry-After). With a
+    #  stateFile, this also applies to the other processes
+    def pause(self, seconds: float):
+        def _pause(current, updated):
+            current, updated, _ = self._take(current, updated, 0)
+            return min(current, -seconds*self.rate), updated, None
+        self._update(_pause)
+
+
+class AdaptiveRate:
+    """
+    AIMD control of the rate of a TokenBucket: every time the server throttles us (429, 503) the 
+    rate is halved, down to minRate, and every healthy response adds increase requests per second
+    back, up to the ceiling (the rate the bucket was configured with).
+    Several throttled responses within cooldown seconds count as one, since they are usually the 
+    result of the same burst of requests.
+
+    The rate is adjusted in each process, but the pauses for Retry-After go to the bucket, so they 
+    are shared with the other processes.
+    """
+
+    def __init__(self, bucket: TokenBucket, minRate: float=0.5, increase: float=0.1, cooldown: float=1.0):
+        self.bucket = bucket
+        self.ceiling = bucket.rate
+        self.minRate = min(minRate, bucket.rate)
+        self.increase = increase
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._lastDecrease = 0
+
+    @property
+    def effectiveRate(self) -> float:
+        return self.bucket.rate
+
+    def onSuccess(self):
+        with self._lock:
+            if self.bucket.rate < self.ceiling:
+                self.bucket.rate = min(self.ceiling, self.bucket.rate + self.increase)
+
+    # retryAfter: seconds the server asked us to wait, if it did
+    def onThrottle(self, retryAfter: float=None):
+        with self._lock:
+            now = time.time()
+            if now - self._lastDecrease >= self.cooldown:
+                self.bucket.rate = max(self.minRate, self.bucket.rate/2)
+                self._lastDecrease = now
+                log.warning('Throttled by the server, rate reduced to '+str(round(self.bucket.rate, 2))+' requests per second')
+        if retryAfter:
+            self.bucket.pause(retryAfter)
+
+
+# Limits per host: host -> (rate, burst). Hosts not listed use the one of the domain they belong
+#  to (e.g. data.sec.gov uses sec.gov), so by default all of sec.gov shares a single bucket.
+# Can be changed with the SEC_RATE_LIMITS environment variable, e.g. "sec.gov=10/1,efts.sec.gov=5/2"
+hostLimits = { 'sec.gov': (10, 1) } # sec.gov doesn't like it when we call more than 10 times per second
+
+# Directory of the lock files. SEC_RATE_LIMIT_DIR, or the temp directory by default (with the user id
+#  in the names of the files, so that each user has their own)
+stateDirectory = None
+
+_limits = None # hostLimits plus SEC_RATE_LIMITS, read once. See reset
+_limiters = {} # bucket name -> (TokenBucket, AdaptiveRate)
+_hostNames = {} # host -> bucket name
+_bucketsLock = threading.Lock()
+
+def _readHostLimits():
+    limits = dict(hostLimits)
+    for item in filter(None, re.split(r'[,;\s]+', os.getenv('SEC_RATE_LIMITS', ''))):
+        try:
+            host, value = item.split('=')
+            rate, _, burst = value.partition('/')
+            limits[host.strip().lower()] = (float(rate), float(burst) if burst else 1)
+        except ValueError:
+            log.warning('Ignoring invalid rate limit in SEC_RATE_LIMITS: '+item)
+    return limits
+
+# Forgets the buckets, and reads the limits again the next time one is needed (e.g. after changing
+#  hostLimits or SEC_RATE_LIMITS)
+def reset():
+    global _limits
+    with _bucketsLock:
+        _limits = None
+        _limiters.clear()
+        _hostNames.clear()
+
+# (TokenBucket, AdaptiveRate) used by host
+def _getLimiter(host):
+    host = (host or '').lower()
+    limiter = _limiters.get(_hostNames.get(host))
+    if limiter is not None:
+        return limiter
+    global _limits
+    with _bucketsLock:
+        if _limits is None:
+            _limits = _readHostLimits()
+        name = host
+        while name not in _limits and '.' in name:
+            name = name.split('.', 1)[1]
+        if name not in _limits:
+            name = 'sec.gov'
+        if name not in _limiters:
+            rate, burst = _limits[name]
+            directory = stateDirectory or os.getenv('SEC_RATE_LIMIT_DIR')
+            fileName = 'joroxbrl-ratelimit-'+name+'.state'
+            if not directory:
+                directory = tempfile.gettempdir()
+                fileName = 'joroxbrl-ratelimit-'+str(getattr(os, 'getuid', lambda: 0)())+'-'+name+'.state'
+            bucket = TokenBucket(rate, burst, os.path.join(directory, fileName))
+            _limiters[name] = (bucket, AdaptiveRate(bucket))
+        _hostNames[host] = name
+        return _limiters[name]
+
+def getBucket(host: str) -> TokenBucket:
+    return _getLimiter(host)[0]
+
+# AdaptiveRate of the bucket used by host
+def getController(host: str) -> AdaptiveRate:
+    return _getLimiter(host)[1]
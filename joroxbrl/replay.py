@@ -0,0 +1,158 @@
+# Record/replay of the calls to sec.gov and Polygon, so that the whole pipeline can be run (and
+#  benchmarked, and tested) without network, always with the same responses.
+# Configured with environment variables:
+#  REPLAY_MODE: 'record' (calls go to the network, and the responses are stored) or 'replay'
+#    (responses are taken from the store, and a missing one is an error). Anything else: off
+#  REPLAY_DIR: directory of the stored responses (the fixture store)
+#  REPLAY_LATENCY: in replay, wait this factor of the latency measured when the response was
+#    recorded (0, the default, means no waiting; 1, the same as the real thing)
+#  REPLAY_RATE_LIMITS: in replay, whether the rate limits still apply (1) or not (0, the default)
+import os
+import json
+import time
+import pickle
+import hashlib
+import logging
+import joroxbrl.httpCache
+
+log = logging.getLogger('joroxbrl.replay')
+
+modeRecord = 'record'
+modeReplay = 'replay'
+
+class MissingFixture(Exception):
+    pass
+
+class FixtureStore:
+    """
+    Each response is kept in two files named after the hash of the URL: <key>.json, with the URL,
+    status, headers and latency, and <key>.body. Polygon results are pickled to <key>.pickle.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, kind, key, ext):
+        folder = os.path.join(self.directory, kind)
+        return os.path.join(folder, hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]+ext)
+
+    def _write(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmpPath = path+'.tmp'+str(os.getpid())
+        with open(tmpPath, 'wb') as f:
+            f.write(data)
+        os.replace(tmpPath, path)
+
+    def putResponse(self, url: str, status: int, headers: dict, body: bytes, latency: float):
+        self._write(self._path('http', url, '.body'), body)
+        meta = {'url': url, 'status': status, 'headers': headers, 'latency': latency}
+        self._write(self._path('http', url, '.json'), json.dumps(meta, indent=1).encode('utf-8'))
+
+    # (meta, body), or None if it's not in the store
+    def getResponse(self, url: str):
+        try:
+            with open(self._path('http', url, '.json'), 'rb') as f:
+                meta = json.load(f)
+            with open(self._path('http', url, '.body'), 'rb') as f:
+                return meta, f.read()
+        except FileNotFoundError:
+            return None
+
+    def putResult(self, kind: str, key: str, result, latency: float):
+        self._write(self._path(kind, key, '.pickle'), pickle.dumps((result, latency)))
+
+    # (result, latency), or None if it's not in the store
+    def getResult(self, kind: str, key: str):
+        try:
+            with open(self._path(kind, key, '.pickle'), 'rb') as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+
+
+class Transport:
+    """
+    mode: modeRecord or modeReplay
+    latencyFactor: in replay, fraction of the recorded latency that is simulated
+    rateLimits: in replay, whether SecGovCaller and PolygonCaller still apply their rate limits
+    """
+
+    def __init__(self, store: FixtureStore, mode: str, latencyFactor: float=0, rateLimits: bool=False):
+        self.store = store
+        self.mode = mode
+        self.latencyFactor = latencyFactor
+        self.rateLimits = rateLimits
+
+    def isReplaying(self):
+        return self.mode == modeReplay
+
+    # Whether callers should apply their rate limit
+    def applyRateLimits(self):
+        return self.mode != modeReplay or self.rateLimits
+
+    def _simulateLatency(self, latency):
+        if self.latencyFactor and latency:
+            time.sleep(latency*self.latencyFactor)
+
+    # Same as requests.Session.get, as used by SecGovCaller. session: the real one, for recording
+    def get(self, session, url, headers=None, stream=False):
+        if self.mode == modeReplay:
+            stored = self.store.getResponse(url)
+            if stored is None:
+                raise MissingFixture('No recorded response for '+url)
+            meta, body = stored
+            self._simulateLatency(meta['latency'])
+            return joroxbrl.httpCache.makeResponse(url, body, meta['headers'], meta['status'])
+        start = time.perf_counter()
+        resp = session.get(url, headers=headers, stream=stream)
+        body = resp.content # Whole, to store it
+        latency = time.perf_counter()-start
+        storedHeaders = { k: v for k, v in resp.headers.items() if k.lower() not in joroxbrl.httpCache._droppedHeaders }
+        self.store.putResponse(url, resp.status_code, storedHeaders, body, latency)
+        return joroxbrl.httpCache.makeResponse(url, body, storedHeaders, resp.status_code)
+
+    # Result of call() (any picklable object), recorded or replayed under kind and key
+    def call(self, kind: str, key: str, call):
+        if self.mode == modeReplay:
+            stored = self.store.getResult(kind, key)
+            if stored is None:
+                raise MissingFixture('No recorded result for '+kind+' '+key)
+            result, latency = stored
+            self._simulateLatency(latency)
+            return result
+        start = time.perf_counter()
+        result = call()
+        self.store.putResult(kind, key, result, time.perf_counter()-start)
+        return result
+
+
+# A requests.Session replacement for SecGovCaller, that goes through the transport
+class ReplaySession:
+
+    def __init__(self, transport: Transport, session=None):
+        self.transport = transport
+        self.session = session
+
+    def get(self, url, headers=None, stream=False):
+        return self.transport.get(self.session, url, headers, stream)
+
+
+transport = None # Transport in use. See getTransport
+
+def getTransport() -> Transport:
+    # If not set explicitly, it's created from the environment variables (see the top of the module).
+    #  None if record/replay is not enabled
+    global transport
+    if transport is None and os.getenv('REPLAY_MODE') in (modeRecord, modeReplay):
+        if not os.getenv('REPLAY_DIR'):
+            raise Exception('REPLAY_MODE is set, but there is no REPLAY_DIR')
+        transport = Transport(FixtureStore(os.getenv('REPLAY_DIR')), os.getenv('REPLAY_MODE'),
+                              float(os.getenv('REPLAY_LATENCY', '0')), os.getenv('REPLAY_RATE_LIMITS', '0') == '1')
+        log.info('Record/replay enabled: '+transport.mode+' in '+transport.store.directory)
+    return transport
+
+# session, or a ReplaySession around it if record/replay is enabled
+def wrapSession(session):
+    t = getTransport()
+    return ReplaySession(t, session) if t is not None else session
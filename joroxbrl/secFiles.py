@@ -6,8 +6,17 @@ import logging
 import requests
 import sys
 import os
+import time
+import threading
+import collections
+import joroxbrl.filingsIndex
+import joroxbrl.zipArchive
+import numpy as np
 companyfactsDir = None #'secInfo/companyfacts/' # If left empty, it will be retrieved from the SEC
 submissionsDir = None #'secInfo/submissions/' # If left empty, it will be retrieved from the SEC
+# companyfacts.zip and submissions.zip, read in place (see joroxbrl.zipArchive). Used before the Dirs
+companyfactsZip = os.getenv('COMPANYFACTS_ZIP') #'secInfo/companyfacts.zip'
+submissionsZip = os.getenv('SUBMISSIONS_ZIP') #'secInfo/submissions.zip'
 companyTickersDir = os.getenv('COMPANY_TICKERS_DIR')
 companyfactsUrl = 'https://data.sec.gov/api/xbrl/companyfacts/'
 submissionsUrl = 'https://data.sec.gov/submissions/'
@@ -15,6 +24,102 @@ secDocAccessUrl = 'https://www.sec.gov/Archives/edgar/data/'
 companyTickersUrl = 'https://www.sec.gov/files/company_tickers.json'
 print(companyTickersDir)
 
+# Cache of the parsed submissions files, see Filing.getSubmission
+submissionsCacheTTL = float(os.getenv('SUBMISSIONS_CACHE_TTL', '3600')) # Seconds, for those downloaded from sec.gov
+submissionsCacheMaxBytes = int(os.getenv('SUBMISSIONS_CACHE_MAX_MB', '256'))*1024**2 # Memory of the parsed files (estimated, see _parsedSizeRatio)
+_parsedSizeRatio = 4 # Parsed, a submissions file takes about 3.9 times the size of its json
+
+class _SubmissionsCache:
+    """
+    cik -> parsed submissions, in LRU order. Entries from submissionsDir are valid while the file
+    keeps the same modification time (those from submissionsZip, while it's the same zip), and 
+    those from sec.gov for submissionsCacheTTL seconds.
+    Each entry also keeps the numpy arrays of its columns made by getArray.
+    When the entries add up to more than submissionsCacheMaxBytes of memory (estimated from the 
+    size of the json, plus the arrays), the least recently used are dropped.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict() # cik -> (jSubm, size in memory, mtime or None, loadedAt, { column: numpy array })
+        self._keys = {} # id of the columns of each entry -> cik
+        self._size = 0
+        self._loading = joroxbrl.secGov.SingleFlight() # So that each cik is parsed only once at a time
+
+    # load() -> (jSubm, size of the json). mtime: of the local file, None if it comes from sec.gov
+    def get(self, cik, mtime, load):
+        with self._lock:
+            entry = self._entries.get(cik)
+            if entry is not None:
+                if (entry[2] == mtime if mtime is not None 
+                        else entry[2] is None and time.monotonic() - entry[3] < submissionsCacheTTL):
+                    self._entries.move_to_end(cik)
+                    return entry[0]
+        jSubm, size = self._loading.do((cik, mtime), load)[0]
+        if jSubm is not None:
+            self._put(cik, jSubm, size, mtime)
+        return jSubm
+
+    # The dict with the columns of the filings: filings.recent, or the whole of an older page
+    @staticmethod
+    def _columns(jSubm):
+        return jSubm['filings']['recent'] if 'filings' in jSubm else jSubm
+
+    def _put(self, cik, jSubm, size, mtime):
+        with self._lock:
+            self._drop(cik)
+            size = size*_parsedSizeRatio
+            self._entries[cik] = (jSubm, size, mtime, time.monotonic(), {})
+            self._keys[id(self._columns(jSubm))] = cik
+            self._size = self._size + size
+            self._evict()
+
+    # Both with the lock held
+    def _drop(self, cik):
+        entry = self._entries.pop(cik, None)
+        if entry is not None:
+            self._size = self._size - entry[1]
+            self._keys.pop(id(self._columns(entry[0])), None)
+
+    def _evict(self):
+        while self._size > submissionsCacheMaxBytes and len(self._entries) > 1:
+            self._drop(next(iter(self._entries)))
+
+    # numpy array with the values of the column name of columns (filings.recent of a submissions file
+    #  returned by get, or an older page). Made the first time, and then kept and counted with the 
+    #  entry. Columns that are not in the cache (anymore) get a new array every time
+    def getArray(self, columns, name):
+        with self._lock:
+            cik = self._keys.get(id(columns))
+            entry = self._entries.get(cik) if cik is not None else None
+            if entry is None or self._columns(entry[0]) is not columns:
+                return np.asarray(columns[name])
+            self._entries.move_to_end(cik)
+            arrays = entry[4]
+            if name not in arrays:
+                arrays[name] = np.asarray(columns[name])
+                self._entries[cik] = entry[:1] + (entry[1] + arrays[name].nbytes,) + entry[2:]
+                self._size = self._size + arrays[name].nbytes
+                self._evict()
+            return arrays[name]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys.clear()
+            self._size = 0
+
+_submissionsCache = _SubmissionsCache()
+
+filingsIndex = None # joroxbrl.filingsIndex.FilingsIndex. See getFilingsIndex
+
+def getFilingsIndex():
+    # If not set explicitly, it's opened from the FILINGS_INDEX_DB environment variable. None if there's no index
+    global filingsIndex
+    if filingsIndex is None and os.getenv('FILINGS_INDEX_DB'):
+        filingsIndex = joroxbrl.filingsIndex.FilingsIndex(os.getenv('FILINGS_INDEX_DB'))
+    return filingsIndex
+
 class Filing:
     """
     Attributes:
@@ -34,9 +139,11 @@ class Filing:
        primaryDocDescription
        filingUrls: joroxbrl.secGov.FilingUrls object
     """
+    __slots__ = ('cik', 'accessionNumber', 'filingDate', 'reportDate', 'acceptanceDateTime', 'act', 'form',
+                 'fileNumber', 'filmNumber', 'items', 'size', 'isXBRL', 'isInlineXBRL', 'primaryDocument',
+                 'primaryDocDescription', 'filingUrls')
+
     _acceptableSubmissionTypes = [ '10-K', '10-Q' ]
-    
-    filingUrls = None
 
     @classmethod
     def correctCIK(cls, cik: str) -> str:
@@ -65,6 +172,7 @@ class Filing:
         self.isInlineXBRL = isInlineXBRL
         self.primaryDocument = primaryDocument
         self.primaryDocDescription = primaryDocDescription
+        self.filingUrls = None
     
     
     @classmethod
@@ -72,25 +180,93 @@ class Filing:
         return cls.getFilingByTypeAndDate(cik, submissionType, None)
 
     @classmethod
+    # Parsed once and kept in memory (see _SubmissionsCache), so the result is shared and must not be modified
     def getSubmission(cls, cik: str):
+        return cls._getSubmissionFile(cik, 'CIK'+cik+'.json')
+
+    @classmethod
+    # One of the older pages of the submissions, listed in filings.files (e.g. CIK0000320193-submissions-001.json).
+    #  Same as getSubmission, but with the columns at the top level instead of in filings.recent
+    def getSubmissionPage(cls, name: str):
+        return cls._getSubmissionFile(name, name)
+
+    @classmethod
+    def _getSubmissionFile(cls, key, name):
+        if submissionsZip:
+            archive = joroxbrl.zipArchive.getArchive(submissionsZip)
+            if name in archive:
+                return _submissionsCache.get(key, archive.signature, lambda: cls._readSubmission(archive, name))
+            # Companies newer than the zip are downloaded
         if submissionsDir:
-            with open(submissionsDir+'CIK'+cik+'.json') as jFile:
-                jSubm = json.load(jFile)
-        else:
-            # We are going to download the submissions
-            url = submissionsUrl+'CIK'+cik+'.json'
-            try:
-                resp = joroxbrl.secGov.SecGovCaller.callSecGovUrl(url)
-                if resp.status_code == 200:
-                    jSubm = resp.json()
-                else:
-                    logging.error('joroxbrl.secFiles.Filing.getSubmission: Could not download company submissions file from '+url)
-                    logging.debug(resp)
-                    jSubm = None
-            except Exception as e:
-                logging.error(e+'\njoroxbrl.secFiles.Filing.getSubmission: Could not download company submissions file for '+cik)
-                jSubm = None
-        return jSubm
+            path = submissionsDir+name
+            return _submissionsCache.get(key, os.stat(path).st_mtime_ns, lambda: cls._loadSubmission(path))
+        return _submissionsCache.get(key, None, lambda: cls._downloadSubmission(name))
+
+    @classmethod
+    def _loadSubmission(cls, path):
+        with open(path, 'rb') as jFile:
+            data = jFile.read()
+        return json.loads(data), len(data)
+
+    @classmethod
+    def _readSubmission(cls, archive, name):
+        data = archive.read(name)
+        return json.loads(data), len(data)
+
+    @classmethod
+    def _downloadSubmission(cls, name):
+        # We are going to download the submissions
+        url = submissionsUrl+name
+        try:
+            resp = joroxbrl.secGov.SecGovCaller.callSecGovUrl(url)
+            if resp.status_code == 200:
+                return resp.json(), len(resp.content)
+            else:
+                logging.error('joroxbrl.secFiles.Filing.getSubmission: Could not download company submissions file from '+url)
+                logging.debug(resp)
+        except Exception as e:
+            logging.error(str(e)+'\njoroxbrl.secFiles.Filing.getSubmission: Could not download company submissions file '+name)
+        return None, 0
+
+    @classmethod
+    # Columns of the filings of the company, newest first: those of filings.recent, and then those of
+    #  each of the older pages, which are only read when the previous ones have been gone through.
+    # reportDate: pages with only filings made before this date are skipped (they can't contain its report)
+    def _iterColumns(cls, cik, jSubms, reportDate=None):
+        yield jSubms['filings']['recent']
+        for page in jSubms['filings'].get('files', []):
+            if reportDate is not None and page.get('filingTo', reportDate) < reportDate:
+                continue
+            columns = cls.getSubmissionPage(page['name'])
+            if columns is None:
+                raise Exception('Could not read '+page['name']+' for '+cik)
+            yield columns
+
+    @classmethod
+    def _fromColumns(cls, cik, columns, idx):
+        return cls(cik,
+            columns['accessionNumber'][idx],
+            columns['filingDate'][idx],
+            columns['reportDate'][idx],
+            columns['acceptanceDateTime'][idx],
+            columns['act'][idx],
+            columns['form'][idx],
+            columns['fileNumber'][idx],
+            columns['filmNumber'][idx],
+            columns['items'][idx],
+            columns['size'][idx],
+            columns['isXBRL'][idx],
+            columns['isInlineXBRL'][idx],
+            columns['primaryDocument'][idx],
+            columns['primaryDocDescription'][idx])
+
+    @classmethod
+    # Filings of the company, newest first, of any of submissionTypes (all of them if None), and XBRL 
+    #  or not (either if None). The older pages of the submissions are only read if the iteration gets there
+    def iterFilings(cls, cik:str, submissionTypes:list[str]=None, isXBRL:bool=None):
+        cik = cls.correctCIK(cik)
+        for columns in cls._iterColumns(cik, cls.getSubmission(cik)):
+            yield from FilingList(cik, columns).filter(forms=submissionTypes, isXBRL=isXBRL)
 
     @classmethod
     def getFilingByTypeAndDate(cls, cik:str, submissionType: str, reportDate: str):
@@ -98,93 +274,68 @@ class Filing:
             print(submissionType+' is not an acceptable submission type')
             return None
         cik = cls.correctCIK(cik)
+        # The index is a snapshot of submissions.zip, so it can't be trusted for the latest filing, 
+        #  only for one of a known period
+        index = getFilingsIndex() if reportDate is not None else None
+        if index is not None:
+            rows = index.query(cik=cik, forms=[submissionType], reportDate=reportDate, limit=1)
+            if rows:
+                return cls(*rows[0])
         jSubms = cls.getSubmission(cik)
 
         # Assume the submissions appear in inverse chronological order
-        found = False
-        for idx, x in enumerate(jSubms['filings']['recent']['form']):
-            if (x == submissionType and 
-                (reportDate is None or jSubms['filings']['recent']['reportDate'][idx]==reportDate)):
-                found = True
-                break
-        if not found:
-            exceptionMessage  = 'Could not find '+submissionType+' for '+cik
-            if reportDate is not None:
-                exceptionMessage = exceptionMessage + ' and ' + reportDate
-            raise Exception(exceptionMessage)
-        
-        return cls(cik,
-            jSubms['filings']['recent']['accessionNumber'][idx],
-            jSubms['filings']['recent']['filingDate'][idx],
-            jSubms['filings']['recent']['reportDate'][idx],
-            jSubms['filings']['recent']['acceptanceDateTime'][idx],
-            jSubms['filings']['recent']['act'][idx],
-            jSubms['filings']['recent']['form'][idx],
-            jSubms['filings']['recent']['fileNumber'][idx],
-            jSubms['filings']['recent']['filmNumber'][idx],
-            jSubms['filings']['recent']['items'][idx],
-            jSubms['filings']['recent']['size'][idx],
-            jSubms['filings']['recent']['isXBRL'][idx],
-            jSubms['filings']['recent']['isInlineXBRL'][idx],
-            jSubms['filings']['recent']['primaryDocument'][idx],
-            jSubms['filings']['recent']['primaryDocDescription'][idx])
+        # A single filing: a plain scan that stops at the first one is faster than filtering them all
+        for columns in cls._iterColumns(cik, jSubms, reportDate):
+            reportDates = columns['reportDate']
+            for idx, x in enumerate(columns['form']):
+                if x == submissionType and (reportDate is None or reportDates[idx]==reportDate):
+                    return cls._fromColumns(cik, columns, idx)
+        exceptionMessage  = 'Could not find '+submissionType+' for '+cik
+        if reportDate is not None:
+            exceptionMessage = exceptionMessage + ' and ' + reportDate
+        raise Exception(exceptionMessage)
         
     @classmethod
     # isXBRL: If TRUE, 
-    def getListFilings(cls, cik:str, submissionTypes:list[str], isXBRL:bool=False):
-        listFilings = []
+    # Returns a FilingList over filings.recent. 
+    # history: also the filings in the older pages of the submissions (still a FilingList, over all of them)
+    def getListFilings(cls, cik:str, submissionTypes:list[str], isXBRL:bool=False, history:bool=False) -> 'FilingList':
         cik = cls.correctCIK(cik)
         jSubms = cls.getSubmission(cik)
-
-        for idx, x in enumerate(jSubms['filings']['recent']['form']):
-            # print(idx, x, x in submissionTypes, jSubms['filings']['recent']['isXBRL'][idx])
-            if (x in submissionTypes and 
-                (isXBRL is None 
-                 or (isXBRL and jSubms['filings']['recent']['isXBRL'][idx]==1)
-                 or (not isXBRL and jSubms['filings']['recent']['isXBRL'][idx]==0))):
-                listFilings.append (
-                    cls(cik,
-                        jSubms['filings']['recent']['accessionNumber'][idx],
-                        jSubms['filings']['recent']['filingDate'][idx],
-                        jSubms['filings']['recent']['reportDate'][idx],
-                        jSubms['filings']['recent']['acceptanceDateTime'][idx],
-                        jSubms['filings']['recent']['act'][idx],
-                        jSubms['filings']['recent']['form'][idx],
-                        jSubms['filings']['recent']['fileNumber'][idx],
-                        jSubms['filings']['recent']['filmNumber'][idx],
-                        jSubms['filings']['recent']['items'][idx],
-                        jSubms['filings']['recent']['size'][idx],
-                        jSubms['filings']['recent']['isXBRL'][idx],
-                        jSubms['filings']['recent']['isInlineXBRL'][idx],
-                        jSubms['filings']['recent']['primaryDocument'][idx],
-                        jSubms['filings']['recent']['primaryDocDescription'][idx]))
-        return listFilings
+        pages = cls._iterColumns(cik, jSubms) if history else [jSubms['filings']['recent']]
+        return FilingList.chain(cik, [FilingList(cik, columns).filter(forms=submissionTypes, isXBRL=isXBRL) for columns in pages])
     
     @classmethod
     def getFilingByAccession(cls, cik:str, accessionNumber:str):
         cik = cls.correctCIK(cik)
+        index = getFilingsIndex()
+        if index is not None:
+            rows = index.query(cik=cik, accessionNumber=accessionNumber)
+            if rows:
+                return cls(*rows[0])
         jSubms = cls.getSubmission(cik)
 
-        for idx, x in enumerate(jSubms['filings']['recent']['accessionNumber']):
-            if x==accessionNumber:
-                return cls(cik,
-                           accessionNumber,
-                           jSubms['filings']['recent']['filingDate'][idx],
-                           jSubms['filings']['recent']['reportDate'][idx],
-                           jSubms['filings']['recent']['acceptanceDateTime'][idx],
-                           jSubms['filings']['recent']['act'][idx],
-                           jSubms['filings']['recent']['form'][idx],
-                           jSubms['filings']['recent']['fileNumber'][idx],
-                           jSubms['filings']['recent']['filmNumber'][idx],
-                           jSubms['filings']['recent']['items'][idx],
-                           jSubms['filings']['recent']['size'][idx],
-                           jSubms['filings']['recent']['isXBRL'][idx],
-                           jSubms['filings']['recent']['isInlineXBRL'][idx],
-                           jSubms['filings']['recent']['primaryDocument'][idx],
-                           jSubms['filings']['recent']['primaryDocDescription'][idx])
+        for columns in cls._iterColumns(cik, jSubms):
+            try:
+                return cls._fromColumns(cik, columns, columns['accessionNumber'].index(accessionNumber))
+            except ValueError:
+                pass
         logging.warning('joroxbrl.secFiles.Filing.getFilingByAccession: Could not find entry for '+cik+' - '+accessionNumber)
                 
                 
+    @classmethod
+    # Filings of all the companies (or only cik) that meet the conditions, from the filings index
+    #  (see joroxbrl.filingsIndex and getFilingsIndex), most recent first. E.g.:
+    #    Filing.queryFilings(forms=['10-K'], isXBRL=True, filingDateFrom='2023-01-01', filingDateTo='2023-12-31')
+    def queryFilings(cls, cik:str=None, forms:list[str]=None, isXBRL:bool=None, filingDateFrom:str=None, 
+                     filingDateTo:str=None, reportDate:str=None, limit:int=None) -> list:
+        index = getFilingsIndex()
+        if index is None:
+            raise Exception('joroxbrl.secFiles.Filing.queryFilings: there is no filings index, set FILINGS_INDEX_DB')
+        rows = index.query(cik=cls.correctCIK(cik) if cik is not None else None, forms=forms, isXBRL=isXBRL, 
+                           reportDate=reportDate, filingDateFrom=filingDateFrom, filingDateTo=filingDateTo, limit=limit)
+        return [cls(*r) for r in rows]
+
     def getPrimaryDocumentUrl(self) -> str:
         url = (secDocAccessUrl+str(int(self.cik))+'/'+
                self.accessionNumber.replace('-', '')+'/'+self.primaryDocument)
@@ -198,18 +349,123 @@ class Filing:
     
     def getFilingUrls(self) -> joroxbrl.secGov.FilingUrls:
         if not self.filingUrls:
-            self.filingUrls = joroxbrl.secGov.FilingUrls(self.getFilingUrl())
+            self.filingUrls = joroxbrl.secGov.FilingUrls(self.getFilingUrl(), self.form, self.primaryDocument)
         return self.filingUrls
 
     def checkDataFiles(self):
         return self.filingUrls.checkDataFiles()
+
+class FilingList:
+    """
+    Read-only list of the filings in the columns of a submissions file (filings.recent, or one of
+    the older pages), or of several of them one after the other (see chain), in the same order. 
+    The Filing objects are taken from the columns as they are, and only when they're accessed. 
+    Filtering uses numpy arrays of the columns, which are made once for each submissions file and
+    kept with it (see _SubmissionsCache.getArray).
+    indexes: numpy array with the positions in the columns of the filings in the list. All of them if None
+    """
+    __slots__ = ('cik', 'parts')
+
+    def __init__(self, cik: str, columns: dict, indexes=None):
+        self.cik = cik
+        self.parts = [(columns, indexes)] # (columns, indexes or None for all of them), one per submissions file
+
+    # A single FilingList with the filings of each of lists (of the same company), one after the other
+    @classmethod
+    def chain(cls, cik: str, lists: list) -> 'FilingList':
+        return cls._fromParts(cik, [part for l in lists for part in l.parts])
+
+    @classmethod
+    def _fromParts(cls, cik, parts):
+        result = cls.__new__(cls)
+        result.cik = cik
+        result.parts = parts
+        return result
+
+    @staticmethod
+    def _length(columns, indexes):
+        return len(columns.get('accessionNumber', [])) if indexes is None else len(indexes)
+
+    @staticmethod
+    def _indexes(columns, indexes):
+        return indexes if indexes is not None else np.arange(FilingList._length(columns, None))
+
+    def __len__(self):
+        return sum(self._length(columns, indexes) for columns, indexes in self.parts)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            if len(self.parts) == 1:
+                columns, indexes = self.parts[0]
+                return self._fromParts(self.cik, [(columns, self._indexes(columns, indexes)[i])])
+            # Positions in the whole list, split in runs of the same part
+            offsets = np.cumsum([0] + [self._length(*part) for part in self.parts])
+            positions = np.arange(offsets[-1])[i]
+            partOf = np.searchsorted(offsets, positions, side='right') - 1
+            parts = []
+            for run in np.split(np.arange(len(positions)), np.flatnonzero(np.diff(partOf)) + 1):
+                if len(run):
+                    k = partOf[run[0]]
+                    columns, indexes = self.parts[k]
+                    parts.append((columns, self._indexes(columns, indexes)[positions[run] - offsets[k]]))
+            return self._fromParts(self.cik, parts)
+        position = range(len(self))[i]
+        for columns, indexes in self.parts:
+            n = self._length(columns, indexes)
+            if position < n:
+                return Filing._fromColumns(self.cik, columns, position if indexes is None else int(indexes[position]))
+            position = position - n
+
+    def __iter__(self):
+        for columns, indexes in self.parts:
+            for idx in (range(self._length(columns, None)) if indexes is None else indexes.tolist()):
+                yield Filing._fromColumns(self.cik, columns, idx)
+
+    # numpy array with the values of a column (e.g. 'filingDate') for the filings in the list
+    def column(self, name: str):
+        values = [_submissionsCache.getArray(columns, name) if indexes is None 
+                  else _submissionsCache.getArray(columns, name)[indexes] for columns, indexes in self.parts]
+        if len(values) == 1:
+            return values[0]
+        return np.concatenate(values) if values else np.array([])
+
+    # FilingList with only the filings that meet all the conditions. forms: list of form types.
+    #  isXBRL: True, False or None for either. Dates as 'YYYY-MM-DD', both ends included
+    def filter(self, forms: list[str]=None, isXBRL: bool=None, filingDateFrom: str=None, 
+               filingDateTo: str=None, reportDate: str=None) -> 'FilingList':
+        if not len(self):
+            return self
+        mask = np.ones(len(self), dtype=bool)
+        if forms is not None:
+            formColumn = self.column('form')
+            formMask = np.zeros(len(self), dtype=bool)
+            for form in forms: # Usually one or two, faster than np.isin
+                formMask |= formColumn == form
+            mask &= formMask
+        if isXBRL is not None:
+            mask &= self.column('isXBRL') == (1 if isXBRL else 0)
+        if filingDateFrom is not None:
+            mask &= self.column('filingDate') >= filingDateFrom
+        if filingDateTo is not None:
+            mask &= self.column('filingDate') <= filingDateTo
+        if reportDate is not None:
+            mask &= self.column('reportDate') == reportDate
+        parts, start = [], 0
+        for columns, indexes in self.parts:
+            n = self._length(columns, indexes)
+            parts.append((columns, self._indexes(columns, indexes)[mask[start:start+n]]))
+            start = start + n
+        return self._fromParts(self.cik, parts)
     
 def getFactsActualGlobal(cik: str, facts: list[str]) -> dict:
     # # First we are going to identify the document we are interested in, 
     # #  and the period, using the submissions file
     filing = Filing.getLatestFiling(cik, '10-K')
     
-    if companyfactsDir:
+    data = joroxbrl.zipArchive.getArchive(companyfactsZip).read('CIK'+filing.cik+'.json') if companyfactsZip else None
+    if data is not None:
+        jFacts = json.loads(data)
+    elif companyfactsDir:
         with open(companyfactsDir+'CIK'+filing.cik+'.json') as jFile:
             jFacts = json.load(jFile)
     else:
@@ -13,26 +13,130 @@ import datetime
 import time
 import os
 import re
+import asyncio
+import threading
+import concurrent.futures
+import email.utils
+import tempfile
+import weakref
+import xml.etree.ElementTree as ET
+import joroxbrl.filingCache
+import joroxbrl.httpCache
+import joroxbrl.rateLimit
+import joroxbrl.edgarMirror
+import joroxbrl.telemetry
+import joroxbrl.replay
 
 _baseUrl = 'https://www.sec.gov'
 hostRegex = re.compile(r'^(https?://)?(([^\.]+\.)?sec\.gov)(/.*)?$')
+reRenderedFile = re.compile(r'^r\d+\.xml$') # R1.xml, R2.xml... are the rendered financial statements
+
+snapshotCache = None # joroxbrl.filingCache.FilingSnapshotCache used by FilingUrls. See getSnapshotCache
+
+def getSnapshotCache():
+    # If not set explicitly, it's created from the SNAPSHOT_CACHE_DIR (and SNAPSHOT_CACHE_MAX_MB) environment variables
+    global snapshotCache
+    if snapshotCache is None and os.getenv('SNAPSHOT_CACHE_DIR'):
+        snapshotCache = joroxbrl.filingCache.FilingSnapshotCache(
+            os.getenv('SNAPSHOT_CACHE_DIR'), int(os.getenv('SNAPSHOT_CACHE_MAX_MB', '2048'))*1024**2)
+    return snapshotCache
+
+responseCache = None # joroxbrl.httpCache.ResponseCache used by SecGovCaller. See getResponseCache
+
+def getResponseCache():
+    # If not set explicitly, it's created from the SEC_CACHE_DIR (and SEC_CACHE_MAX_MB) environment variables
+    global responseCache
+    if responseCache is None and os.getenv('SEC_CACHE_DIR'):
+        responseCache = joroxbrl.httpCache.ResponseCache(
+            os.getenv('SEC_CACHE_DIR'), int(os.getenv('SEC_CACHE_MAX_MB', '4096'))*1024**2)
+    return responseCache
+
+# Retry-After can be either a number of seconds or an HTTP date. Returns seconds, or None
+def _parseRetryAfter(value):
+    if not value:
+        return None
+    try:
+        return max(0, float(value))
+    except ValueError:
+        pass
+    try:
+        d = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if d.tzinfo is None:
+        d = d.replace(tzinfo=datetime.timezone.utc)
+    return max(0, (d - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
+edgarMirror = None # joroxbrl.edgarMirror.EdgarMirror used by SecGovCaller. See getEdgarMirror
+
+def getEdgarMirror():
+    # If not set explicitly, it's opened from the EDGAR_MIRROR environment variable (a folder or a tarball)
+    global edgarMirror
+    if edgarMirror is None and os.getenv('EDGAR_MIRROR'):
+        edgarMirror = joroxbrl.edgarMirror.openMirror(os.getenv('EDGAR_MIRROR'))
+    return edgarMirror
+
+maxDownloadBytes = None # Limit for SecGovCaller.iterSecGovUrl. See getMaxDownloadBytes
+
+def getMaxDownloadBytes():
+    # If not set explicitly, it's taken from the SEC_MAX_DOWNLOAD_MB environment variable. None means no limit
+    if maxDownloadBytes is None and os.getenv('SEC_MAX_DOWNLOAD_MB'):
+        return int(float(os.getenv('SEC_MAX_DOWNLOAD_MB'))*1024**2)
+    return maxDownloadBytes
+
+# Bytes of the body of resp received from the network so far (compressed, if it was)
+def _wireBytes(resp):
+    try:
+        return resp.raw.tell()
+    except (AttributeError, OSError, ValueError):
+        return len(resp._content) if isinstance(resp._content, bytes) else 0
 
 class SecGovCaller:
+    # The limit of calls per second is in joroxbrl.rateLimit.hostLimits
     
-    _SecGov_lastCall = datetime.datetime.today() - datetime.timedelta(minutes=1)
-    _SecGov_Delta = datetime.timedelta(milliseconds=100) # sec.gov doesn't like it when we call more than 10 times per second
+    _callLock = threading.Lock()
+    _maxConnections = 16 # Size of the connection pool, for calls from several threads (see AsyncSecGovCaller)
     
     _session = None
+    _inFlight = None # SingleFlight, see callSecGovUrl. Set after the class
+
+    _maxRetries = 5 # For 429 and 503 responses. Connection errors are retried by urllib3
+    _retryBackoff = 2 # Seconds to wait for the first retry if there's no Retry-After, doubled each time
+    _maxRetryAfter = 900
     
     @classmethod
-    def callSecGovUrl(cls, url:str) -> requests.Response:
+    # stream: passed on to requests, so that the body can be consumed as it arrives
+    # If there is a local mirror of the archives (see getEdgarMirror), the documents of the filings 
+    #  in it are read from there.
+    # If there is a response cache (see getResponseCache), documents inside filings are returned from 
+    #  it without calling sec.gov, and the rest of the URLs are revalidated.
+    # maxBytes: if the response is known to be bigger than this (Content-Length, or while it's written 
+    #  to the response cache), an exception is raised. See also iterSecGovUrl
+    # Concurrent calls (from other threads, or AsyncSecGovCaller) for the same URL without stream
+    #  share a single request to sec.gov, and each of them gets its own copy of the response
+    def callSecGovUrl(cls, url:str, stream:bool=False, maxBytes:int=None) -> requests.Response:
+        if stream:
+            return cls._callSecGovUrl(url, stream, maxBytes)
+        resp, shared = cls._inFlight.do((url, maxBytes), lambda: cls._callSecGovUrl(url, stream, maxBytes))
+        if shared:
+            hostMatch = hostRegex.match(url)
+            joroxbrl.telemetry.telemetry.recordCache(hostMatch.group(2) if hostMatch else 'www.sec.gov', 
+                                                     joroxbrl.telemetry.endpointClass(url), 'coalesced')
+            resp = joroxbrl.httpCache.makeResponse(resp.url, resp.content, dict(resp.headers), resp.status_code, resp.encoding)
+        return resp
+
+    @classmethod
+    def _callSecGovUrl(cls, url:str, stream:bool, maxBytes:int) -> requests.Response:
         if cls._session is None:
-            # Prepare request retries
-            cls._session = requests.Session()
-            retry = Retry(connect=3, backoff_factor=0.5)
-            adapter = HTTPAdapter(max_retries=retry)
-            cls._session.mount('http://', adapter)
-            cls._session.mount('https://', adapter)
+            with cls._callLock:
+                if cls._session is None:
+                    # Prepare request retries
+                    session = requests.Session()
+                    retry = Retry(connect=3, backoff_factor=0.5)
+                    adapter = HTTPAdapter(max_retries=retry, pool_maxsize=cls._maxConnections)
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    cls._session = joroxbrl.replay.wrapSession(session) # Same session, unless recording or replaying
 
         hostMatch = hostRegex.match(url)
         if hostMatch is None:
@@ -41,22 +145,241 @@ class SecGovCaller:
             # We don't apply the call limit if the URL is not sec.gov
         else:
             host = hostMatch.group(2)
-            cls._callLimit()
 
-        return cls._session.get(url, headers={
-                "User-agent": os.getenv('SEC_USER_AGENT'),
-                "Accept-Encoding": "gzip, deflate",
-                "Host": host
-            })
+        headers = {
+            "User-agent": os.getenv('SEC_USER_AGENT'),
+            "Accept-Encoding": "gzip, deflate",
+            "Host": host
+        }
+        telemetry = joroxbrl.telemetry.telemetry
+        endpoint = joroxbrl.telemetry.endpointClass(url)
+        mirror = getEdgarMirror() if hostMatch is not None else None
+        if mirror is not None:
+            resp = mirror.get(url, stream)
+            if resp is not None:
+                telemetry.recordCache(host, endpoint, 'mirror')
+                return resp
+
+        cache = getResponseCache() if hostMatch is not None else None
+        cached = None
+        if cache is not None:
+            cached = cache.get(url)
+            if cached is not None:
+                if cached.isImmutable():
+                    telemetry.recordCache(host, endpoint, 'hit')
+                    return cache.toResponse(cached, stream)
+                headers.update(cache.validationHeaders(cached))
+
+        resp = cls._get(url, headers, stream, host if hostMatch is not None else None)
+        if maxBytes is not None and int(resp.headers.get('Content-Length', 0)) > maxBytes and 'Content-Encoding' not in resp.headers:
+            resp.close()
+            raise Exception('Response from '+url+' is bigger than '+str(maxBytes)+' bytes')
+
+        if cache is not None:
+            if resp.status_code == 304 and cached is not None:
+                resp.close()
+                telemetry.recordCache(host, endpoint, 'revalidated')
+                return cache.toResponse(cached, stream)
+            telemetry.recordCache(host, endpoint, 'miss')
+            if resp.status_code == 200:
+                try:
+                    entry = cache.put(url, resp, maxBytes)
+                finally:
+                    resp.close()
+                if stream: # Otherwise, already counted by _get
+                    telemetry.recordBytes(host, endpoint, _wireBytes(resp))
+                return cache.toResponse(entry, stream)
+        return resp
     
     @classmethod
-    def _callLimit(cls):
+    # GETs are idempotent, so when sec.gov throttles us (429, 503) we slow down (see 
+    #  joroxbrl.rateLimit.AdaptiveRate), wait for as long as it asks, and try again.
+    # host: None if the URL is not sec.gov, and there's no rate limit
+    def _get(cls, url:str, headers:dict, stream:bool, host:str) -> requests.Response:
+        controller = joroxbrl.rateLimit.getController(host) if host is not None else None
+        telemetry = joroxbrl.telemetry.telemetry
+        endpoint = joroxbrl.telemetry.endpointClass(url)
+        transport = joroxbrl.replay.getTransport()
+        for attempt in range(cls._maxRetries+1):
+            if host is not None and (transport is None or transport.applyRateLimits()):
+                cls._callLimit(host)
+            start = time.perf_counter()
+            resp = cls._session.get(url, headers=headers, stream=stream)
+            # With stream, the time until the headers arrive, and the bytes are counted when the body is read
+            telemetry.recordRequest(headers['Host'], endpoint, time.perf_counter()-start, resp.status_code, 
+                                    0 if stream else _wireBytes(resp))
+            if resp.status_code not in (429, 503):
+                if controller is not None:
+                    controller.onSuccess()
+                return resp
+            retryAfter = _parseRetryAfter(resp.headers.get('Retry-After'))
+            if retryAfter is not None:
+                retryAfter = min(retryAfter, cls._maxRetryAfter)
+            else:
+                retryAfter = cls._retryBackoff * 2**attempt
+            if controller is not None:
+                controller.onThrottle(retryAfter)
+            if attempt == cls._maxRetries:
+                break
+            logging.warning(f'{resp.status_code} from {url}, retrying in {retryAfter} seconds')
+            telemetry.recordRetry(headers['Host'], endpoint)
+            resp.close()
+            if controller is None:
+                time.sleep(retryAfter) # Otherwise the pause is in the rate limit
+        return resp
+
+    # Body of the response to url, decompressed, in chunks of up to chunkSize bytes, without ever
+    #  having it whole in memory. Raises an exception if the status is not 200 or the body is bigger 
+    #  than maxBytes (by default, maxDownloadBytes)
+    @classmethod
+    def iterSecGovUrl(cls, url:str, chunkSize:int=65536, maxBytes:int=None):
+        if maxBytes is None:
+            maxBytes = getMaxDownloadBytes()
+        resp = cls.callSecGovUrl(url, stream=True, maxBytes=maxBytes)
+        try:
+            if resp.status_code != 200:
+                raise Exception(f'{resp.status_code} downloading {url}')
+            total = 0
+            for chunk in resp.iter_content(chunkSize):
+                total = total + len(chunk)
+                if maxBytes is not None and total > maxBytes:
+                    raise Exception('Response from '+url+' is bigger than '+str(maxBytes)+' bytes')
+                yield chunk
+        finally:
+            if not getattr(resp, 'fromCache', False):
+                hostMatch = hostRegex.match(url)
+                joroxbrl.telemetry.telemetry.recordBytes(hostMatch.group(2) if hostMatch else 'www.sec.gov', 
+                                                         joroxbrl.telemetry.endpointClass(url), _wireBytes(resp))
+            resp.close()
+
+    # Writes the body of the response to url into path (by default a new temporary file, which the
+    #  caller has to remove), and returns path. Same limits as iterSecGovUrl
+    @classmethod
+    def downloadSecGovUrl(cls, url:str, path:str=None, maxBytes:int=None) -> str:
+        if path is None:
+            fd, path = tempfile.mkstemp(suffix=os.path.splitext(url.split('?')[0])[1], prefix='joroxbrl-')
+            f = os.fdopen(fd, 'wb')
+        else:
+            f = open(path, 'wb')
+        try:
+            with f:
+                for chunk in cls.iterSecGovUrl(url, maxBytes=maxBytes):
+                    f.write(chunk)
+        except BaseException:
+            os.remove(path)
+            raise
+        return path
+
+    # Current requests per second allowed to host, after the adjustments for throttling
+    @classmethod
+    def getEffectiveRate(cls, host:str='www.sec.gov') -> float:
+        return joroxbrl.rateLimit.getController(host).effectiveRate
+
+    @classmethod
+    def _callLimit(cls, host:str='www.sec.gov'):
         # Maintain control of how many calls we are doing
-        while (cls._SecGov_lastCall+cls._SecGov_Delta > datetime.datetime.today()):
-            time.sleep( cls._SecGov_Delta.total_seconds()/2 ) # Wait for half the duration of the delta
-        cls._SecGov_lastCall = datetime.datetime.today()
+        # The token bucket is shared with the other threads and with the other processes, and the 
+        #  waiting is done outside of its lock, so calls from several threads don't wait for each other's responses
+        wait = joroxbrl.rateLimit.getBucket(host).acquire()
+        joroxbrl.telemetry.telemetry.recordWait(host, wait)
+
+    @classmethod
+    # Synchronous version of AsyncSecGovCaller.getMany, for scripts that just need a batch of URLs. 
+    #  Can't be used from inside a running event loop (use AsyncSecGovCaller there)
+    def callSecGovUrls(cls, urls:list, maxConcurrency:int=8, returnExceptions:bool=False, maxBytes:int=None) -> list:
+        async def _getMany():
+            async with AsyncSecGovCaller(maxConcurrency) as caller:
+                return await caller.getMany(urls, returnExceptions=returnExceptions, maxBytes=maxBytes)
+        return asyncio.run(_getMany())
+
+
+class SingleFlight:
+    """
+    do(key, fn) calls fn, unless there's already a call for the same key in progress in another 
+    thread, in which case it waits for it and returns its result (or raises its exception).
+    Returns (result, shared), with shared True for the callers that didn't make the call themselves.
+    """
+
+    class _Call:
+        __slots__ = ('event', 'result', 'error')
+
+        def __init__(self):
+            self.event = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = fn()
+        except BaseException as ex:
+            call.error = ex
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result, False
+
+SecGovCaller._inFlight = SingleFlight()
+
+
+class AsyncSecGovCaller:
+    """
+    asyncio client for sec.gov. Each request behaves exactly like SecGovCaller.callSecGovUrl 
+    (User-agent, host detection, response cache), and is done by it in a pool of maxConcurrency
+    threads, so there can be that many requests in flight at the same time. They all share 
+    SecGovCaller's rate limit, also with the synchronous calls made at the same time.
+
+        async with AsyncSecGovCaller() as caller:
+            responses = await caller.getMany(urls)
+    """
+
+    def __init__(self, maxConcurrency:int=8):
+        self.maxConcurrency = min(maxConcurrency, SecGovCaller._maxConnections)
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.maxConcurrency, thread_name_prefix='secGov')
+
+    async def get(self, url:str, stream:bool=False, maxBytes:int=None) -> requests.Response:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, SecGovCaller.callSecGovUrl, url, stream, maxBytes)
+
+    # Responses in the same order as urls. If returnExceptions, a failed request returns its 
+    #  exception in its position, instead of raising it
+    async def getMany(self, urls:list, returnExceptions:bool=False, maxBytes:int=None) -> list:
+        return await asyncio.gather(*(self.get(url, maxBytes=maxBytes) for url in urls), return_exceptions=returnExceptions)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, excType, exc, tb):
+        self.close()
         
 
+# Removes the temporary files that are still there, e.g. those of a FilingUrls that goes away
+def _removeFiles(paths):
+    for path in paths.values():
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
 class FilingUrls:
     """
     Attributes:
@@ -69,6 +392,10 @@ class FilingUrls:
         
         presentationLinkbase: joroxbrl.presentationLinkbase.PresentationLinkbase object
         xbrl: joroxbrl.core.XBRL object
+
+    If there is a snapshot cache (see getSnapshotCache), everything downloaded and parsed for the 
+    filing is stored there, and later FilingUrls for the same accession are built from it, 
+    without calling sec.gov.
     """
     _mainFormType = { 'Form 10-K': '10-K',
                       'Form 10-Q': '10-Q' }
@@ -77,10 +404,44 @@ class FilingUrls:
     presentationLinkbase = None
     xbrl = None
 
-    def __init__(self, filingRootUrl):
+    # form, primaryDocument: if known (e.g. from the submissions file, see joroxbrl.secFiles.Filing), 
+    #  the documents are found in the index.json of the filing folder, which is much lighter than the
+    #  html index. Otherwise, or if that fails, the html index is used
+    def __init__(self, filingRootUrl, form:str=None, primaryDocument:str=None):
         logging.debug('Initializing FilingUrls for '+filingRootUrl)
         self.filingRootUrl = filingRootUrl
+        self._accession = joroxbrl.filingCache.accessionKey(filingRootUrl)
+        self._prefetched = {} # url -> temporary file with the instance document downloaded by prefetch
+        self._snapshotDirty = False # Whether _snapshot has changes that are not in the cache yet
 
+        cache = getSnapshotCache()
+        snapshot = cache.get(self._accession) if cache is not None and self._accession is not None else None
+        if snapshot is not None:
+            logging.debug('FilingUrls for '+filingRootUrl+' taken from the snapshot cache')
+            self.mainFormType = snapshot['mainFormType']
+            if snapshot['mainDocumentUrl'] is not None:
+                self.mainDocumentUrl = snapshot['mainDocumentUrl']
+            self.dataFileUrls = snapshot['dataFileUrls']
+            self._snapshot = snapshot
+        else:
+            directoryRead = False
+            if form in self._mainFormType.values():
+                try:
+                    self._readDirectoryIndex(form, primaryDocument)
+                    directoryRead = True
+                except Exception as ex:
+                    logging.warning('Could not use index.json for '+filingRootUrl+', trying the html index: '+str(ex))
+            if not directoryRead:
+                self._readFilingIndex()
+            self._snapshot = { 'mainFormType': self.mainFormType,
+                               'mainDocumentUrl': getattr(self, 'mainDocumentUrl', None),
+                               'dataFileUrls': self.dataFileUrls,
+                               'documents': {}, # url -> text
+                               'xsdNamespaces': {} } # xsd url -> targetNamespace
+            self._snapshotDirty = True # Written by the first of prefetch, getXbrl or getPresentationLinkbase
+
+    def _readFilingIndex(self):
+        filingRootUrl = self.filingRootUrl
         r = SecGovCaller.callSecGovUrl(filingRootUrl)
         soup = BeautifulSoup(r.text, features='html.parser')
         formName = soup.find('div', id='formName').strong.text
@@ -105,6 +466,119 @@ class FilingUrls:
                             break
     
         self.dataFileUrls = dataFileUrls
+
+    # Type of each data file, from its name, as in the html index. The instance of a non-inline
+    #  filing (EX-101.INS) can't be told from its name alone, see _readDirectoryIndex
+    @staticmethod
+    def _dataFileType(name):
+        lower = name.lower()
+        if lower.endswith('_cal.xml'): return 'EX-101.CAL'
+        if lower.endswith('_pre.xml'): return 'EX-101.PRE'
+        if lower.endswith('_lab.xml'): return 'EX-101.LAB'
+        if lower.endswith('_def.xml'): return 'EX-101.DEF'
+        if lower.endswith('.xsd'): return 'EX-101.SCH'
+        if lower.endswith('_htm.xml'): return 'XML' # Instance extracted from the inline XBRL
+        return None
+
+    # xml files that are not data files of a known type, nor the ones sec.gov adds to every filing
+    @classmethod
+    def _isOtherXml(cls, name):
+        lower = name.lower()
+        return (lower.endswith('.xml') and cls._dataFileType(name) is None and not reRenderedFile.match(lower) 
+                and lower not in ('filingsummary.xml', 'primary_doc.xml'))
+
+    def _readDirectoryIndex(self, form, primaryDocument):
+        folderUrl = self.filingRootUrl.rsplit('/', 1)[0]
+        r = SecGovCaller.callSecGovUrl(folderUrl+'/index.json')
+        r.raise_for_status()
+        directory = r.json()['directory']
+        baseUrl = _baseUrl + directory['name'].rstrip('/') + '/'
+        self.mainFormType = form
+        if primaryDocument:
+            self.mainDocumentUrl = baseUrl + primaryDocument
+
+        # Anything we can't be sure about raises, so that the html index (with the type of each 
+        #  document) is used instead
+        names = [item['name'] for item in directory['item']]
+        dataFileUrls = {}
+        for name in names:
+            dataf = self._dataFileType(name)
+            if dataf in self._dataFileTypes:
+                if dataf in dataFileUrls:
+                    raise Exception('More than one '+dataf+' in '+folderUrl)
+                dataFileUrls[dataf] = baseUrl + name
+        # The instance of a non-inline filing is named as the xsd: <prefix>-<date>.xml
+        xsd = dataFileUrls.get('EX-101.SCH')
+        instance = xsd[len(baseUrl):-len('.xsd')]+'.xml' if xsd is not None else None
+        if instance in names:
+            dataFileUrls['EX-101.INS'] = baseUrl + instance
+        elif 'XML' not in dataFileUrls and any(self._isOtherXml(n) for n in names):
+            raise Exception('Could not tell which is the instance document in '+folderUrl)
+        self.dataFileUrls = dataFileUrls
+
+    # Downloads at the same time all the data files that will be needed (instance, presentation and
+    #  calculation linkbases and xsd), instead of one by one as they are used. Those already in the
+    #  snapshot cache are not downloaded again. The instance goes to a temporary file, parsed (and
+    #  removed) by getXbrl, so it's never whole in memory. All of them are subject to 
+    #  getMaxDownloadBytes; one that is bigger is left for later, and fails then
+    def prefetch(self, maxConcurrency:int=4):
+        maxBytes = getMaxDownloadBytes()
+        instanceUrl = None
+        if not self.xbrl:
+            cache = getSnapshotCache()
+            if cache is None or self._accession is None or cache.get(self._accession, 'xbrl') is None:
+                instanceUrl = self.getXbrlUrl() or self.dataFileUrls.get('EX-101.INS')
+                if instanceUrl in self._prefetched:
+                    instanceUrl = None
+        urls = [url for url in (self.getPresentationLinkbaseUrl(), self.getCalculationLinkbaseUrl(), self.getXsdUrl())
+                if url is not None and url not in self._snapshot['documents']]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            download = executor.submit(SecGovCaller.downloadSecGovUrl, instanceUrl, maxBytes=maxBytes) if instanceUrl is not None else None
+            responses = SecGovCaller.callSecGovUrls(urls, maxConcurrency=maxConcurrency, returnExceptions=True, maxBytes=maxBytes) if urls else []
+        for url, resp in zip(urls, responses):
+            if isinstance(resp, Exception) or resp.status_code != 200:
+                logging.warning('FilingUrls.prefetch: could not download '+url+': '+str(resp))
+            else:
+                self._snapshot['documents'][url] = resp.text
+                self._snapshotDirty = True
+        if download is not None:
+            if download.exception() is not None:
+                logging.warning('FilingUrls.prefetch: could not download '+instanceUrl+': '+str(download.exception()))
+            else:
+                if not self._prefetched: # The files are removed if getXbrl is never called
+                    weakref.finalize(self, _removeFiles, self._prefetched)
+                self._prefetched[instanceUrl] = download.result()
+        self._saveSnapshot() # Once for all the documents
+
+    # Writes the snapshot to the cache, if it has changed. The whole of it is rewritten (linkbases 
+    #  included), so it's only done at the end of each step, not for every document
+    def _saveSnapshot(self):
+        cache = getSnapshotCache()
+        if self._snapshotDirty and cache is not None and self._accession is not None:
+            cache.put(self._accession, self._snapshot)
+        self._snapshotDirty = False
+
+    # Text of one of the documents of the filing (linkbases, xsd...). It's only downloaded once, 
+    #  and kept in the snapshot
+    def getDocumentText(self, url):
+        documents = self._snapshot['documents']
+        if url not in documents: # Not prefetched
+            documents[url] = SecGovCaller.callSecGovUrl(url, maxBytes=getMaxDownloadBytes()).text
+            self._snapshotDirty = True
+            self._saveSnapshot()
+        return documents[url]
+
+    # targetNamespace of the xsd. Kept in the snapshot, so that the presentation tree can be built
+    #  without downloading the xsds again
+    def getNamespaceFromXsd(self, xsdUrl):
+        namespaces = self._snapshot['xsdNamespaces']
+        if xsdUrl not in namespaces:
+            if xsdUrl == self.getXsdUrl():
+                namespaces[xsdUrl] = ET.fromstring(self.getDocumentText(xsdUrl)).get('targetNamespace')
+            else: # Taxonomies (us-gaap, dei...)
+                namespaces[xsdUrl] = joroxbrl.presentationLinkbase.getNamespaceFromXsd(xsdUrl)
+            self._snapshotDirty = True # Saved by getPresentationLinkbase, that's where they're used
+        return namespaces[xsdUrl]
         
     def checkDataFiles(self):
         if len(self.dataFileUrls)==4: return True
@@ -137,15 +611,30 @@ class FilingUrls:
     def getPresentationLinkbase(self):
         if not self.presentationLinkbase:
             self.presentationLinkbase = joroxbrl.presentationLinkbase.PresentationLinkbase(self)
-            self.presentationLinkbase.readXmlUrl(self.getPresentationLinkbaseUrl())
+            self.presentationLinkbase.readXml(self.getDocumentText(self.getPresentationLinkbaseUrl()))
+            self._saveSnapshot()
         return self.presentationLinkbase
     
     def getXbrl(self):
         if not self.xbrl:
+            cache = getSnapshotCache()
+            snapshot = cache.get(self._accession, 'xbrl') if cache is not None and self._accession is not None else None
+            if snapshot is not None:
+                self.xbrl = joroxbrl.core.XBRL.fromSnapshot(snapshot)
+                return self.xbrl
+            
             self.xbrl = joroxbrl.core.XBRL()
-            if 'XML' in self.dataFileUrls:
-                self.xbrl.readXmlUrl(self.dataFileUrls['XML'])
-            elif 'EX-101.INS' in self.dataFileUrls:
-                self.xbrl.readXmlUrl(self.dataFileUrls['EX-101.INS'])
+            instanceUrl = self.dataFileUrls.get('XML') or self.dataFileUrls.get('EX-101.INS')
+            if instanceUrl in self._prefetched:
+                path = self._prefetched.pop(instanceUrl)
+                try:
+                    self.xbrl.readXmlStream(path)
+                finally:
+                    os.remove(path)
+            elif instanceUrl is not None:
+                self.xbrl.readXmlUrl(instanceUrl, stream=True)
+            if cache is not None and self._accession is not None:
+                cache.put(self._accession, self.xbrl.toSnapshot(), 'xbrl')
+            self._saveSnapshot()
         return self.xbrl
             
\ No newline at end of file
@@ -0,0 +1,185 @@
+# Metrics of all the calls to external services (sec.gov through joroxbrl.secGov.SecGovCaller, and
+#  Polygon through joroxbrl.metrics.PolygonCaller), per host and per endpoint class: latency,
+#  bytes, time waiting for the rate limit, retries, status codes and response cache hits.
+# At the end of a run they can be exported with toJson / toPrometheus, or written automatically
+#  to the file in the TELEMETRY_FILE environment variable (Prometheus text format if it ends in
+#  .prom, JSON otherwise).
+import re
+import os
+import json
+import bisect
+import atexit
+import threading
+import logging
+
+log = logging.getLogger('joroxbrl.telemetry')
+
+# Upper bounds of the latency buckets, in seconds
+latencyBuckets = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Endpoint classes, by the first regex that matches the URL
+_endpointClasses = [
+    ('archives-index', re.compile(r'/Archives/edgar/data/\d+/\d{18}/(index\.json|[^/]*-index\.html?)$')),
+    ('archives', re.compile(r'/Archives/edgar/')),
+    ('submissions', re.compile(r'data\.sec\.gov/submissions/')),
+    ('companyfacts', re.compile(r'data\.sec\.gov/api/xbrl/')),
+    ('cgi-bin', re.compile(r'/cgi-bin/')),
+    ('files', re.compile(r'sec\.gov/files/')),
+]
+
+def endpointClass(url: str) -> str:
+    for name, regex in _endpointClasses:
+        if regex.search(url):
+            return name
+    return 'other'
+
+
+class Histogram:
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0]*(len(latencyBuckets)+1) # The last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(latencyBuckets, value)] += 1
+        self.sum = self.sum + value
+        self.count = self.count + 1
+
+    def toDict(self):
+        return { 'buckets': dict(zip([str(b) for b in latencyBuckets]+['+Inf'], self.counts)),
+                 'sum': self.sum, 'count': self.count }
+
+
+class Telemetry:
+    """
+    All the counters are keyed by (host, endpoint class), except for the waits for the rate
+    limit, which are per host.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.latency = {} # (host, endpoint) -> Histogram of the requests that went to the network
+            self.statuses = {} # (host, endpoint, status) -> count
+            self.bytes = {} # (host, endpoint) -> bytes of the bodies received
+            self.retries = {} # (host, endpoint) -> count
+            self.cache = {} # (host, endpoint, result) -> count. result: hit, revalidated, miss, mirror
+            self.waitSeconds = {} # host -> seconds blocked by the rate limit
+            self.waits = {} # host -> number of calls that went through the rate limit
+
+    def recordRequest(self, host, endpoint, seconds, status, nBytes=0):
+        with self._lock:
+            key = (host, endpoint)
+            if key not in self.latency:
+                self.latency[key] = Histogram()
+            self.latency[key].observe(seconds)
+            skey = (host, endpoint, str(status))
+            self.statuses[skey] = self.statuses.get(skey, 0) + 1
+            if nBytes:
+                self.bytes[key] = self.bytes.get(key, 0) + nBytes
+
+    def recordBytes(self, host, endpoint, nBytes):
+        with self._lock:
+            self.bytes[(host, endpoint)] = self.bytes.get((host, endpoint), 0) + nBytes
+
+    def recordRetry(self, host, endpoint):
+        with self._lock:
+            self.retries[(host, endpoint)] = self.retries.get((host, endpoint), 0) + 1
+
+    def recordCache(self, host, endpoint, result):
+        with self._lock:
+            key = (host, endpoint, result)
+            self.cache[key] = self.cache.get(key, 0) + 1
+
+    def recordWait(self, host, seconds):
+        with self._lock:
+            self.waitSeconds[host] = self.waitSeconds.get(host, 0) + seconds
+            self.waits[host] = self.waits.get(host, 0) + 1
+
+    # Everything as a dict, grouped by host and endpoint class
+    def summary(self) -> dict:
+        with self._lock:
+            res = {}
+            def _endpoint(host, endpoint):
+                return res.setdefault(host, {'waitSeconds': 0, 'waits': 0, 'endpoints': {}})['endpoints'].setdefault(endpoint,
+                    {'requests': 0, 'latency': None, 'statuses': {}, 'bytes': 0, 'retries': 0, 'cache': {}, 'cacheHitRatio': None})
+            for (host, endpoint), h in self.latency.items():
+                e = _endpoint(host, endpoint)
+                e['requests'] = h.count
+                e['latency'] = h.toDict()
+            for (host, endpoint, status), n in self.statuses.items():
+                _endpoint(host, endpoint)['statuses'][status] = n
+            for (host, endpoint), n in self.bytes.items():
+                _endpoint(host, endpoint)['bytes'] = n
+            for (host, endpoint), n in self.retries.items():
+                _endpoint(host, endpoint)['retries'] = n
+            for (host, endpoint, result), n in self.cache.items():
+                _endpoint(host, endpoint)['cache'][result] = n
+            for host, seconds in self.waitSeconds.items():
+                res.setdefault(host, {'waitSeconds': 0, 'waits': 0, 'endpoints': {}})
+                res[host]['waitSeconds'] = seconds
+                res[host]['waits'] = self.waits[host]
+            for h in res.values():
+                for e in h['endpoints'].values():
+                    lookups = sum(e['cache'].values())
+                    if lookups:
+                        e['cacheHitRatio'] = (lookups - e['cache'].get('miss', 0)) / lookups
+            return res
+
+    def toJson(self, indent=2) -> str:
+        return json.dumps(self.summary(), indent=indent)
+
+    def toPrometheus(self) -> str:
+        lines = []
+        def _labels(**labels):
+            return '{'+','.join(k+'="'+str(v).replace('\\', '\\\\').replace('"', '\\"')+'"' for k, v in labels.items())+'}'
+        with self._lock:
+            lines.append('# TYPE joroxbrl_request_seconds histogram')
+            for (host, endpoint), h in sorted(self.latency.items()):
+                cumulative = 0
+                for bound, n in zip([str(b) for b in latencyBuckets]+['+Inf'], h.counts):
+                    cumulative = cumulative + n
+                    lines.append('joroxbrl_request_seconds_bucket'+_labels(host=host, endpoint=endpoint, le=bound)+' '+str(cumulative))
+                lines.append('joroxbrl_request_seconds_sum'+_labels(host=host, endpoint=endpoint)+' '+repr(h.sum))
+                lines.append('joroxbrl_request_seconds_count'+_labels(host=host, endpoint=endpoint)+' '+str(h.count))
+            lines.append('# TYPE joroxbrl_requests_total counter')
+            for (host, endpoint, status), n in sorted(self.statuses.items()):
+                lines.append('joroxbrl_requests_total'+_labels(host=host, endpoint=endpoint, status=status)+' '+str(n))
+            lines.append('# TYPE joroxbrl_response_bytes_total counter')
+            for (host, endpoint), n in sorted(self.bytes.items()):
+                lines.append('joroxbrl_response_bytes_total'+_labels(host=host, endpoint=endpoint)+' '+str(n))
+            lines.append('# TYPE joroxbrl_retries_total counter')
+            for (host, endpoint), n in sorted(self.retries.items()):
+                lines.append('joroxbrl_retries_total'+_labels(host=host, endpoint=endpoint)+' '+str(n))
+            lines.append('# TYPE joroxbrl_cache_lookups_total counter')
+            for (host, endpoint, result), n in sorted(self.cache.items()):
+                lines.append('joroxbrl_cache_lookups_total'+_labels(host=host, endpoint=endpoint, result=result)+' '+str(n))
+            lines.append('# TYPE joroxbrl_rate_limit_wait_seconds_total counter')
+            for host, seconds in sorted(self.waitSeconds.items()):
+                lines.append('joroxbrl_rate_limit_wait_seconds_total'+_labels(host=host)+' '+repr(seconds))
+            lines.append('# TYPE joroxbrl_rate_limit_waits_total counter')
+            for host, n in sorted(self.waits.items()):
+                lines.append('joroxbrl_rate_limit_waits_total'+_labels(host=host)+' '+str(n))
+        return '\n'.join(lines)+'\n'
+
+    # Prometheus text format if path ends in .prom, JSON otherwise
+    def writeReport(self, path: str):
+        with open(path, 'w') as f:
+            f.write(self.toPrometheus() if path.endswith('.prom') else self.toJson())
+
+
+telemetry = Telemetry() # The one used by SecGovCaller and PolygonCaller
+
+def _writeAtExit():
+    try:
+        telemetry.writeReport(os.getenv('TELEMETRY_FILE'))
+    except OSError as ex:
+        log.error('Could not write the telemetry report: '+str(ex))
+
+if os.getenv('TELEMETRY_FILE'):
+    atexit.register(_writeAtExit)
@@ -1,9 +1,105 @@
 import unittest
+import io
+import json
+import os
+import tempfile
+import tarfile
+import zipfile
+import threading
+import time
+import joroxbrl.secGov
+import joroxbrl.filingCache
+import joroxbrl.httpCache
+import joroxbrl.rateLimit
+import joroxbrl.edgarMirror
+import joroxbrl.telemetry
+import joroxbrl.replay
+import joroxbrl.filingsIndex
+import joroxbrl.zipArchive
+import requests
+import datetime
+import numpy
 import joroxbrl.core
 import joroxbrl.secFiles
 import joroxbrl.metrics
 import logging
 
+_sampleXbrl = """<?xml version="1.0" encoding="utf-8"?>
+<xbrli:xbrl xmlns:xbrli="http://www.xbrl.org/2003/instance"
+    xmlns:xbrldi="http://xbrl.org/2006/xbrldi"
+    xmlns:link="http://www.xbrl.org/2003/linkbase"
+    xmlns:xlink="http://www.w3.org/1999/xlink"
+    xmlns:us-gaap="http://fasb.org/us-gaap/2021-01-31"
+    xmlns:dei="http://xbrl.sec.gov/dei/2021q4"
+    xmlns:abc="http://www.abc.com/20211231">
+  <link:schemaRef xlink:type="simple" xlink:href="abc-20211231.xsd"/>
+  <xbrli:context id="FY2021">
+    <xbrli:entity><xbrli:identifier scheme="http://www.sec.gov/CIK">0000000001</xbrli:identifier></xbrli:entity>
+    <xbrli:period><xbrli:startDate>2021-01-01</xbrli:startDate><xbrli:endDate>2021-12-31</xbrli:endDate></xbrli:period>
+  </xbrli:context>
+  <xbrli:context id="FY2020">
+    <xbrli:entity><xbrli:identifier scheme="http://www.sec.gov/CIK">0000000001</xbrli:identifier></xbrli:entity>
+    <xbrli:period><xbrli:startDate>2020-01-01</xbrli:startDate><xbrli:endDate>2020-12-31</xbrli:endDate></xbrli:period>
+  </xbrli:context>
+  <xbrli:context id="I2021">
+    <xbrli:entity><xbrli:identifier scheme="http://www.sec.gov/CIK">0000000001</xbrli:identifier></xbrli:entity>
+    <xbrli:period><xbrli:instant>2021-12-31</xbrli:instant></xbrli:period>
+  </xbrli:context>
+  <xbrli:context id="FY2021_Segment">
+    <xbrli:entity>
+      <xbrli:identifier scheme="http://www.sec.gov/CIK">0000000001</xbrli:identifier>
+      <xbrli:segment><xbrldi:explicitMember dimension="us-gaap:StatementBusinessSegmentsAxis">abc:MiningMember</xbrldi:explicitMember></xbrli:segment>
+    </xbrli:entity>
+    <xbrli:period><xbrli:startDate>2021-01-01</xbrli:startDate><xbrli:endDate>2021-12-31</xbrli:endDate></xbrli:period>
+  </xbrli:context>
+  <xbrli:context id="FY2021_Total">
+    <xbrli:entity>
+      <xbrli:identifier scheme="http://www.sec.gov/CIK">0000000001</xbrli:identifier>
+      <xbrli:segment><xbrldi:explicitMember dimension="dei:LegalEntityAxis">abc:TotalCompanyDomain</xbrldi:explicitMember></xbrli:segment>
+    </xbrli:entity>
+    <xbrli:period><xbrli:startDate>2021-01-01</xbrli:startDate><xbrli:endDate>2021-12-31</xbrli:endDate></xbrli:period>
+  </xbrli:context>
+  <xbrli:unit id="USD"><xbrli:measure>iso4217:USD</xbrli:measure></xbrli:unit>
+  <dei:DocumentType contextRef="FY2021">10-K</dei:DocumentType>
+  <dei:DocumentPeriodEndDate contextRef="FY2021">2021-12-31</dei:DocumentPeriodEndDate>
+  <dei:EntityRegistrantName contextRef="FY2021">ABC Corp</dei:EntityRegistrantName>
+  <us-gaap:Revenues contextRef="FY2021_Segment" unitRef="USD" decimals="-3">400000</us-gaap:Revenues>
+  <us-gaap:Revenues contextRef="FY2020" unitRef="USD" decimals="-3">900000</us-gaap:Revenues>
+  <us-gaap:Revenues contextRef="FY2021" unitRef="USD" decimals="-3">1000000</us-gaap:Revenues>
+  <us-gaap:NetIncomeLoss contextRef="FY2021" unitRef="USD" decimals="-3">-25,000</us-gaap:NetIncomeLoss>
+  <us-gaap:Assets contextRef="I2021" unitRef="USD" decimals="-3">5000000</us-gaap:Assets>
+  <us-gaap:InterestExpense contextRef="FY2021_Total" unitRef="USD" decimals="-3">12000</us-gaap:InterestExpense>
+  <abc:PreferredStockValueB contextRef="I2021" unitRef="USD" decimals="0">67</abc:PreferredStockValueB>
+</xbrli:xbrl>
+"""
+
+_sampleIxbrl = """<html xmlns="http://www.w3.org/1999/xhtml" xmlns:ix="http://www.xbrl.org/2013/inlineXBRL">
+<body>
+<div style="display:none"><ix:header><ix:hidden>
+  <ix:nonNumeric name="dei:DocumentType" contextRef="FY2021" id="f1">10-K</ix:nonNumeric>
+  <ix:nonNumeric name="dei:DocumentPeriodEndDate" contextRef="FY2021" id="f2">2021-12-31</ix:nonNumeric>
+</ix:hidden>
+<ix:resources>
+  <xbrli:context id="FY2021"><xbrli:entity><xbrli:identifier scheme="http://www.sec.gov/CIK">0000000001</xbrli:identifier></xbrli:entity>
+    <xbrli:period><xbrli:startDate>2021-01-01</xbrli:startDate><xbrli:endDate>2021-12-31</xbrli:endDate></xbrli:period></xbrli:context>
+  <xbrli:context id="I2021"><xbrli:entity><xbrli:identifier scheme="http://www.sec.gov/CIK">0000000001</xbrli:identifier></xbrli:entity>
+    <xbrli:period><xbrli:instant>2021-12-31</xbrli:instant></xbrli:period></xbrli:context>
+  <xbrli:context id="FY2021_Segment"><xbrli:entity><xbrli:identifier scheme="http://www.sec.gov/CIK">0000000001</xbrli:identifier>
+    <xbrli:segment><xbrldi:explicitMember dimension="us-gaap:StatementBusinessSegmentsAxis">abc:MiningMember</xbrldi:explicitMember></xbrli:segment></xbrli:entity>
+    <xbrli:period><xbrli:startDate>2021-01-01</xbrli:startDate><xbrli:endDate>2021-12-31</xbrli:endDate></xbrli:period></xbrli:context>
+</ix:resources></ix:header></div>
+<p>Company name: <ix:nonNumeric name="dei:EntityRegistrantName" contextRef="FY2021">ABC &amp; Sons <b>Corp</b></ix:nonNumeric></p>
+<table><tr><td>Revenues</td><td><ix:nonFraction name="us-gaap:Revenues" contextRef="FY2021" unitRef="USD" scale="3" format="ixt:num-dot-decimal" decimals="-3">1,000</ix:nonFraction></td></tr>
+<tr><td>Mining</td><td><ix:nonFraction name="us-gaap:Revenues" contextRef="FY2021_Segment" unitRef="USD" scale="3" decimals="-3">400</ix:nonFraction></td></tr>
+<tr><td>Net loss</td><td>(<ix:nonFraction name="us-gaap:NetIncomeLoss" contextRef="FY2021" unitRef="USD" scale="3" sign="-" decimals="-3">25</ix:nonFraction>)</td></tr>
+<tr><td>Assets</td><td><ix:nonFraction name="us-gaap:Assets" contextRef="I2021" unitRef="USD" scale="3" decimals="-3">5,000</ix:nonFraction><br></td></tr>
+<tr><td>Debt</td><td><ix:nonFraction name="us-gaap:LongTermDebt" contextRef="I2021" unitRef="USD" format="ixt:fixed-zero" decimals="INF">-</ix:nonFraction></td></tr></table>
+<ix:nonNumeric name="us-gaap:SegmentReportingDisclosureTextBlock" contextRef="FY2021"><div><p>Segment note, with revenues of
+  <ix:nonFraction name="us-gaap:Revenues" contextRef="FY2021" unitRef="USD" scale="3" decimals="-3">1,000</ix:nonFraction> and
+  <ix:nonFraction name="us-gaap:CostOfRevenue" contextRef="FY2021" unitRef="USD" scale="3" decimals="-3">600</ix:nonFraction></p></div></ix:nonNumeric>
+</body></html>
+"""
+
 class TestXBRL(unittest.TestCase):
     
     def test1(self):
@@ -28,7 +124,701 @@ class TestXBRL(unittest.TestCase):
                     found = True
                     break
             self.assertTrue(found)
+
+    def testFactIndex(self):
+        xbrl = joroxbrl.core.XBRL()
+        xbrl.readXml(_sampleXbrl)
+
+        self.assertEqual( len(xbrl.getFacts('Revenues')), 3 )
+        self.assertEqual( xbrl.getFacts('Revenues'), xbrl.getFacts('{http://fasb.org/us-gaap/2021-01-31}Revenues') )
+        self.assertEqual( xbrl.getFact('Revenues').context, 'FY2021_Segment' ) # First occurrence
+        self.assertIsNone( xbrl.getFact('Liabilities') )
+        self.assertEqual( len(xbrl.getFactsByContext('I2021')), 2 )
+
+        facts = xbrl.getActualGlobalFacts(['Revenues', 'Assets', 'InterestExpense', 'Liabilities'])
+        self.assertEqual( facts['Revenues'].value, '1000000' )
+        self.assertEqual( facts['Assets'].value, '5000000' )
+        self.assertEqual( facts['InterestExpense'].context, 'FY2021_Total' )
+        self.assertNotIn( 'Liabilities', facts )
+
+    def testClassifyContexts(self):
+        xbrl = joroxbrl.core.XBRL()
+        xbrl.readXml(_sampleXbrl)
+        c = xbrl.contexts
+
+        self.assertEqual( c['FY2021'].periodClass, joroxbrl.core.periodCurrentDuration )
+        self.assertEqual( c['I2021'].periodClass, joroxbrl.core.periodCurrentInstant )
+        self.assertEqual( c['FY2020'].periodClass, joroxbrl.core.periodPriorDuration )
+        self.assertEqual( c['FY2021'].dimensionClass, joroxbrl.core.dimensionGlobal )
+        self.assertEqual( c['FY2021_Segment'].dimensionClass, joroxbrl.core.dimensionDimensional )
+        self.assertEqual( c['FY2021_Total'].dimensionClass, joroxbrl.core.dimensionLegalEntityTotal )
+        self.assertEqual( c['FY2020'].endOrdinal, datetime.date(2020, 12, 31).toordinal() )
+        self.assertEqual( xbrl.getActualGlobalFact('NetIncomeLoss').getValueAsNumber(), -25000 )
+
+    def testSelectiveParse(self):
+        full = joroxbrl.core.XBRL()
+        full.readXml(_sampleXbrl)
+        xbrl = joroxbrl.core.XBRL(concepts=['Revenues', '{http://fasb.org/us-gaap/2021-01-31}InterestExpense'])
+        xbrl.readXmlStream(io.BytesIO(_sampleXbrl.encode('utf-8')))
+
+        self.assertEqual( xbrl.namespaces, full.namespaces )
+        self.assertEqual( [f.unqualifiedName for f in xbrl.facts], 
+                          ['DocumentType', 'DocumentPeriodEndDate', 'EntityRegistrantName', 'Revenues', 'Revenues', 'Revenues', 'InterestExpense'] )
+        self.assertEqual( [f.id for f in xbrl.getFacts('Revenues')], [f.id for f in full.getFacts('Revenues')] )
+        self.assertEqual( sorted(xbrl.contexts), ['FY2020', 'FY2021', 'FY2021_Segment', 'FY2021_Total'] )
+        self.assertIsNone( xbrl.getActualGlobalFact('Assets') )
+        self.assertEqual( xbrl.getActualGlobalFact('Revenues').getValueAsNumber(), 1000000 )
+        self.assertEqual( xbrl.getActualGlobalFact('InterestExpense').getValueAsNumber(), 12000 )
+
+        current = joroxbrl.core.XBRL(currentPeriodOnly=True)
+        current.readXml(_sampleXbrl)
+        self.assertNotIn( 'FY2020', current.contexts )
+        self.assertEqual( [f.context for f in current.getFacts('Revenues')], ['FY2021_Segment', 'FY2021'] )
+        self.assertEqual( current.getActualGlobalFacts(['Revenues', 'Assets', 'NetIncomeLoss']).keys(),
+                          full.getActualGlobalFacts(['Revenues', 'Assets', 'NetIncomeLoss']).keys() )
+
+    def testReadXmlStream(self):
+        xbrl = joroxbrl.core.XBRL()
+        xbrl.readXml(_sampleXbrl)
+        streamed = joroxbrl.core.XBRL()
+        streamed.readXmlStream(io.BytesIO(_sampleXbrl.encode('utf-8')))
+        chunked = joroxbrl.core.XBRL()
+        chunked.readXmlChunks(_sampleXbrl[i:i+100].encode('utf-8') for i in range(0, len(_sampleXbrl), 100))
+
+        for x in (streamed, chunked):
+            self.assertFalse( hasattr(x, 'root') )
+            self.assertEqual( x.namespaces, xbrl.namespaces )
+            self.assertEqual( sorted(x.contexts), sorted(xbrl.contexts) )
+            self.assertEqual( [f.getDescription() for f in x.facts], [f.getDescription() for f in xbrl.facts] )
+            self.assertEqual( x.contexts['FY2021_Segment'].dimensions[0].value, 'abc:MiningMember' )
     
+class TestIXBRL(unittest.TestCase):
+
+    def test1(self):
+        ixbrl = joroxbrl.core.IXBRL(_sampleIxbrl)
+
+        self.assertEqual( sorted(ixbrl.contexts), ['FY2021', 'FY2021_Segment', 'I2021'] )
+        self.assertIsNone( ixbrl.contexts['I2021'].end )
+        self.assertEqual( ixbrl.contexts['FY2021_Segment'].dimensions[0].dimension, 'StatementBusinessSegmentsAxis' )
+        self.assertEqual( len(ixbrl.facts), 9 ) # TextBlock is discarded, and the repeated Revenues too
+        self.assertEqual( ixbrl.getFact('dei:EntityRegistrantName').value, 'ABC & Sons Corp' )
+        self.assertEqual( ixbrl.getFact('us-gaap:NetIncomeLoss').value, '-25' )
+        self.assertEqual( ixbrl.getFact('us-gaap:LongTermDebt').value, '0' )
+        self.assertEqual( ixbrl.getFact('us-gaap:CostOfRevenue').value, '600' ) # Nested in the TextBlock
+        self.assertEqual( ixbrl.getFact('us-gaap:Revenues').format, 'ixt:num-dot-decimal' )
+
+        facts = ixbrl.getActualGlobalFacts(['us-gaap:Revenues', 'us-gaap:Assets'])
+        self.assertEqual( facts['us-gaap:Revenues'].context, 'FY2021' )
+        self.assertEqual( facts['us-gaap:Assets'].value, '5,000' )
+
+    def testFeedChunks(self):
+        data = _sampleIxbrl.encode('utf-8')
+        chunked = joroxbrl.core.IXBRL()
+        chunked.feedChunks(data[i:i+7] for i in range(0, len(data), 7))
+        whole = joroxbrl.core.IXBRL(_sampleIxbrl)
+        self.assertEqual( [f.getDescription() for f in chunked.facts], [f.getDescription() for f in whole.facts] )
+
+    def testFeed(self):
+        ixbrl = joroxbrl.core.IXBRL(_sampleIxbrl)
+        chunked = joroxbrl.core.IXBRL()
+        for i in range(0, len(_sampleIxbrl), 50):
+            chunked.feed(_sampleIxbrl[i:i+50])
+        chunked.close()
+        self.assertEqual( [f.getDescription() for f in chunked.facts], [f.getDescription() for f in ixbrl.facts] )
+
+    def testAddFactDuplicates(self):
+        ixbrl = joroxbrl.core.IXBRL('')
+        ixbrl.addFact('a', 'us-gaap:Revenues', 'Fifty', 'FY2021', None, None, None)
+        ixbrl.addFact('b', 'us-gaap:Revenues', '50', 'FY2021', None, None, None) # Numeric is better
+        ixbrl.addFact('c', 'us-gaap:Revenues', '50', 'FY2021', None, 'USD', 3) # Has unit and scale
+        ixbrl.addFact('d', 'us-gaap:Revenues', '50', 'FY2021', None, None, None) # Imperfect copy
+        ixbrl.addFact('e', 'us-gaap:Revenues', '50', 'FY2020', None, 'USD', 3) # Different context
+
+        self.assertEqual( len(ixbrl.facts), 2 )
+        f = ixbrl.getFact('us-gaap:Revenues')
+        self.assertEqual( (f.id, f.value, f.unit, f.scale), ('c', '50', 'USD', 3) )
+
+class TestFactTable(unittest.TestCase):
+
+    def test1(self):
+        xbrl = joroxbrl.core.XBRL()
+        xbrl.readXml(_sampleXbrl)
+        table = xbrl.toFactTable()
+
+        self.assertEqual( len(table), len(xbrl.facts) )
+        for f, v in zip(xbrl.facts, table):
+            self.assertEqual( (v.id, v.fullName, v.namespace, v.unqualifiedName, v.context, v.unit, v.format, v.scale), 
+                              (f.id, f.fullName, f.namespace, f.unqualifiedName, f.context, f.unit, f.format, f.scale) )
+        self.assertEqual( table.getFact('NetIncomeLoss').getValueAsNumber(), -25000 )
+        self.assertEqual( table.getFact('NetIncomeLoss').value, '-25000' )
+        self.assertEqual( table.getFact('EntityRegistrantName').value, 'ABC Corp' )
+        self.assertRaises( Exception, table.getFact('EntityRegistrantName').getValueAsNumber )
+        self.assertEqual( len(table.getFacts('{http://fasb.org/us-gaap/2021-01-31}Revenues')), 3 )
+        self.assertEqual( table[-1].value, '67' )
+        self.assertIs( table.namespaces, xbrl.namespaces )
+
+        values = table.getValuesAsArray()
+        self.assertEqual( values[-1], 67 )
+        self.assertTrue( numpy.isnan(values[0]) ) # DocumentType
+        numpy.testing.assert_array_equal( values, xbrl.getNumericValues() )
+        self.assertEqual( len(joroxbrl.core.FactTable().getValuesAsArray()), 0 )
+
+        facts = table.getActualGlobalFacts(['Revenues', 'InterestExpense'])
+        self.assertEqual( facts['Revenues'].getValueAsNumber(), 1000000 )
+        self.assertEqual( facts['InterestExpense'].context, 'FY2021_Total' )
+
+    def testIXBRL(self):
+        ixbrl = joroxbrl.core.IXBRL(_sampleIxbrl)
+        table = ixbrl.toFactTable()
+        self.assertEqual( [v.id for v in table], [f.id for f in ixbrl.facts] )
+        self.assertEqual( table.getFact('us-gaap:Assets').getValueAsNumber(), 5000000 )
+        numpy.testing.assert_array_equal( table.getValuesAsArray(), ixbrl.getNumericValues() )
+        # Same rules as the document for the actual global facts
+        self.assertFalse( table.allowLegalEntityTotal )
+        names = [f.fullName for f in ixbrl.facts]
+        self.assertEqual( {k: v.id for k, v in table.getActualGlobalFacts(names).items()}, 
+                          {k: v.id for k, v in ixbrl.getActualGlobalFacts(names).items()} )
+
+    def testNoValue(self):
+        # A fact without a value is 0 as a number, in the table as in the Fact
+        facts = [joroxbrl.core.Fact(0, 'us-gaap:Revenues', None, 'c1', None, 'usd', '3'),
+                 joroxbrl.core.Fact(1, 'us-gaap:Assets', '1,500', 'c1', None, 'usd', '3')]
+        table = joroxbrl.core.FactTable(facts)
+        numpy.testing.assert_array_equal( table.getValuesAsArray(), joroxbrl.core._numericValuesArray(facts) )
+        self.assertEqual( list(table.getValuesAsArray()), [0, 1500000] )
+        self.assertIsNone( table[0].value )
+        self.assertEqual( table[0].getValueAsNumber(), facts[0].getValueAsNumber() )
+
+class TestParseXbrlMany(unittest.TestCase):
+
+    def test1(self):
+        with tempfile.NamedTemporaryFile(suffix='.xml', delete=False) as f:
+            f.write(_sampleXbrl.encode('utf-8'))
+        try:
+            sources = [_sampleXbrl.encode('utf-8'), f.name, b'<not xml', _sampleXbrl.encode('utf-8')]
+            results = list(joroxbrl.core.parseXbrlMany(sources, maxWorkers=2, maxPending=2))
+        finally:
+            os.remove(f.name)
+
+        self.assertEqual( len(results), 4 )
+        for source, table, error in results:
+            if source == b'<not xml':
+                self.assertIsNone( table )
+                self.assertIsNotNone( error )
+            else:
+                self.assertIsNone( error )
+                self.assertEqual( table.getActualGlobalFact('Assets').getValueAsNumber(), 5000000 )
+
+class TestFilingCache(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.cache = joroxbrl.filingCache.FilingSnapshotCache(self.dir.name)
+
+    def tearDown(self):
+        joroxbrl.secGov.snapshotCache = None
+        self.dir.cleanup()
+
+    def testSnapshot(self):
+        xbrl = joroxbrl.core.XBRL()
+        xbrl.readXml(_sampleXbrl)
+        self.cache.put('0000000001-21-000001', xbrl.toSnapshot(), 'xbrl')
+        restored = joroxbrl.core.XBRL.fromSnapshot(self.cache.get('000000000121000001', 'xbrl'))
+
+        self.assertEqual( [f.getDescription() for f in restored.facts], [f.getDescription() for f in xbrl.facts] )
+        self.assertEqual( restored.namespaces, xbrl.namespaces )
+        self.assertEqual( restored.getActualGlobalFact('Revenues').getValueAsNumber(), 1000000 )
+        self.assertIsNone( self.cache.get('0000000001-21-000002', 'xbrl') )
+
+    def testFilingUrls(self):
+        rootUrl = 'https://www.sec.gov/Archives/edgar/data/1/000000000121000001/0000000001-21-000001-index.htm'
+        calUrl = 'https://www.sec.gov/Archives/edgar/data/1/000000000121000001/abc-20211231_cal.xml'
+        xbrl = joroxbrl.core.XBRL()
+        xbrl.readXml(_sampleXbrl)
+        self.cache.put(rootUrl, { 'mainFormType': '10-K', 'mainDocumentUrl': None, 
+                                  'dataFileUrls': {'EX-101.CAL': calUrl}, 
+                                  'documents': {calUrl: '<linkbase/>'}, 'xsdNamespaces': {} })
+        self.cache.put(rootUrl, xbrl.toSnapshot(), 'xbrl')
+        joroxbrl.secGov.snapshotCache = self.cache
+
+        urls = joroxbrl.secGov.FilingUrls(rootUrl) # Nothing of this goes to sec.gov
+        self.assertEqual( urls.mainFormType, '10-K' )
+        self.assertEqual( urls.getDocumentText(urls.getCalculationLinkbaseUrl()), '<linkbase/>' )
+        self.assertEqual( len(urls.getXbrl().facts), len(xbrl.facts) )
+
+    def testEviction(self):
+        self.cache.maxBytes = 1
+        self.cache.put('0000000001-21-000001', {'a': 'x'*1000})
+        self.assertIsNone( self.cache.get('0000000001-21-000001') )
+
+    def testTotalBytes(self):
+        self.cache.put('0000000001-21-000001', {'a': 'x'})
+        self.cache.put('0000000001-21-000002', {'a': 'y'})
+        self.cache.put('0000000001-21-000001', {'a': 'x'*100}) # Replaces the first one
+        sizes = sum(e.stat().st_size for e in os.scandir(self.dir.name) if e.name.endswith('.snap'))
+        self.assertEqual( self.cache._totalBytes, sizes )
+
+    def testPrefetchWritesOnce(self):
+        rootUrl = 'https://www.sec.gov/Archives/edgar/data/1/000000000121000001/0000000001-21-000001-index.htm'
+        folder = 'https://www.sec.gov/Archives/edgar/data/1/000000000121000001/'
+        dataFileUrls = {'EX-101.CAL': folder+'abc-20211231_cal.xml', 'EX-101.PRE': folder+'abc-20211231_pre.xml', 
+                        'EX-101.SCH': folder+'abc-20211231.xsd'}
+        self.cache.put(rootUrl, { 'mainFormType': '10-K', 'mainDocumentUrl': None, 'dataFileUrls': dataFileUrls, 
+                                  'documents': {}, 'xsdNamespaces': {} })
+        self.cache.put(rootUrl, {}, 'xbrl')
+        joroxbrl.secGov.snapshotCache = self.cache
+        puts = []
+        put = self.cache.put
+        self.cache.put = lambda *args: puts.append(args) or put(*args)
+        callSecGovUrls = joroxbrl.secGov.SecGovCaller.callSecGovUrls
+        joroxbrl.secGov.SecGovCaller.callSecGovUrls = lambda urls, **kwargs: [
+            joroxbrl.httpCache.makeResponse(u, b'<linkbase/>', {}, encoding='utf-8') for u in urls]
+        try:
+            urls = joroxbrl.secGov.FilingUrls(rootUrl)
+            urls.prefetch()
+            for u in dataFileUrls.values():
+                self.assertEqual( urls.getDocumentText(u), '<linkbase/>' )
+        finally:
+            joroxbrl.secGov.SecGovCaller.callSecGovUrls = callSecGovUrls
+        self.assertEqual( len(puts), 1 )
+        self.assertEqual( len(self.cache.get(rootUrl)['documents']), 3 )
+
+class TestSecGovCaller(unittest.TestCase):
+
+    def testCallLimit(self):
+        # Calls from several threads are still spaced by the sec.gov rate limit
+        rate, burst = joroxbrl.rateLimit.hostLimits['sec.gov']
+        start = datetime.datetime.today()
+        threads = [threading.Thread(target=joroxbrl.secGov.SecGovCaller._callLimit) for i in range(4)]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        self.assertGreaterEqual( (datetime.datetime.today()-start).total_seconds(), (4-burst)/rate - 0.01 )
+
+class TestAdaptiveRate(unittest.TestCase):
+
+    class _Session:
+        # Returns the given status codes, one per call
+        def __init__(self, statuses):
+            self.statuses = list(statuses)
+            self.calls = 0
+        def get(self, url, headers, stream):
+            resp = requests.Response()
+            resp.status_code = self.statuses.pop(0)
+            resp.headers = requests.structures.CaseInsensitiveDict({'Retry-After': '0'} if resp.status_code==429 else {})
+            resp._content = b''
+            resp.raw = io.BytesIO(b'')
+            self.calls = self.calls + 1
+            return resp
+
+    def setUp(self):
+        self.session = joroxbrl.secGov.SecGovCaller._session
+        self.bucket = joroxbrl.rateLimit.TokenBucket(100, burst=10)
+        self.controller = joroxbrl.rateLimit.AdaptiveRate(self.bucket, increase=10, cooldown=0)
+        joroxbrl.rateLimit._limiters['test.sec.gov'] = (self.bucket, self.controller)
+        joroxbrl.rateLimit._hostNames['test.sec.gov'] = 'test.sec.gov'
+
+    def tearDown(self):
+        joroxbrl.secGov.SecGovCaller._session = self.session
+        del joroxbrl.rateLimit._limiters['test.sec.gov']
+        del joroxbrl.rateLimit._hostNames['test.sec.gov']
+
+    def test1(self):
+        self.controller.onThrottle()
+        self.controller.onThrottle()
+        self.assertEqual( self.controller.effectiveRate, 25 )
+        for i in range(10):
+            self.controller.onSuccess()
+        self.assertEqual( self.controller.effectiveRate, 100 )
+
+    def testRetry(self):
+        try:
+            session = self._Session([429, 503, 200])
+            joroxbrl.secGov.SecGovCaller._session = session
+            joroxbrl.secGov.SecGovCaller._retryBackoff = 0.01
+            resp = joroxbrl.secGov.SecGovCaller.callSecGovUrl('https://test.sec.gov/cgi-bin/current')
+            self.assertEqual( resp.status_code, 200 )
+            self.assertEqual( session.calls, 3 )
+            self.assertEqual( joroxbrl.telemetry.telemetry.retries[('test.sec.gov', 'cgi-bin')], 2 )
+            self.assertEqual( joroxbrl.secGov.SecGovCaller.getEffectiveRate('test.sec.gov'), 35 )
+        finally:
+            joroxbrl.secGov.SecGovCaller._retryBackoff = 2
+
+    def testParseRetryAfter(self):
+        self.assertEqual( joroxbrl.secGov._parseRetryAfter('120'), 120 )
+        self.assertIsNone( joroxbrl.secGov._parseRetryAfter(None) )
+        self.assertEqual( joroxbrl.secGov._parseRetryAfter('Mon, 03 Jan 2022 10:00:00 GMT'), 0 )
+
+class TestReplay(unittest.TestCase):
+
+    class _Session:
+        def get(self, url, headers=None, stream=False):
+            resp = requests.Response()
+            resp.status_code = 200
+            resp.headers = requests.structures.CaseInsensitiveDict({'Content-Type': 'application/json', 'Content-Encoding': 'gzip'})
+            resp.raw = io.BytesIO(json.dumps({'url': url}).encode('utf-8'))
+            return resp
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.session = joroxbrl.secGov.SecGovCaller._session
+
+    def tearDown(self):
+        joroxbrl.secGov.SecGovCaller._session = self.session
+        joroxbrl.replay.transport = None
+        self.dir.cleanup()
+
+    def test1(self):
+        url = 'https://data.sec.gov/submissions/CIK0000000001.json'
+        store = joroxbrl.replay.FixtureStore(self.dir.name)
+        recorder = joroxbrl.replay.Transport(store, joroxbrl.replay.modeRecord)
+        self.assertEqual( recorder.get(self._Session(), url).json(), {'url': url} )
+        self.assertEqual( recorder.call('polygon', 'AAA', lambda: {'market_cap': 1}), {'market_cap': 1} )
+
+        # Replay, through SecGovCaller and without any network
+        joroxbrl.replay.transport = joroxbrl.replay.Transport(store, joroxbrl.replay.modeReplay)
+        joroxbrl.secGov.SecGovCaller._session = joroxbrl.replay.ReplaySession(joroxbrl.replay.transport)
+        resp = joroxbrl.secGov.SecGovCaller.callSecGovUrl(url)
+        self.assertEqual( resp.json(), {'url': url} )
+        self.assertNotIn( 'Content-Encoding', resp.headers )
+        self.assertEqual( joroxbrl.replay.transport.call('polygon', 'AAA', None), {'market_cap': 1} )
+        with self.assertRaises(joroxbrl.replay.MissingFixture):
+            joroxbrl.secGov.SecGovCaller.callSecGovUrl(url+'2')
+
+class TestTelemetry(unittest.TestCase):
+
+    def test1(self):
+        t = joroxbrl.telemetry.Telemetry()
+        t.recordRequest('www.sec.gov', 'archives', 0.2, 200, 1000)
+        t.recordRequest('www.sec.gov', 'archives', 3, 429)
+        t.recordRetry('www.sec.gov', 'archives')
+        t.recordWait('www.sec.gov', 0.5)
+        t.recordCache('www.sec.gov', 'archives', 'hit')
+        t.recordCache('www.sec.gov', 'archives', 'hit')
+        t.recordCache('www.sec.gov', 'archives', 'hit')
+        t.recordCache('www.sec.gov', 'archives', 'miss')
+
+        s = json.loads(t.toJson())['www.sec.gov']
+        self.assertEqual( s['waitSeconds'], 0.5 )
+        e = s['endpoints']['archives']
+        self.assertEqual( (e['requests'], e['bytes'], e['retries']), (2, 1000, 1) )
+        self.assertEqual( e['statuses'], {'200': 1, '429': 1} )
+        self.assertEqual( e['latency']['buckets']['0.25'], 1 )
+        self.assertEqual( e['cacheHitRatio'], 0.75 )
+
+        prom = t.toPrometheus()
+        self.assertIn( 'joroxbrl_request_seconds_bucket{host="www.sec.gov",endpoint="archives",le="+Inf"} 2', prom )
+        self.assertIn( 'joroxbrl_requests_total{host="www.sec.gov",endpoint="archives",status="429"} 1', prom )
+
+    def testEndpointClass(self):
+        self.assertEqual( joroxbrl.telemetry.endpointClass('https://data.sec.gov/submissions/CIK0000000001.json'), 'submissions' )
+        self.assertEqual( joroxbrl.telemetry.endpointClass('https://www.sec.gov/Archives/edgar/data/1/000000000121000001/index.json'), 'archives-index' )
+        self.assertEqual( joroxbrl.telemetry.endpointClass('https://www.sec.gov/Archives/edgar/data/1/000000000121000001/a.xml'), 'archives' )
+        self.assertEqual( joroxbrl.telemetry.endpointClass('https://www.sec.gov/cgi-bin/browse-edgar?action=getcurrent'), 'cgi-bin' )
+
+class TestSingleFlight(unittest.TestCase):
+
+    class _Session:
+        def __init__(self):
+            self.calls = 0
+        def get(self, url, headers=None, stream=False):
+            self.calls = self.calls + 1
+            time.sleep(0.2) # So that the other threads arrive while it's in flight
+            resp = requests.Response()
+            resp.status_code = 200
+            resp._content = b'{"a": 1}'
+            resp.raw = io.BytesIO(b'')
+            return resp
+
+    def test1(self):
+        session = joroxbrl.secGov.SecGovCaller._session
+        fake = self._Session()
+        joroxbrl.secGov.SecGovCaller._session = fake
+        try:
+            responses = joroxbrl.secGov.SecGovCaller.callSecGovUrls(['https://example.com/a.json']*5, maxConcurrency=5)
+        finally:
+            joroxbrl.secGov.SecGovCaller._session = session
+        self.assertEqual( fake.calls, 1 )
+        self.assertEqual( [r.json() for r in responses], [{'a': 1}]*5 )
+        self.assertEqual( len(set(id(r) for r in responses)), 5 )
+
+    def testError(self):
+        sf = joroxbrl.secGov.SingleFlight()
+        def fail():
+            time.sleep(0.1)
+            raise ValueError('x')
+        errors = []
+        def call():
+            try:
+                sf.do('k', fail)
+            except ValueError as ex:
+                errors.append(ex)
+        threads = [threading.Thread(target=call) for i in range(3)]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        self.assertEqual( len(errors), 3 )
+        self.assertEqual( sf._calls, {} )
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test1(self):
+        bucket = joroxbrl.rateLimit.TokenBucket(10, burst=2)
+        self.assertEqual( bucket.reserve(), 0 )
+        self.assertEqual( bucket.reserve(), 0 )
+        self.assertAlmostEqual( bucket.reserve(), 0.1, places=2 )
+        self.assertAlmostEqual( bucket.reserve(), 0.2, places=2 )
+
+    @unittest.skipIf(joroxbrl.rateLimit.fcntl is None, 'No flock in this platform')
+    def testSharedState(self):
+        # Two buckets on the same file, like two processes, share the tokens
+        with tempfile.TemporaryDirectory() as d:
+            stateFile = os.path.join(d, 'test.state')
+            b1 = joroxbrl.rateLimit.TokenBucket(10, burst=1, stateFile=stateFile)
+            b2 = joroxbrl.rateLimit.TokenBucket(10, burst=1, stateFile=stateFile)
+            self.assertEqual( b1.reserve(), 0 )
+            self.assertAlmostEqual( b2.reserve(), 0.1, places=2 )
+            self.assertAlmostEqual( b1.reserve(), 0.2, places=2 )
+
+    @unittest.skipIf(joroxbrl.rateLimit.fcntl is None, 'No flock in this platform')
+    def testStateFilePermissions(self):
+        with tempfile.TemporaryDirectory() as d:
+            stateFile = os.path.join(d, 'test.state')
+            bucket = joroxbrl.rateLimit.TokenBucket(10, burst=1, stateFile=stateFile)
+            bucket.reserve()
+            self.assertEqual( os.stat(stateFile).st_mode & 0o777, 0o600 )
+            # A file others can write is not trusted: the limit stays in the process
+            os.chmod(stateFile, 0o666)
+            other = joroxbrl.rateLimit.TokenBucket(10, burst=1, stateFile=stateFile)
+            with self.assertLogs('joroxbrl.rateLimit', 'WARNING'):
+                self.assertEqual( other.reserve(), 0 )
+            self.assertIsNone( other.stateFile )
+
+    def testHostLimits(self):
+        os.environ['SEC_RATE_LIMITS'] = 'efts.sec.gov=5/2'
+        joroxbrl.rateLimit.reset()
+        try:
+            self.assertIs( joroxbrl.rateLimit.getBucket('data.sec.gov'), joroxbrl.rateLimit.getBucket('www.sec.gov') )
+            efts = joroxbrl.rateLimit.getBucket('efts.sec.gov')
+            self.assertEqual( (efts.rate, efts.burst), (5, 2) )
+            self.assertIs( joroxbrl.rateLimit.getController('efts.sec.gov').bucket, efts )
+            if hasattr(os, 'getuid') and not joroxbrl.rateLimit.stateDirectory and not os.getenv('SEC_RATE_LIMIT_DIR'):
+                self.assertIn( '-'+str(os.getuid())+'-', os.path.basename(efts.stateFile) )
+        finally:
+            del os.environ['SEC_RATE_LIMITS']
+            joroxbrl.rateLimit.reset()
+
+class TestEdgarMirror(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        folder = os.path.join(self.dir.name, 'data', '1', '000000000121000001')
+        os.makedirs(folder)
+        files = {'abc-20211231.htm': '<html/>', 'abc-20211231_htm.xml': _sampleXbrl, 
+                 'abc-20211231.xsd': '<schema/>', 'abc-20211231_pre.xml': '<linkbase/>'}
+        for name, text in files.items():
+            with open(os.path.join(folder, name), 'w', encoding='utf-8') as f:
+                f.write(text)
+        self.tarPath = os.path.join(self.dir.name, 'edgar.tar')
+        with tarfile.open(self.tarPath, 'w') as tar:
+            tar.add(os.path.join(self.dir.name, 'data'), arcname='Archives/edgar/data')
+
+    def tearDown(self):
+        joroxbrl.secGov.edgarMirror = None
+        self.dir.cleanup()
+
+    def test1(self):
+        rootUrl = 'https://www.sec.gov/Archives/edgar/data/1/000000000121000001/0000000001-21-000001-index.htm'
+        for mirror in (joroxbrl.edgarMirror.openMirror(os.path.join(self.dir.name, 'data')), 
+                       joroxbrl.edgarMirror.openMirror(self.tarPath)):
+            joroxbrl.secGov.edgarMirror = mirror
+            urls = joroxbrl.secGov.FilingUrls(rootUrl, '10-K', 'abc-20211231.htm') # Nothing of this goes to sec.gov
+            self.assertEqual( sorted(urls.dataFileUrls), ['EX-101.PRE', 'EX-101.SCH', 'XML'] )
+            self.assertEqual( urls.getDocumentText(urls.getPresentationLinkbaseUrl()), '<linkbase/>' )
+            self.assertEqual( urls.getXbrl().getActualGlobalFact('Assets').getValueAsNumber(), 5000000 )
+            self.assertIsNone( mirror.get('https://www.sec.gov/Archives/edgar/data/1/000000000121000002/a.htm') )
+
+    def testOutsideFolder(self):
+        with open(os.path.join(self.dir.name, 'data', '1', 'secret.txt'), 'w') as f:
+            f.write('secret')
+        os.makedirs(os.path.join(self.dir.name, 'data', '1', '000000000121000001', 'sub'))
+        mirror = joroxbrl.edgarMirror.DirectoryMirror(os.path.join(self.dir.name, 'data'))
+        folder = 'https://www.sec.gov/Archives/edgar/data/1/000000000121000001/'
+        for name in ('../secret.txt', 'sub/../../secret.txt', 'sub//../../secret.txt', 'sub', 'sub/'):
+            self.assertIsNone( mirror.get(folder+name), name ) # Left for sec.gov
+            self.assertIsNone( mirror.get(folder+name, stream=True), name )
+        self.assertIsNotNone( mirror.get(folder+'abc-20211231.htm') )
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.cache = joroxbrl.httpCache.ResponseCache(self.dir.name)
+
+    def tearDown(self):
+        joroxbrl.secGov.responseCache = None
+        self.cache.close()
+        self.dir.cleanup()
+
+    def _response(self, body, headers={}):
+        resp = requests.Response()
+        resp.status_code = 200
+        resp.raw = io.BytesIO(body) # Not read yet, like a streamed response
+        resp.headers = requests.structures.CaseInsensitiveDict(headers)
+        return resp
+
+    def test1(self):
+        xmlUrl = 'https://www.sec.gov/Archives/edgar/data/1/000000000121000001/abc-20211231_htm.xml'
+        otherUrl = 'https://www.sec.gov/Archives/edgar/data/1/000000000121000001/copy.xml'
+        self.cache.put(xmlUrl, self._response(_sampleXbrl.encode('utf-8'), {'Content-Type': 'application/xml; charset=utf-8', 'Content-Encoding': 'gzip'}))
+        self.cache.put(otherUrl, self._response(_sampleXbrl.encode('utf-8')))
+        self.assertEqual( len(os.listdir(self.dir.name)), 2 ) # index.sqlite and a single folder with the body
+        joroxbrl.secGov.responseCache = self.cache
+
+        resp = joroxbrl.secGov.SecGovCaller.callSecGovUrl(xmlUrl) # Immutable, doesn't go to sec.gov
+        self.assertEqual( resp.text, _sampleXbrl )
+        self.assertNotIn( 'Content-Encoding', resp.headers )
+        xbrl = joroxbrl.core.XBRL()
+        xbrl.readXmlUrl(xmlUrl, stream=True)
+        self.assertEqual( xbrl.getActualGlobalFact('Assets').getValueAsNumber(), 5000000 )
+
+    def testRevalidation(self):
+        url = 'https://data.sec.gov/submissions/CIK0000000001.json'
+        self.assertFalse( joroxbrl.httpCache.isImmutableUrl(url) )
+        self.assertFalse( joroxbrl.httpCache.isImmutableUrl('https://www.sec.gov/Archives/edgar/data/1/') )
+        entry = self.cache.put(url, self._response(b'{}', {'ETag': '"abc"', 'Last-Modified': 'Mon, 03 Jan 2022 10:00:00 GMT'}))
+        self.assertEqual( self.cache.validationHeaders(self.cache.get(url)),
+                          {'If-None-Match': '"abc"', 'If-Modified-Since': 'Mon, 03 Jan 2022 10:00:00 GMT'} )
+        self.assertEqual( self.cache.toResponse(entry).json(), {} )
+
+    def testAsync(self):
+        urls = ['https://www.sec.gov/Archives/edgar/data/1/000000000121000001/doc'+str(i)+'.htm' for i in range(5)]
+        for i, url in enumerate(urls):
+            self.cache.put(url, self._response(str(i).encode('utf-8')))
+        joroxbrl.secGov.responseCache = self.cache
+
+        responses = joroxbrl.secGov.SecGovCaller.callSecGovUrls(urls, maxConcurrency=3)
+        self.assertEqual( [r.text for r in responses], ['0', '1', '2', '3', '4'] )
+
+    def testDirectoryIndex(self):
+        folder = 'https://www.sec.gov/Archives/edgar/data/1/000000000121000001/'
+        names = ['abc-20211231.htm', 'abc-20211231.xsd', 'abc-20211231_cal.xml', 'abc-20211231_lab.xml',
+                 'abc-20211231_pre.xml', 'abc-20211231_htm.xml', 'FilingSummary.xml', 'R1.xml']
+        index = {'directory': {'name': '/Archives/edgar/data/1/000000000121000001', 
+                               'item': [{'name': n, 'type': 'text.gif'} for n in names]}}
+        self.cache.put(folder+'index.json', self._response(json.dumps(index).encode('utf-8')))
+        self.cache.put(folder+'abc-20211231_htm.xml', self._response(_sampleXbrl.encode('utf-8')))
+        for n in ('abc-20211231.xsd', 'abc-20211231_cal.xml', 'abc-20211231_pre.xml'):
+            self.cache.put(folder+n, self._response(b'<linkbase/>'))
+        joroxbrl.secGov.responseCache = self.cache
+
+        urls = joroxbrl.secGov.FilingUrls(folder+'0000000001-21-000001-index.htm', '10-K', 'abc-20211231.htm')
+        self.assertEqual( urls.mainFormType, '10-K' )
+        self.assertEqual( urls.mainDocumentUrl, folder+'abc-20211231.htm' )
+        self.assertEqual( urls.dataFileUrls, {'EX-101.SCH': folder+'abc-20211231.xsd', 'EX-101.CAL': folder+'abc-20211231_cal.xml', 
+                                              'EX-101.PRE': folder+'abc-20211231_pre.xml', 'XML': folder+'abc-20211231_htm.xml'} )
+        urls.prefetch()
+        path = urls._prefetched[folder+'abc-20211231_htm.xml'] # A temporary file, not in memory
+        self.assertTrue( os.path.exists(path) )
+        self.assertEqual( urls.getDocumentText(urls.getCalculationLinkbaseUrl()), '<linkbase/>' )
+        self.assertEqual( urls.getXbrl().getActualGlobalFact('Assets').getValueAsNumber(), 5000000 )
+        self.assertEqual( urls._prefetched, {} )
+        self.assertFalse( os.path.exists(path) )
+
+    def testPrefetchMaxBytes(self):
+        folder = 'https://www.sec.gov/Archives/edgar/data/1/000000000121000001/'
+        xmlUrl = folder+'abc-20211231_htm.xml'
+        self.cache.put(xmlUrl, self._response(_sampleXbrl.encode('utf-8')))
+        self.cache.put(folder+'abc-20211231_pre.xml', self._response(b'<linkbase/>'))
+        joroxbrl.secGov.responseCache = self.cache
+        urls = joroxbrl.secGov.FilingUrls.__new__(joroxbrl.secGov.FilingUrls)
+        urls.filingRootUrl = folder+'0000000001-21-000001-index.htm'
+        urls._accession, urls._prefetched, urls._snapshotDirty = None, {}, False
+        urls._snapshot = {'documents': {}, 'xsdNamespaces': {}}
+        urls.dataFileUrls = {'XML': xmlUrl, 'EX-101.PRE': folder+'abc-20211231_pre.xml'}
+
+        os.environ['SEC_MAX_DOWNLOAD_MB'] = str(100/1024**2) # Smaller than the instance, not the linkbase
+        try:
+            with self.assertLogs(level='WARNING'):
+                urls.prefetch()
+            self.assertEqual( urls._prefetched, {} )
+            self.assertEqual( urls.getDocumentText(folder+'abc-20211231_pre.xml'), '<linkbase/>' )
+            with self.assertRaises(Exception):
+                urls.getXbrl()
+        finally:
+            del os.environ['SEC_MAX_DOWNLOAD_MB']
+
+    def testDirectoryIndexInstance(self):
+        folder = 'https://www.sec.gov/Archives/edgar/data/1/000000000110000001/'
+        def _readIndex(names):
+            index = {'directory': {'name': '/Archives/edgar/data/1/000000000110000001', 
+                                   'item': [{'name': n, 'type': 'text.gif'} for n in names]}}
+            self.cache.put(folder+'index.json', self._response(json.dumps(index).encode('utf-8')))
+            urls = joroxbrl.secGov.FilingUrls.__new__(joroxbrl.secGov.FilingUrls)
+            urls.filingRootUrl = folder+'0000000001-10-000001-index.htm'
+            urls._readDirectoryIndex('10-K', 'abc-10k.htm')
+            return urls.dataFileUrls
+        joroxbrl.secGov.responseCache = self.cache
+
+        # Non-inline filing: the instance goes with the xsd, and other xml exhibits are left out
+        dataFileUrls = _readIndex(['abc-10k.htm', 'abc-20101231.xml', 'abc-20101231.xsd', 'abc-20101231_cal.xml',
+                                   'abc-20101231_pre.xml', 'ex99-data.xml', 'FilingSummary.xml', 'R1.xml'])
+        self.assertEqual( dataFileUrls['EX-101.INS'], folder+'abc-20101231.xml' )
+        self.assertEqual( len(dataFileUrls), 4 )
+        # Without an instance named as the xsd we can't tell, and the html index has to be used
+        with self.assertRaises(Exception):
+            _readIndex(['abc-10k.htm', 'abc-instance.xml', 'abc-20101231.xsd', 'abc-20101231_cal.xml'])
+        with self.assertRaises(Exception):
+            _readIndex(['abc-10k.htm', 'abc-20101231.xsd', 'def-20101231.xsd', 'abc-20101231.xml'])
+
+    def testStream(self):
+        url = 'https://www.sec.gov/Archives/edgar/data/1/000000000121000001/big.htm'
+        body = os.urandom(300000)
+        entry = self.cache.put(url, self._response(body))
+        resp = self.cache.toResponse(entry, stream=True)
+        self.assertEqual( b''.join(resp.iter_content(10000)), body )
+        with self.assertRaises(Exception):
+            self.cache.put(url+'2', self._response(body), maxBytes=1000)
+        self.assertIsNone( self.cache.get(url+'2') )
+
+        joroxbrl.secGov.responseCache = self.cache
+        self.assertEqual( b''.join(joroxbrl.secGov.SecGovCaller.iterSecGovUrl(url)), body )
+        with self.assertRaises(Exception):
+            list(joroxbrl.secGov.SecGovCaller.iterSecGovUrl(url, maxBytes=1000))
+        path = joroxbrl.secGov.SecGovCaller.downloadSecGovUrl(url)
+        try:
+            with open(path, 'rb') as f:
+                self.assertEqual( f.read(), body )
+        finally:
+            os.remove(path)
+
+    def testEviction(self):
+        self.cache.maxBytes = 1000
+        for i in range(5):
+            self.cache.put('https://www.sec.gov/'+str(i), self._response(os.urandom(600)))
+        self.assertIsNone( self.cache.get('https://www.sec.gov/0') )
+        self.assertIsNotNone( self.cache.get('https://www.sec.gov/4') )
+
+    def testEvictionTarget(self):
+        self.cache.maxBytes = 2000
+        for i in range(4):
+            self.cache.put('https://www.sec.gov/'+str(i), self._response(os.urandom(600)))
+        # Over the budget, it goes down to evictTarget, leaving room for the next puts
+        self.assertLessEqual( self.cache._addTotal(0), 2000*self.cache.evictTarget )
+        self.assertIsNone( self.cache.get('https://www.sec.gov/0') )
+
+    def testTotalBytes(self):
+        body = os.urandom(600)
+        self.cache.put('https://www.sec.gov/1', self._response(body))
+        self.cache.put('https://www.sec.gov/2', self._response(body)) # Same body, counted once
+        self.cache.put('https://www.sec.gov/3', self._response(os.urandom(300)))
+        self.cache.put('https://www.sec.gov/3', self._response(os.urandom(400))) # Replaces the body of 3
+        sizes = sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(self.dir.name) for f in files if f.endswith('.z'))
+        self.assertEqual( self.cache._addTotal(0), sizes )
+
+        # A new cache on the same directory keeps the total
+        cache = joroxbrl.httpCache.ResponseCache(self.dir.name)
+        self.assertEqual( cache._addTotal(0), sizes )
+        cache.close()
+
 class TestFiling(unittest.TestCase):
     
     def test1(self):
@@ -61,6 +851,249 @@ class TestFiling(unittest.TestCase):
         #     print(f.getPrimaryDocumentUrl())
         self.assertEqual( len(listFilings), 2 )
        
+class TestSubmissionsCache(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        joroxbrl.secFiles.submissionsDir = self.dir.name+'/'
+        joroxbrl.secFiles._submissionsCache.clear()
+
+    def tearDown(self):
+        joroxbrl.secFiles.submissionsDir = None
+        joroxbrl.secFiles._submissionsCache.clear()
+        self.dir.cleanup()
+
+    def _write(self, cik, content, mtime):
+        path = os.path.join(self.dir.name, 'CIK'+cik+'.json')
+        with open(path, 'w') as f:
+            json.dump(content, f)
+        os.utime(path, (mtime, mtime))
+
+    def test1(self):
+        self._write('0000000001', {'tickers': ['ABC']}, 1000000000)
+        s1 = joroxbrl.secFiles.Filing.getSubmission('0000000001')
+        self.assertIs( joroxbrl.secFiles.Filing.getSubmission('0000000001'), s1 )
+        self.assertEqual( joroxbrl.secFiles.getTickersFromCIK('1'), ['ABC'] )
+
+        self._write('0000000001', {'tickers': ['XYZ']}, 1000000100) # Changed file
+        self.assertEqual( joroxbrl.secFiles.Filing.getSubmission('0000000001'), {'tickers': ['XYZ']} )
+
+    def testEviction(self):
+        maxBytes = joroxbrl.secFiles.submissionsCacheMaxBytes
+        joroxbrl.secFiles.submissionsCacheMaxBytes = 50*joroxbrl.secFiles._parsedSizeRatio # One of them, not two
+        try:
+            for cik in ('0000000001', '0000000002'):
+                self._write(cik, {'tickers': ['A'*30]}, 1000000000)
+                joroxbrl.secFiles.Filing.getSubmission(cik)
+            self.assertEqual( list(joroxbrl.secFiles._submissionsCache._entries), ['0000000002'] )
+            jsonSize = os.path.getsize(os.path.join(self.dir.name, 'CIK0000000002.json'))
+            self.assertEqual( joroxbrl.secFiles._submissionsCache._size, jsonSize*joroxbrl.secFiles._parsedSizeRatio )
+        finally:
+            joroxbrl.secFiles.submissionsCacheMaxBytes = maxBytes
+
+def _submissions(accessions, forms, filingDates, isXBRL):
+    n = len(accessions)
+    return {'accessionNumber': accessions, 'filingDate': filingDates, 'reportDate': [str(int(d[:4])-1)+'-12-31' for d in filingDates],
+            'acceptanceDateTime': [d+'T16:00:00.000Z' for d in filingDates], 'act': ['34']*n, 'form': forms,
+            'fileNumber': ['001-1']*n, 'filmNumber': ['1']*n, 'items': ['']*n, 'size': [1000]*n, 'isXBRL': isXBRL,
+            'isInlineXBRL': isXBRL, 'primaryDocument': ['doc.htm']*n, 'primaryDocDescription': forms}
+
+class TestSubmissionHistory(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        joroxbrl.secFiles.submissionsDir = self.dir.name+'/'
+        joroxbrl.secFiles._submissionsCache.clear()
+        with open(os.path.join(self.dir.name, 'CIK0000000001.json'), 'w') as f:
+            json.dump({'cik': '1', 'filings': {
+                'recent': _submissions(['0000000001-23-000002', '0000000001-23-000001'], ['10-K', '8-K'], ['2023-02-20', '2023-01-10'], [1, 0]),
+                'files': [{'name': 'CIK0000000001-submissions-001.json', 'filingCount': 2, 'filingFrom': '2021-02-22', 'filingTo': '2022-02-21'}]}}, f)
+
+    def tearDown(self):
+        joroxbrl.secFiles.submissionsDir = None
+        joroxbrl.secFiles._submissionsCache.clear()
+        self.dir.cleanup()
+
+    def _writePage(self):
+        with open(os.path.join(self.dir.name, 'CIK0000000001-submissions-001.json'), 'w') as f:
+            json.dump(_submissions(['0000000001-22-000001', '0000000001-21-000001'], ['10-K', '10-K'], ['2022-02-21', '2021-02-22'], [1, 1]), f)
+
+    def test1(self):
+        Filing = joroxbrl.secFiles.Filing
+        # None of these need the older page (which doesn't exist yet)
+        self.assertEqual( Filing.getLatestFiling('1', '10-K').accessionNumber, '0000000001-23-000002' )
+        self.assertEqual( next(Filing.iterFilings('1', ['10-K'])).filingDate, '2023-02-20' )
+        self.assertRaisesRegex( Exception, 'Could not find', Filing.getFilingByTypeAndDate, '1', '10-K', '2023-06-30' )
+
+        self._writePage()
+        self.assertEqual( Filing.getFilingByTypeAndDate('1', '10-K', '2021-12-31').accessionNumber, '0000000001-22-000001' )
+        self.assertEqual( Filing.getFilingByAccession('1', '0000000001-21-000001').filingDate, '2021-02-22' )
+        self.assertEqual( [f.accessionNumber for f in Filing.iterFilings('1', ['10-K'], isXBRL=True)], 
+                          ['0000000001-23-000002', '0000000001-22-000001', '0000000001-21-000001'] )
+        self.assertEqual( len(Filing.getListFilings('1', ['10-K'], isXBRL=True)), 1 )
+        history = Filing.getListFilings('1', ['10-K'], isXBRL=True, history=True)
+        self.assertIsInstance( history, joroxbrl.secFiles.FilingList ) # Same as without history
+        self.assertEqual( [f.filingDate for f in history], ['2023-02-20', '2022-02-21', '2021-02-22'] )
+        # The cached submissions are left as they were
+        self.assertEqual( len(Filing.getSubmission('0000000001')['filings']['recent']['accessionNumber']), 2 )
+
+    def testColumnArrays(self):
+        cache = joroxbrl.secFiles._submissionsCache
+        recent = joroxbrl.secFiles.Filing.getSubmission('0000000001')['filings']['recent']
+        size = cache._size
+        # The columns are converted to numpy once, kept (and counted) with the submissions
+        form = cache.getArray(recent, 'form')
+        self.assertIs( cache.getArray(recent, 'form'), form )
+        self.assertEqual( cache._size, size + form.nbytes )
+        self.assertEqual( len(joroxbrl.secFiles.Filing.getListFilings('1', ['10-K'], isXBRL=True)), 1 )
+        self.assertIs( cache._entries['0000000001'][4]['form'], form )
+        # And go away with them
+        cache.clear()
+        self.assertIsNot( cache.getArray(recent, 'form'), form )
+        self.assertEqual( cache._size, 0 )
+
+class TestFilingList(unittest.TestCase):
+
+    def test1(self):
+        columns = _submissions(['0000000001-23-000003', '0000000001-23-000002', '0000000001-23-000001', '0000000001-22-000001'],
+                               ['10-Q', '8-K', '10-K', '10-K'], ['2023-05-01', '2023-03-01', '2023-02-20', '2022-02-21'], [1, 0, 1, 0])
+        filings = joroxbrl.secFiles.FilingList('0000000001', columns)
+        self.assertEqual( len(filings), 4 )
+        self.assertEqual( filings[2].accessionNumber, '0000000001-23-000001' )
+        self.assertEqual( [f.form for f in filings[1:3]], ['8-K', '10-K'] )
+
+        tenK = filings.filter(forms=['10-K'])
+        self.assertEqual( [f.filingDate for f in tenK], ['2023-02-20', '2022-02-21'] )
+        self.assertEqual( [f.accessionNumber for f in tenK.filter(isXBRL=False)], ['0000000001-22-000001'] )
+        self.assertEqual( list(filings.filter(forms=['10-K', '10-Q'], isXBRL=True).column('form')), ['10-Q', '10-K'] )
+        self.assertEqual( len(filings.filter(filingDateFrom='2023-02-20', filingDateTo='2023-03-01')), 2 )
+        self.assertEqual( len(filings.filter(forms=['20-F'])), 0 )
+        self.assertEqual( len(filings.filter(forms=['20-F']).filter(isXBRL=True)), 0 )
+
+        self.assertEqual( filings[-1].accessionNumber, '0000000001-22-000001' )
+
+        filing = filings[0]
+        self.assertIsNone( filing.filingUrls )
+        self.assertFalse( hasattr(filing, '__dict__') )
+
+    def testChain(self):
+        recent = _submissions(['0000000001-23-000002', '0000000001-23-000001'], ['10-K', '8-K'], ['2023-02-20', '2023-01-10'], [1, 0])
+        page = _submissions(['0000000001-22-000002', '0000000001-22-000001', '0000000001-21-000001'], ['8-K', '10-K', '10-K'], 
+                            ['2022-06-01', '2022-02-21', '2021-02-22'], [0, 1, 1])
+        filings = joroxbrl.secFiles.FilingList.chain('0000000001', [joroxbrl.secFiles.FilingList('0000000001', recent),
+                                                                    joroxbrl.secFiles.FilingList('0000000001', page)])
+        accessions = recent['accessionNumber'] + page['accessionNumber']
+        self.assertEqual( len(filings), 5 )
+        self.assertEqual( [f.accessionNumber for f in filings], accessions )
+        self.assertEqual( [filings[i].accessionNumber for i in range(-5, 5)], accessions*2 )
+        self.assertRaises( IndexError, filings.__getitem__, 5 )
+        for s in (slice(1, 4), slice(None, None, -1), slice(None, None, 2), slice(3, 1), slice(-2, None)):
+            self.assertEqual( [f.accessionNumber for f in filings[s]], accessions[s] )
+        tenK = filings.filter(forms=['10-K'])
+        self.assertEqual( list(tenK.column('filingDate')), ['2023-02-20', '2022-02-21', '2021-02-22'] )
+        self.assertEqual( [f.accessionNumber for f in tenK[1:]], ['0000000001-22-000001', '0000000001-21-000001'] )
+        self.assertEqual( len(filings.filter(forms=['20-F'])), 0 )
+
+class TestFilingsIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.zipPath = os.path.join(self.dir.name, 'submissions.zip')
+        with zipfile.ZipFile(self.zipPath, 'w') as z:
+            z.writestr('CIK0000000001.json', json.dumps({'cik': '1', 'tickers': ['ABC'], 'filings': {
+                'recent': _submissions(['0000000001-23-000002', '0000000001-23-000001'], ['10-K', '8-K'], ['2023-02-20', '2023-01-10'], [1, 0]),
+                'files': [{'name': 'CIK0000000001-submissions-001.json'}]}}))
+            z.writestr('CIK0000000001-submissions-001.json', json.dumps(
+                _submissions(['0000000001-22-000001'], ['10-K'], ['2022-02-21'], [1])))
+            z.writestr('CIK0000000002.json', json.dumps({'cik': '2', 'tickers': ['XYZ'], 'filings': {
+                'recent': _submissions(['0000000002-23-000001'], ['10-K'], ['2023-03-01'], [0]), 'files': []}}))
+            # Co-registrant of the 8-K of 1
+            z.writestr('CIK0000000003.json', json.dumps({'cik': '3', 'tickers': [], 'filings': {
+                'recent': _submissions(['0000000001-23-000001'], ['8-K'], ['2023-01-10'], [0]), 'files': []}}))
+        joroxbrl.secFiles.filingsIndex = joroxbrl.filingsIndex.FilingsIndex(os.path.join(self.dir.name, 'filings.db'))
+
+    def tearDown(self):
+        joroxbrl.secFiles.filingsIndex.close()
+        joroxbrl.secFiles.filingsIndex = None
+        self.dir.cleanup()
+
+    def test1(self):
+        index = joroxbrl.secFiles.filingsIndex
+        self.assertEqual( index.refresh(self.zipPath), 4 )
+        self.assertEqual( index.refresh(self.zipPath), 0 ) # Nothing has changed
+
+        filings = joroxbrl.secFiles.Filing.queryFilings(forms=['10-K'], isXBRL=True)
+        self.assertEqual( [f.accessionNumber for f in filings], ['0000000001-23-000002', '0000000001-22-000001'] )
+        self.assertEqual( filings[0].cik, '0000000001' )
+        self.assertEqual( filings[0].size, 1000 )
+        filings = joroxbrl.secFiles.Filing.queryFilings(forms=['10-K'], filingDateFrom='2023-01-01', filingDateTo='2023-12-31')
+        self.assertEqual( [f.cik for f in filings], ['0000000002', '0000000001'] )
+
+        # Lookups of Filing use the index, without reading any submissions file
+        self.assertEqual( joroxbrl.secFiles.Filing.getFilingByAccession('1', '0000000001-22-000001').filingDate, '2022-02-21' )
+        self.assertEqual( joroxbrl.secFiles.Filing.getFilingByTypeAndDate('2', '10-K', '2022-12-31').accessionNumber, '0000000002-23-000001' )
+
+        # Filings of co-registrants are under each of them
+        self.assertEqual( [r[0] for r in index.query(forms=['8-K'])], ['0000000001', '0000000003'] )
+        self.assertEqual( len(index.query(cik='0000000001', accessionNumber='0000000001-23-000001')), 1 )
+
+    def testLatestFiling(self):
+        joroxbrl.secFiles.filingsIndex.refresh(self.zipPath)
+        # The submissions have a 10-K filed after the index was built
+        joroxbrl.secFiles.submissionsDir = self.dir.name+'/'
+        joroxbrl.secFiles._submissionsCache.clear()
+        try:
+            with open(os.path.join(self.dir.name, 'CIK0000000002.json'), 'w') as f:
+                json.dump({'cik': '2', 'filings': {'files': [], 'recent': _submissions(
+                    ['0000000002-24-000001', '0000000002-23-000001'], ['10-K', '10-K'], ['2024-03-01', '2023-03-01'], [1, 0])}}, f)
+            self.assertEqual( joroxbrl.secFiles.Filing.getLatestFiling('2', '10-K').accessionNumber, '0000000002-24-000001' )
+        finally:
+            joroxbrl.secFiles.submissionsDir = None
+            joroxbrl.secFiles._submissionsCache.clear()
+
+class TestZipArchive(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.zipPath = os.path.join(self.dir.name, 'submissions.zip')
+        self._writeZip(self.zipPath, 'Apple')
+
+    def tearDown(self):
+        joroxbrl.secFiles.submissionsZip = None
+        joroxbrl.secFiles._submissionsCache.clear()
+        joroxbrl.zipArchive._archives.clear()
+        self.dir.cleanup()
+
+    def _writeZip(self, path, name):
+        with zipfile.ZipFile(path, 'w') as z:
+            z.writestr('CIK0000320193.json', json.dumps({'cik': '320193', 'name': name, 'tickers': ['AAPL']}), zipfile.ZIP_DEFLATED)
+            z.writestr('folder/CIK0000789019.json', b'{"name": "Microsoft"}', zipfile.ZIP_STORED)
+
+    def test1(self):
+        archive = joroxbrl.zipArchive.ZipArchive(self.zipPath)
+        self.assertIn( 'CIK0000789019.json', archive )
+        self.assertEqual( archive.read('CIK0000789019.json'), b'{"name": "Microsoft"}' )
+        self.assertEqual( json.loads(archive.read('CIK0000320193.json'))['name'], 'Apple' )
+        self.assertIsNone( archive.read('CIK0000000001.json') )
+        self.assertTrue( os.path.exists(self.zipPath+'.index') )
+
+        # A new archive uses the stored index
+        archive.close()
+        archive = joroxbrl.zipArchive.ZipArchive(self.zipPath)
+        self.assertEqual( sorted(archive.names()), ['CIK0000320193.json', 'CIK0000789019.json'] )
+        archive.close()
+
+    def testSubmissions(self):
+        joroxbrl.secFiles.submissionsZip = self.zipPath
+        self.assertEqual( joroxbrl.secFiles.getTickersFromCIK('320193'), ['AAPL'] )
+        self.assertEqual( joroxbrl.secFiles.Filing.getSubmission('0000320193')['name'], 'Apple' )
+
+        # A new zip replaces the old one, and what was read from the old one is not used anymore
+        newPath = os.path.join(self.dir.name, 'new.zip')
+        self._writeZip(newPath, 'Apple Inc.')
+        os.replace(newPath, self.zipPath)
+        self.assertEqual( joroxbrl.secFiles.Filing.getSubmission('0000320193')['name'], 'Apple Inc.' )
+
 class TestFact(unittest.TestCase):
     def test1(self):
         fact = joroxbrl.core.Fact('id', '{http://fasb.org/us-gaap/2021-01-31}DeferredTaxAssetsGross', 'value', 'context', 'format', 'unit', 'scale')
@@ -71,6 +1104,15 @@ class TestFact(unittest.TestCase):
         fact = joroxbrl.core.Fact('id', 'DeferredTaxAssetsGross', 'value', 'context', 'format', 'unit', 'scale')
         self.assertIsNone( fact.namespace )
         self.assertEqual( fact.unqualifiedName, 'DeferredTaxAssetsGross' )
+
+    def testNumericValue(self):
+        self.assertEqual( joroxbrl.core.Fact(1, 'Assets', '1,500.5', 'c', None, 'USD', '3').getValueAsNumber(), 1500500 )
+        self.assertEqual( joroxbrl.core.Fact(1, 'Assets', '-25', 'c', None, 'USD', None).getValueAsNumber(), -25 )
+        self.assertEqual( joroxbrl.core.Fact(1, 'Assets', None, 'c', None, 'USD', '0').getValueAsNumber(), 0 )
+        fact = joroxbrl.core.Fact(1, 'Name', 'ABC Corp', 'c', None, None, None)
+        self.assertFalse( fact.isNumeric() )
+        self.assertIs( fact.numericValue, joroxbrl.core.notNumeric )
+        self.assertRaises( Exception, fact.getValueAsNumber )
         
 class TestMetrics(unittest.TestCase):
     def test1(self):
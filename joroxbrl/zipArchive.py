@@ -0,0 +1,129 @@
+# Members of a big zip file (companyfacts.zip, submissions.zip) read in place, without extracting
+#  it. The zip is memory-mapped, and each member is found through an index of the central
+#  directory, so a read is a slice of the map and, if it's compressed, one call to zlib.
+# The index is kept next to the zip (<zip>.index), so it's only built the first time a new zip
+#  is opened. Replacing the zip by a newer one (a rename over the old one) is noticed on the
+#  next read, and the new one is used from then on.
+import os
+import mmap
+import zlib
+import pickle
+import struct
+import zipfile
+import threading
+import logging
+
+log = logging.getLogger('joroxbrl.zipArchive')
+
+_localHeader = struct.Struct('<4s2B4HL2L2H') # Local file header, see the zip spec (APPNOTE.TXT 4.3.7)
+_localHeaderSignature = b'PK\x03\x04'
+_indexVersion = 1
+
+class ZipArchive:
+    """
+    path: the zip file. Members are looked up by their name without folders (CIK0000320193.json),
+    since that's all we need for the SEC bulk files.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._signature = None
+        self._map = None
+        self._members = None # name -> (offset of the local header, compressed size, size, method, crc)
+
+    # Identifies the version of the zip: changes when it's replaced
+    @staticmethod
+    def _stat(path):
+        st = os.stat(path)
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def _open(self):
+        signature = self._stat(self.path)
+        with self._lock:
+            if signature != self._signature:
+                members = self._loadIndex(signature)
+                with open(self.path, 'rb') as f:
+                    fileMap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                # The previous map is not closed: a read in another thread could still be using it.
+                #  It goes away with its last reference
+                self._map, self._members, self._signature = fileMap, members, signature
+            return self._map, self._members, self._signature
+
+    def _loadIndex(self, signature):
+        indexPath = self.path+'.index'
+        try:
+            with open(indexPath, 'rb') as f:
+                version, indexSignature, members = pickle.load(f)
+            if version == _indexVersion and indexSignature == signature[1:]: # The inode changes when it's copied
+                return members
+        except (OSError, ValueError, EOFError, pickle.UnpicklingError):
+            pass
+        members = {}
+        with zipfile.ZipFile(self.path) as z:
+            for info in z.infolist():
+                if not info.is_dir():
+                    members[info.filename.rsplit('/', 1)[-1]] = (info.header_offset, info.compress_size,
+                                                                 info.file_size, info.compress_type, info.CRC)
+        log.info('Indexed '+str(len(members))+' members of '+self.path)
+        try:
+            tmpPath = indexPath+'.tmp'+str(os.getpid())
+            with open(tmpPath, 'wb') as f:
+                pickle.dump((_indexVersion, signature[1:], members), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmpPath, indexPath)
+        except OSError as ex: # Read only folder: it will be indexed every time
+            log.warning('Could not store the index of '+self.path+': '+str(ex))
+        return members
+
+    # Changes when the zip is replaced, so it can be used to know if what was read from it is still valid
+    @property
+    def signature(self):
+        return self._open()[2]
+
+    def __contains__(self, name):
+        return name in self._open()[1]
+
+    def names(self) -> list:
+        return list(self._open()[1])
+
+    # Contents of the member, or None if there's no such member
+    def read(self, name: str) -> bytes:
+        fileMap, members, _ = self._open()
+        member = members.get(name)
+        if member is None:
+            return None
+        offset, compressSize, size, method, crc = member
+        header = _localHeader.unpack_from(fileMap, offset)
+        if header[0] != _localHeaderSignature:
+            raise zipfile.BadZipFile('Bad local header for '+name+' in '+self.path)
+        start = offset + _localHeader.size + header[10] + header[11] # Plus the lengths of the name and extra field
+        data = memoryview(fileMap)[start:start+compressSize]
+        try:
+            if method == zipfile.ZIP_STORED:
+                body = bytes(data)
+            elif method == zipfile.ZIP_DEFLATED:
+                body = zlib.decompress(data, -zlib.MAX_WBITS, size or 1)
+            else:
+                raise zipfile.BadZipFile('Unsupported compression method '+str(method)+' for '+name+' in '+self.path)
+        finally:
+            data.release()
+        if zlib.crc32(body) != crc:
+            raise zipfile.BadZipFile('Bad CRC for '+name+' in '+self.path)
+        return body
+
+    def close(self):
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+            self._map, self._members, self._signature = None, None, None
+
+
+_archives = {}
+_archivesLock = threading.Lock()
+
+# A single ZipArchive per path, shared by everybody in the process
+def getArchive(path: str) -> ZipArchive:
+    with _archivesLock:
+        if path not in _archives:
+            _archives[path] = ZipArchive(path)
+        return _archives[path]